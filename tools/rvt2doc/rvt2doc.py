@@ -15,10 +15,32 @@ locale.setlocale(locale.LC_ALL, '')
 try:
     import urllib.request
     import pandas as pd
+    import numpy as np
     import os
     import re
-    from io import BytesIO
+    import json
+    import pickle
+    import hashlib
+    import tempfile
+    import gc
+    import atexit
+    import zipfile
+    import csv
+    import sqlite3
+    import operator
+    import functools
+    import inspect
+    import threading
+    from collections import OrderedDict
+    from time import time, process_time
+    from io import BytesIO, StringIO
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from functools import partial
+    import multiprocessing
+    from multiprocessing import freeze_support
     import openpyxl  # excell reading framework
+    from openpyxl.cell.cell import ERROR_CODES
+    from pandas.io.parsers import TextParser
     import docx
     from docx import Document  # document generation    row[0].paragraphs[0].runs[0].
     from docx.shared import Pt, Cm, Mm  # document generation
@@ -27,6 +49,10 @@ try:
     from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
     from docx.shared import RGBColor
     from docx.oxml.shared import OxmlElement, qn
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+    from lxml import etree
+    from xml.sax.saxutils import escape
     import sys
     from sys import exit
 except Exception as ex:
@@ -36,6 +62,16 @@ except Exception as ex:
     print("  On pycharm, run the command from the lower panel console [>_] (venv) prompt")
     exit(1)
 
+try:
+    import resource  # peak memory for --profile, not available on Windows
+except ImportError:
+    resource = None
+
+try:
+    import duckdb  # --sql engine, SQLite is used when not installed
+except ImportError:
+    duckdb = None
+
 # GLOBAL VARS
 document = Document() # global document we print on to generate output doc
 debug = False # activate old style debug (print)
@@ -53,7 +89,7 @@ def cols_prepare(tab, cols):
     """
     Create a dictionary to register the columns we are using for later printing
     This is just for copy and paste for updating the dictionary in cols_validate
-    It has no influence on program behaviour
+    Besides, with --projection the columns must have been loaded (see projection_check)
 
     Usage:
     Set local var do_cols_prepare to True during test to generate it
@@ -67,6 +103,8 @@ def cols_prepare(tab, cols):
     :return: None
     """
 
+    if cols is not None: projection_check(tab, cols)
+
     do_cols_prepare = False
     if not do_cols_prepare : return  # not needed until we re-generate the idx_sheets dictionary
 
@@ -115,8 +153,101 @@ required_sheets = {
 }
 
 
+report_sheets = {
+#    Dictionary of sheets and columns used by the report besides required_sheets ones
+#    Used by projection_columns to load only what the report needs (--projection)
+#    Columns used by the report but not listed fail the report, see projection_check
+#    Generated using cols_prepare during tests plus columns used in queries and direct accesses
+#    None means all columns: sheets searched by global_search
+
+    'vInfo': ['CBT', 'Annotation', 'OS according to the configuration file'],
+    'vCPU': ['Datacenter', 'Cluster', 'CPUs', 'Annotation'],
+    'vMemory': ['Cluster', 'Max', 'Annotation'],
+    'vMultiPath': ['Host', 'Cluster'],
+    'vSource': [],
+    'vHost': ['# Memory'],
+    'vTools': [],
+    'vNIC': None,
+    'vNetwork': None,
+    'vDatastore': ['Name', 'Address', 'Accessible', 'Hosts'],
+    'vDisk': ['Cluster', 'Annotation'],
+    'vPartition': None,
+    'vHBA': ['Cluster'],
+    'vCluster': ['Name', 'NumHosts'],
+    'vLicense': ['Name'],
+    'vMetaData': ['RVTools major version', 'xlsx creation datetime'],
+    'vSwitch': None,
+    'vPort': None,
+    'dvSwitch': None,
+    'dvPort': None
+}
+
+
+def projection_columns(tab):
+    """
+    Columns of a sheet (tab) used by the report, as named in the spreadsheet
+
+    :param tab: the sheet (tab) name
+    :return: list of columns, or None for all columns
+    """
+    if tab not in report_sheets.keys():
+        return required_sheets.get(tab, [])
+    if report_sheets[tab] is None:
+        return None
+    return required_sheets.get(tab, []) + report_sheets[tab]
+
+
+# --projection state: sheet columns used by the report but not loaded, see projection_check
+projection_state = {"on": False, "unprojected": set()}
+projection_lock = threading.Lock()  # sections may compute in threads, see compute_report_sections
+
+
+def projection_check(tab, cols=None):
+    """
+    Register and print the columns of a sheet (tab) used by the report but not loaded with --projection
+    (see projection_columns). Columns added by the report itself (ie: vDatastore Display_name) are in the
+    combined sheet and pass. Sections keep going without them, so main fails before rendering the report
+
+    :param tab: the sheet (tab) name
+    :param cols: column (string) or list of columns used, None when all the sheet columns are used (ie: global_search)
+    :return: None
+    """
+    if not projection_state["on"]: return
+    projected = projection_columns(tab)
+    if projected is None: return
+    if cols is None:
+        unprojected = [(tab, None)]
+    else:
+        loaded = [column_name(col) for col in projected]
+        df = sheets_registry.get(tab)
+        unprojected = [(tab, col) for col in (cols if isinstance(cols, list) else [cols])
+                       if column_name(col) not in loaded and (df is None or col not in df.columns)]
+    if len(unprojected) == 0: return
+
+    with projection_lock:
+        unprojected = [pair for pair in unprojected if pair not in projection_state["unprojected"]]
+        projection_state["unprojected"].update(unprojected)
+    for tab, col in unprojected:
+        if col is None:
+            print("ERROR: All the columns of sheet [" + tab + "] are used by the report but not loaded with"
+                  " --projection. Set it to None in report_sheets")
+        else:
+            print("ERROR: Column [" + col + "] of sheet [" + tab + "] is used by the report but not loaded with"
+                  " --projection. Add it to report_sheets")
+
+
 # def check_columns(file, df):
 
+def missing_value(col):
+    """
+    Placeholder cols_validate writes in the empty cells of a required column, ie: "NoCluster"
+
+    :param col: the column name, as named in the spreadsheet or in the DataFrame
+    :return: the placeholder value
+    """
+    return 'No' + col.replace(' ', '_')
+
+
 def cols_validate(tab, file, df):
     """
     Validate the required columns exist on spreadsheet sheet (tab)
@@ -134,8 +265,7 @@ def cols_validate(tab, file, df):
                 print("ERROR: Column [" + col + "] is required in sheet [" + tab + "] in file [" + file + "]")
                 data_ok = False
             else:
-                df[col] = df[col].fillna(
-                    'No' + col.replace(' ', '_'))  # replace empty value by "NoNetwork", "NoCluster", etc
+                df[col] = df[col].fillna(missing_value(col))  # replace empty value by "NoNetwork", "NoCluster", etc
 
     pcol = "none"
     for col in df.columns:
@@ -165,35 +295,235 @@ def tabs_validate(file, sheets):
             data_ok = False
     return data_ok
 
+#######################################################################
+# %% Profiling Functions (--profile)
+#
+
+# Profile records, see lapse and profiled
+profile_state = {"on": False}
+profile_thread = threading.local()  # current section of each thread, see profile_current
+profile_sections = []  # one record per lapse() section
+profile_calls = []  # one record per profiled helper call
+
+
+def peak_rss():
+    """
+    Peak resident memory of the process in MiB, None if unknown (Windows)
+    """
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": return peak / 1048576  # bytes
+    return peak / 1024  # KiB
+
+
+def profile_current():
+    """
+    Profile state of the current section of this thread: start snapshot, helper calls depth, rows and
+    call records. Section threads (see compute_report_section) record their own calls
+
+    :return: the state dictionary
+    """
+    if not hasattr(profile_thread, "state"): profile_restart()
+    return profile_thread.state
+
+
+def profile_restart():
+    """
+    Start a new section in this thread, dropping the current one
+
+    :return: None
+    """
+    profile_thread.state = {"snapshot": profile_snapshot(), "depth": 0, "rows": 0, "calls": []}
+
+
+def profile_snapshot():
+    """
+    :return: (wall time, cpu time, peak rss) now
+    """
+    return time(), process_time(), peak_rss()
+
+
+def profile_record(name, start, rows):
+    """
+    Build a profile record from a profile_snapshot taken at the start
+
+    :param name: section or helper name
+    :param start: profile_snapshot() at the start
+    :param rows: number of rows returned/processed (None if unknown)
+    :return: record dictionary
+    """
+    end = profile_snapshot()
+    rss_delta = None if end[2] is None else round(end[2] - start[2], 3)
+    return {"name": name, "wall": round(end[0] - start[0], 6), "cpu": round(end[1] - start[1], 6),
+            "peak_rss_delta": rss_delta, "peak_rss": None if end[2] is None else round(end[2], 3), "rows": rows}
+
+
+def profile_rows(result):
+    """
+    Number of rows of a helper result: DataFrame, list, document table... None for other results
+    """
+    if isinstance(result, docx.table.Table): return len(result.rows)
+    if isinstance(result, (pd.DataFrame, pd.Series, list, tuple, dict)): return len(result)
+    return None
+
+
+def profiled(func):
+    """
+    Decorator recording wall time, cpu time, peak rss delta and returned rows of each call to
+    a data or document helper when profiling is active (see lapse). Nested calls are recorded too,
+    only the outermost calls rows are added to the section rows.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profile_state["on"]: return func(*args, **kwargs)
+
+        state = profile_current()
+        start = profile_snapshot()
+        state["depth"] += 1
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            state["depth"] -= 1
+        record = profile_record(func.__name__, start, profile_rows(result))
+        if state["depth"] == 0 and record["rows"] is not None: state["rows"] += record["rows"]
+        state["calls"].append(record)
+        return result
+
+    return wrapper
+
+
+def profile_section(msg):
+    """
+    Record the section finished now, from the previous profile_section (or profiling start), see lapse
+
+    :param msg: section name
+    :return: None
+    """
+    record, calls = profile_take(msg)
+    profile_sections.append(record)
+    profile_calls.extend(calls)
+
+
+def profile_take(msg):
+    """
+    Finish the current section of this thread and start a new one
+
+    :param msg: section name
+    :return: the section record and its helper call records
+    """
+    state = profile_current()
+    record = profile_record(msg, state["snapshot"], state["rows"])
+    record["calls"] = len(state["calls"])
+    calls = [{"section": msg, **call} for call in state["calls"]]
+    profile_restart()
+    return record, calls
+
+
+def write_profile(file_base):
+    """
+    Write the profile records as file_base.json and file_base.csv and print a summary
+
+    :param file_base: output file path without extension
+    :return: None
+    """
+    with open(file_base + ".json", "w") as f:
+        json.dump({"version": version, "sections": profile_sections, "calls": profile_calls, "memo": memo_stats}, f,
+                  indent=1)
+
+    fields = ["kind", "section", "name", "wall", "cpu", "peak_rss_delta", "peak_rss", "rows"]
+    with open(file_base + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for record in profile_sections: writer.writerow({"kind": "section", "section": record["name"], **record})
+        for record in profile_calls: writer.writerow({"kind": "call", **record})
+
+    def mib(value):
+        return "-" if value is None else "{:.1f}".format(value)
+
+    print("Profile: " + file_base + ".json " + file_base + ".csv")
+    print("{:<45} {:>9} {:>9} {:>10} {:>9} {:>7}".format("Section", "Wall(s)", "CPU(s)", "Peak(MiB)", "+RSS(MiB)", "Rows"))
+    for r in profile_sections:
+        print("{:<45} {:>9.3f} {:>9.3f} {:>10} {:>9} {:>7}".format(r["name"][:45], r["wall"], r["cpu"], mib(r["peak_rss"]),
+                                                                 mib(r["peak_rss_delta"]), r["rows"]))
+
+    helpers = {}
+    for r in profile_calls:
+        h = helpers.setdefault(r["name"], {"calls": 0, "wall": 0.0, "cpu": 0.0, "rows": 0})
+        h["calls"] += 1
+        h["wall"] += r["wall"]
+        h["cpu"] += r["cpu"]
+        h["rows"] += r["rows"] or 0
+    print("{:<45} {:>9} {:>9} {:>10} {:>9}".format("Helper (nested calls included)", "Wall(s)", "CPU(s)", "Calls", "Rows"))
+    for name, h in sorted(helpers.items(), key=lambda item: -item[1]["wall"]):
+        print("{:<45} {:>9.3f} {:>9.3f} {:>10} {:>9}".format(name, h["wall"], h["cpu"], h["calls"], h["rows"]))
+    print("Memoized results: " + str(memo_stats["hits"]) + " hits, " + str(memo_stats["misses"]) + " misses")
+
+
 #######################################################################
 # %% PANDAS Functions
 #
 
-def try_search(ce, series, x, debug):
+def compile_search_terms(expression_dict):
     """
-    Utility function used in global_search leading with lists search and type errors
-    :param ce: compiled regular expression
-    :param series: the sheet name, this is only used for debug
-    :param x: the element to search on
-    :return:
+    Compile the global_search expressions once: one pattern per term and a combined alternation
+    of all of them, so values matching none of the terms are discarded with a single regex scan
+
+    :param expression_dict: a dictionary of "[expression-title][regular expression]" search terms
+    :return: (combined compiled expression or None,
+              list of (tag, expression, compiled expression, search index query or None))
     """
 
-    result = None
-    try:
-        result = bool(ce.search(x))
-    except TypeError:
-        result = False
+    # including the Ignorecase flag there is no need for upper() when using it
+    compiled = [(tag, expression, re.compile(expression, re.I), search_index_query(expression))
+                for tag, expression in expression_dict.items()]
+    combined = None
+    if len(compiled) > 1:
+        try:
+            combined = re.compile("|".join("(?:" + term[1] + ")" for term in compiled), re.I)
+        except re.error:  # e.g. numbered back references, the terms are matched one by one
+            combined = None
+    return combined, compiled
 
-    if debug :
-        if series == "Annotation": print("            try_search(ce," + series + "," + str(x) + ") returns " + str(result))
 
-    return result
+def search_column(series, combined, compiled, index=None):
+    """
+    Count the rows of a column matching each compiled search term. Every distinct value is
+    searched once with the combined expression and, only if it matches, with each term.
+    Values that are not strings (NaN, numbers, booleans...) never match.
+    Terms the column search index can answer are counted from the index (see build_search_index)
+
+    :param series: the column to search on
+    :param combined: the combined compiled expression (see compile_search_terms), None to match each term
+    :param compiled: list of (tag, expression, compiled expression, search index query)
+    :param index: the column search index (see column_search_index), None to search the values
+    :return: list of matching rows count, one per term
+    """
+
+    counts = [0] * len(compiled)
+    regex_terms = []
+    for i, (tag, expression, ce, query) in enumerate(compiled):
+        if index is not None and query is not None:
+            counts[i] = search_index_count(index, query)
+        else:
+            regex_terms.append(i)
+    if len(regex_terms) == 0: return counts
 
+    value_counts = series.value_counts(dropna=True, sort=False)
+    for value, n in value_counts.items():
+        if n == 0 or not isinstance(value, str): continue
+        if combined is not None and not combined.search(value): continue
+        for i in regex_terms:
+            if compiled[i][2].search(value): counts[i] += n
+    return counts
 
+
+@profiled
 def global_search(sheets_dict, expression_dict, sheet_names_list=None):
     """
     Search each column in sheet_names_list sheets using expression_dict expressions where
-    the key is a tag string representing the expression meaning, and the value is the expression string
+    the key is a tag string representing the expression meaning, and the value is the expression string.
+    Each column is scanned once for all the expressions (see search_column)
 
     WARNINGS:
 
@@ -224,45 +554,161 @@ def global_search(sheets_dict, expression_dict, sheet_names_list=None):
             s_name = name.split('@')[0]
             if s_name not in sheet_names_list: sheet_names_list.append(s_name)
 
-    for tag, expression in expression_dict.items():
-        ce = re.compile(expression, re.I)  # including the Ignorecase flag there is no need for upper() when using it
-        term_search_results = []
-        for sheet_name in sheet_names_list:
-            df = combine_data_sheets(sheets_dict, sheet_name)
-            # print("globalSearch(): " + sheet_name + "  " + expression + "==============================================================")
-            for series_name, series in df.items():
-                count = 0
-                is_string = pd.api.types.is_string_dtype(df[series_name])
-                is_list = pd.api.types.is_list_like(df[series_name])
-                if is_string or is_list and str(df[series_name].dtype) == "object": #check is a searchable column
-                    # print("globalSearch(): " + str(series_name) + " is_string=" + str(is_string) + " is_list=" + str(is_list))
-                    result_df = pd.DataFrame([])
-                    if is_string: result_df = df[df[series_name].str.contains(expression, na=True, case=False)]
-                    if is_list: result_df = df[[try_search(ce, series_name, x, False) for x in df[series_name]]]
-
-                    count = result_df.dropna(how='all').shape[0]
-
-                    if count > 0: # add column results to current sheet results
-                        # print("globalSearch() count=" + str(count) + " found in " + sheet_name +"/"+ series_name)
-                        # print(result_df[series_name])
-                        row = [tag + " (" + expression + ")", count, series_name, sheet_name]
-                        term_search_results.append(row)
-                        # print("         [" +expression+ "] " + str(count) + "[" + series_name + "/" + sheet_name + "]\n")
-                # else: print("    " + str(series_name) + " is NOT String")
-        comb_search_results = comb_search_results + term_search_results
-        if len(term_search_results) == 0:
-            row = [tag + " (" + expression + ")", 0, "", ""]
-            comb_search_results.append(row)
-        term_search_results = []
+    combined, compiled = compile_search_terms(expression_dict)
+    term_search_results = [[] for term in compiled]
+    for sheet_name in sheet_names_list:
+        projection_check(sheet_name)
+        df = combine_data_sheets(sheets_dict, sheet_name)
+        for series_name, series in df.items():
+            if series_name == source_file_column: continue  # not RVTools data
+            is_category = isinstance(series.dtype, pd.CategoricalDtype)
+            is_string = pd.api.types.is_string_dtype(series)
+            if is_category or is_string or str(series.dtype) == "object":  # check is a searchable column
+                counts = search_column(series, combined, compiled, column_search_index(sheet_name, series_name))
+                for i, count in enumerate(counts):
+                    if count > 0:  # add column results to the term results
+                        tag, expression = compiled[i][0:2]
+                        term_search_results[i].append([tag + " (" + expression + ")", count, series_name, sheet_name])
+
+    for (tag, expression, ce, query), results in zip(compiled, term_search_results):
+        if len(results) == 0: results = [[tag + " (" + expression + ")", 0, "", ""]]
+        comb_search_results = comb_search_results + results
 
     return comb_search_results
 
 
+# Combined sheets registry, see build_sheets_registry
+sheets_registry = {}  # sheet name: combined DataFrame
+sheets_registry_versions = {}  # sheet name: data version, increased by invalidate_sheets
+source_file_column = "source_file"  # column added to combined sheets with the original file name
+
+
+def combine_sheet(sheets_dict, sheet):
+    """
+    Combine the sheets matching the sheet name from all spreadsheets (files) in one DataFrame
+    using a single concat. A source_file column keeps the file each row comes from.
+
+    :param sheets_dict: Dictionary containing all the Excel sheets.
+    :param sheet: Name of the sheet to combine.
+    :return: the combined DataFrame, empty if the sheet doesn't exist
+    """
+    dfs = []
+    for sheet_name, df in sheets_dict.items():
+        # Check if the sheet name in dictionary ("sheetname@filename.xlsx") contains the searched name
+        if sheet_name.startswith(sheet + "@") and not df.empty:
+            df = df.dropna(axis=1, how='all')  # dropna to avoid "future warning"
+            dfs.append(df.assign(**{source_file_column: sheet_name[len(sheet) + 1:]}))
+
+    if len(dfs) == 0:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
+def categorize_columns(df, threshold=0.5):
+    """
+    Convert low cardinality string columns to pandas category dtype, so repeated values
+    (Datacenter, Cluster, Host, OS...) are stored once and operations run on integer codes.
+
+    Categories are kept sorted, so sorting and grouping results are the same as for strings.
+    Use add_categories before writing new values into a categorical column.
+
+    :param df: the DataFrame to convert in place
+    :param threshold: max ratio of unique values per row to convert a column (0 to disable)
+    :return: the list of converted columns
+    """
+    converted = []
+    if threshold <= 0 or len(df) == 0:
+        return converted
+
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(series.dtype):
+            continue
+        if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            continue  # mixed types
+        if series.nunique(dropna=True) <= threshold * len(series):
+            df[col] = series.astype('category')
+            converted.append(col)
+
+    return converted
+
+
+def add_categories(df, column, values):
+    """
+    Allow new values to be written in a categorical column. Nothing is done for other columns.
+
+    :param df: the DataFrame to update in place
+    :param column: the column name
+    :param values: list of values to be allowed
+    :return: None
+    """
+    if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+        categories = df[column].cat.categories
+        new = [v for v in pd.unique(pd.Series(values).dropna()) if v not in categories]
+        if len(new) > 0:
+            df[column] = df[column].cat.set_categories(sorted(list(categories) + new))
+
+
+def build_sheets_registry(sheets_dict, category_threshold=0.5, debug=False):
+    """
+    Build the registry of combined sheets, one DataFrame per sheet name aggregating all the spreadsheets.
+    Low cardinality string columns are converted to category (see categorize_columns).
+
+    Combined DataFrames are the working data from now on: clean_and_fix_data and anonymize_names
+    update them in place, so they are never rebuilt behind the scenes. Any function changing them must
+    call invalidate_sheets to let results derived from those sheets be recalculated.
+
+    :param sheets_dict: Dictionary containing all the Excel sheets.
+    :param category_threshold: max ratio of unique values per row to convert a column to category
+    :return: None
+    """
+    names = []
+    for sheet_name in sheets_dict.keys():
+        name = sheet_name.split('@')[0]
+        if name not in names: names.append(name)
+
+    sheets_registry.clear()
+    for name in names:
+        if debug: print("build_sheets_registry() combining " + name)
+        sheets_registry[name] = combine_sheet(sheets_dict, name)
+        converted = categorize_columns(sheets_registry[name], category_threshold)
+        if debug: print("build_sheets_registry() " + name + " category columns: " + str(converted))
+    invalidate_sheets(names)
+
+
+def invalidate_sheets(sheets):
+    """
+    Register that the data of some combined sheets changed
+
+    :param sheets: the list of changed sheet names
+    :return: None
+    """
+    for sheet in sheets:
+        sheets_registry_versions[sheet] = sheets_registry_versions.get(sheet, 0) + 1
+    memo_forget(sheets)
+
+
+def sheets_registry_memory():
+    """
+    Memory used by each combined sheet in the registry
+
+    :return: dictionary of sheet name: bytes
+    """
+    memory = {}
+    for sheet, df in sheets_registry.items():
+        memory[sheet] = int(df.memory_usage(index=True, deep=True).sum())
+    return memory
+
+
+@profiled
 def combine_data_sheets(sheets_dict, sheet, debug=False):
     """
-    Populates a DataFrame which combines data from the sheets matching the sheet name.
+    Returns the DataFrame which combines data from the sheets matching the sheet name.
     Aggregates multiple spreadsheets (multiple files) in one DataFrame.
 
+    The DataFrame comes from the registry (see build_sheets_registry). Sheets not registered yet
+    are combined and registered on first access.
+
     Args:
       sheets_dict: Dictionary containing all the Excel sheets.
       sheet: Name of the sheet to search for.
@@ -271,35 +717,501 @@ def combine_data_sheets(sheets_dict, sheet, debug=False):
       A dataframe composed by the combination of all concatenated sheets
     """
 
-    # create a local cache if it doesn't exist
-    if not hasattr(combine_data_sheets, "cache"):
-        combine_data_sheets.cache = {}  # cache dictionary doesn't exist yet, so initialize it
+    if sheet not in sheets_registry.keys():
+        if debug: print("combineDataSheets() adding new " + sheet + " dataframe to registry")
+        sheets_registry[sheet] = combine_sheet(sheets_dict, sheet)
+        invalidate_sheets([sheet])
 
-    # return cached pandas data frame from cache if it already exists
-    if sheet in combine_data_sheets.cache.keys():
-        if debug: print("combineDataSheets() retrieving " + sheet + " dataframe from cache")
-        combined_df = combine_data_sheets.cache[sheet]
-        return combined_df
+    return sheets_registry[sheet]
 
-    combined_df = pd.DataFrame()  # avoid 'in use before assignment' warning
 
-    # Iterate through all the sheets in the dictionary
-    for sheet_name, df in sheets_dict.items():
-        # Check if the sheet name in dictionary ("sheetname@filename.xlsx") contains the searched name
-        if sheet_name.startswith(sheet + "@") and not df.empty:
-            if debug: print("    combineDataSheets() " + sheet + " in " + sheet_name)
-            # Concatenate the content of this sheet into the combined DataFrame
-            combined_df = pd.concat([combined_df, df.dropna(axis=1, how='all')])  # dropna to avoid "future warning"
+# Memoized helper results, see memoized
+memo_cache = OrderedDict()  # (helper, sheet, sheet version, arguments): result, least recently used first
+memo_size = 256  # max results kept, 0 to disable
+memo_stats = {"hits": 0, "misses": 0}
+memo_thread = threading.local()  # hits and misses of the report section computed by each thread, see memo_counts
+memo_lock = threading.Lock()  # sections may compute in threads, see compute_report_sections
+memo_shallow_copies = int(pd.__version__.split(".")[0]) >= 3  # copy on write: changing a copy never changes the original
 
-    if debug: print("combineDataSheets() adding new " + sheet + " dataframe to cache")
 
-    combine_data_sheets.cache[sheet] = combined_df
+def enable_copy_on_write():
+    """
+    Opt in pandas copy on write before pandas 3 (always on since), so memoized results are returned as
+    shallow copies, see read_only. The report code is copy on write safe. Called by main, importing
+    rvt2doc doesn't change the pandas options
 
-    # reindex after all
-    combined_df.reset_index(inplace=True, drop=True)
-    return combined_df
+    :return: None
+    """
+    global memo_shallow_copies
+    if memo_shallow_copies: return
+    try:
+        pd.set_option("mode.copy_on_write", True)
+        memo_shallow_copies = True
+    except (KeyError, pd.errors.OptionError):
+        pass  # pandas < 1.5, deep copies
+
+
+def memo_counts():
+    """
+    Hits and misses counter of the caller: its report section ones when computing sections (see
+    compute_report_section, forked processes can't add them to memo_stats), else memo_stats
+    """
+    return getattr(memo_thread, "stats", None) or memo_stats
+
+
+def memo_key(value):
+    """
+    Hashable form of a helper argument: lists become tuples
+    """
+    if isinstance(value, (list, tuple)): return tuple(memo_key(v) for v in value)
+    return value
 
 
+def read_only(result):
+    """
+    Copy of a memoized result for the caller, so a section cannot change the result other sections get.
+    DataFrames are shallow copies with copy on write (pandas 3, enabled by main on pandas 2), so the data is only
+    copied if the caller changes it. Lists are copied, tuples and scalars are immutable.
+
+    :param result: the memoized result
+    :return: the result to be returned
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series)): return result.copy(deep=not memo_shallow_copies)
+    if isinstance(result, list): return list(result)
+    return result
+
+
+def memo_forget(sheets):
+    """
+    Drop the memoized results of some sheets, called by invalidate_sheets
+
+    :param sheets: the list of changed sheet names
+    :return: None
+    """
+    with memo_lock:
+        for key in [key for key in memo_cache.keys() if key[1] in sheets]: del memo_cache[key]
+
+
+def memoized(func=None, unless=None):
+    """
+    Decorator memoizing a data helper reading one combined sheet, called as func(df_dict, sheet, ...).
+    Results are kept for the same sheet, sheet version (see invalidate_sheets) and arguments, except df_dict
+    and debug, up to memo_size results. Callers get a copy (see read_only), never the memoized result.
+    Use @memoized(unless=predicate) to run the helper without memoizing when predicate(arguments) is True,
+    ie: calls as cheap as the copy.
+    """
+    if func is None: return partial(memoized, unless=unless)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if memo_size <= 0: return func(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        if unless is not None and unless(arguments.arguments): return func(*args, **kwargs)
+        sheet = list(arguments.arguments.values())[1]
+        key = tuple((name, memo_key(value)) for name, value in arguments.arguments.items()
+                    if name not in ("df_dict", "sheet", "sheet_name", "debug"))
+        try:
+            hash(key)
+        except TypeError:
+            return func(*args, **kwargs)  # not hashable arguments
+
+        with memo_lock:
+            memo = (func.__name__, sheet, sheets_registry_versions.get(sheet), key)
+            if memo in memo_cache:
+                memo_cache.move_to_end(memo)
+                memo_counts()["hits"] += 1
+                return read_only(memo_cache[memo])
+            memo_counts()["misses"] += 1
+
+        result = func(*args, **kwargs)
+        with memo_lock:
+            # version after the call: the sheet is registered on first access
+            memo_cache[(func.__name__, sheet, sheets_registry_versions.get(sheet), key)] = result
+            while len(memo_cache) > memo_size: memo_cache.popitem(last=False)
+        return read_only(result)
+
+    return wrapper
+
+
+# SQL backend, see sql_open
+sql_database = {"engine": None, "generation": 0}  # generation increased by sql_open, threads reconnect
+sql_duckdb = {"pid": None, "connection": None}  # DuckDB database of this process, threads use a cursor on it
+sql_duckdb_lock = threading.Lock()  # opening the DuckDB database only, queries run in parallel
+sql_threads = threading.local()  # connection and loaded tables of each thread, see sql_connection
+sql_index_columns = ["Datacenter", "Cluster", "Host", "VM"]  # indexed in SQLite tables
+
+
+def column_name(column):
+    """
+    DataFrame name of a spreadsheet column: spaces replaced by underscores and # by N
+    (due to https://github.com/pandas-dev/pandas/issues/59285)
+    """
+    return column.replace(' ', '_').replace('#', 'N')
+
+
+def sql_columns(sheet):
+    """
+    Spreadsheet names of the sheet columns known by the report (see required_sheets and report_sheets),
+    by DataFrame name. SQL tables use them, other columns keep their DataFrame name.
+
+    :param sheet: the sheet name
+    :return: dictionary of DataFrame name: spreadsheet name
+    """
+    return {column_name(c): c for c in required_sheets.get(sheet, []) + (report_sheets.get(sheet) or [])}
+
+
+def sql_quote(name):
+    """
+    Quoted SQL identifier
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_open(engine=None):
+    """
+    Enable the SQL backend: the combined sheets are loaded as tables of an in-process database, DuckDB when
+    installed or else SQLite, the first time a query reads them. From then on sum_rows, count_rows (whole
+    sheet counts), groupby (trunk) and calculate_percentage run as SQL. Tables have a rowid column, the row
+    number, in both engines.
+    get_rows and filtered count_rows keep using pandas, their filters are pandas query and regular expressions.
+
+    :param engine: "duckdb" or "sqlite", the best available if None
+    :return: the engine name
+    """
+    if engine is None: engine = "duckdb" if duckdb is not None else "sqlite"
+    sql_database.update({"engine": engine, "generation": sql_database["generation"] + 1})
+    return engine
+
+
+def sql_enabled():
+    return sql_database["engine"] is not None
+
+
+def sql_connection():
+    """
+    Database connection of this thread and the tables loaded on it, so section threads query in parallel.
+    DuckDB threads use a cursor on the process database, SQLite threads their own in-memory database.
+    Forked section processes (see compute_report_sections) open their own, connections can't be shared
+    between processes.
+
+    :return: dictionary with the connection and the loaded tables (sheet: (sheet version, DataFrame columns))
+    """
+    state = getattr(sql_threads, "state", None)
+    if state is None or state["pid"] != os.getpid() or state["generation"] != sql_database["generation"]:
+        if sql_database["engine"] == "duckdb":
+            with sql_duckdb_lock:
+                if sql_duckdb["pid"] != os.getpid():
+                    sql_duckdb.update({"pid": os.getpid(), "connection": duckdb.connect()})
+                connection = sql_duckdb["connection"].cursor()
+        else:
+            connection = sqlite3.connect(":memory:")
+        state = {"pid": os.getpid(), "generation": sql_database["generation"], "connection": connection,
+                 "tables": {}}
+        sql_threads.state = state
+    return state
+
+
+def sql_table(df_dict, sheet, columns=None):
+    """
+    SQL table of a combined sheet on this thread connection, loaded when missing or changed since loaded
+    (see invalidate_sheets). DuckDB reads the DataFrame in place through a view renaming the columns.
+    SQLite gets a copy of the columns read only, indexed on sql_index_columns, and of more columns when
+    a later query reads them.
+
+    :param df_dict: Dictionary containing all the Excel sheets.
+    :param sheet: the sheet name
+    :param columns: DataFrame names of the columns read, all if None
+    :return: the quoted table name
+    """
+    state = sql_connection()
+    connection = state["connection"]
+    df = combine_data_sheets(df_dict, sheet)
+    version = sheets_registry_versions.get(sheet)
+    names = sql_columns(sheet)
+    loaded_version, loaded = state["tables"].get(sheet, (None, []))
+
+    if sql_database["engine"] == "duckdb":
+        if loaded_version != version:
+            # rowid as in SQLite, the row number. The shallow copy shares the sheet data
+            frame = df.copy(deep=False)
+            frame["rvt2doc_rowid"] = np.arange(1, len(df) + 1)
+            connection.register("rvt2doc_" + sheet, frame)
+            connection.execute("CREATE OR REPLACE TEMP VIEW " + sql_quote(sheet) + " AS SELECT " +
+                               ", ".join(sql_quote(c) + " AS " + sql_quote(names.get(c, c)) for c in df.columns) +
+                               ", rvt2doc_rowid AS rowid FROM " + sql_quote("rvt2doc_" + sheet))
+            state["tables"][sheet] = (version, list(df.columns))
+        return sql_quote(sheet)
+
+    read = list(df.columns) if columns is None else [c for c in columns if c in df.columns]
+    if loaded_version == version and all(c in loaded for c in read): return sql_quote(sheet)
+    if loaded_version == version: read = loaded + [c for c in read if c not in loaded]
+
+    pd.DataFrame({names.get(c, c): df[c] for c in read}, index=df.index).to_sql(sheet, connection,
+                                                                                  if_exists="replace", index=False)
+    for column in sql_index_columns:
+        if column in [names.get(c, c) for c in read]:
+            connection.execute("CREATE INDEX " + sql_quote("ix_" + sheet + "_" + column) + " ON " +
+                               sql_quote(sheet) + " (" + sql_quote(column) + ")")
+    state["tables"][sheet] = (version, read)
+    return sql_quote(sheet)
+
+
+def sql_query(sql, params=()):
+    """
+    Run a query on the SQL backend, with this thread connection
+
+    :param sql: the query, tables already loaded by sql_table
+    :param params: query parameters (? placeholders)
+    :return: the result DataFrame
+    """
+    connection = sql_connection()["connection"]
+    if sql_database["engine"] == "duckdb": return connection.execute(sql, list(params)).df()
+    return pd.read_sql_query(sql, connection, params=params)
+
+
+def sql_values(values, column):
+    """
+    SQL result values as in the combined sheet column (SQLite has no booleans nor categories): same dtype, and
+    the original values of object columns (ie: True, not 1), inferred as pandas does for a grouping result
+
+    :param values: the SQL result column, without empty values
+    :param column: the combined sheet column
+    :return: the converted values (Series or Index)
+    """
+    if column.dtype != object: return values.astype(column.dtype)
+    originals = {value: value for value in column.dropna().unique()}
+    return pd.Index([originals.get(value, value) for value in values])
+
+
+def sql_value_counts(df_dict, sheet, columns):
+    """
+    SQL value counts of calculate_percentage, in the pandas value_counts order: most frequent first, then
+    in order of first row. Category order for a categorical column, and for a list of categorical columns,
+    in order of first row of each column value (pandas groups them as the product of the column values)
+
+    :param df_dict: Dictionary containing all the Excel sheets.
+    :param sheet: the sheet name
+    :param columns: a column, its empty values are not counted, or a list of columns, empty values counted as "-"
+    :return: Series of rows count by value (by tuple of values for a list of columns)
+    """
+    keys = columns if isinstance(columns, list) else [columns]
+    names = sql_columns(sheet)
+    quoted = [sql_quote(names.get(c, c)) for c in keys]
+    where = "" if isinstance(columns, list) else " WHERE " + quoted[0] + " IS NOT NULL"
+    firsts = ["first_" + str(i) for i in range(len(keys))]
+    counts = sql_query("SELECT " + ", ".join(quoted) + ", COUNT(*), MIN(rowid), " +
+                       ", ".join("MIN(MIN(rowid)) OVER (PARTITION BY " + q + ")" for q in quoted) + " FROM " +
+                       sql_table(df_dict, sheet, keys) + where + " GROUP BY " + ", ".join(quoted))
+    counts.columns = keys + ["count", "first"] + firsts
+
+    # values as in the combined sheet (SQLite has no booleans nor categories)
+    combined_df = combine_data_sheets(df_dict, sheet)
+    for c in keys:
+        if counts[c].isna().any():
+            counts[c] = counts[c].astype(object).fillna('-')
+        else:
+            counts[c] = sql_values(counts[c], combined_df[c])
+    if isinstance(columns, list) and int(pd.__version__.split(".")[0]) < 3:
+        # pandas < 3 counts the sorted groups, then sorts them by count (unstable): same calls, same order
+        counts = pd.Series(counts["count"].to_numpy(), index=pd.MultiIndex.from_frame(counts[keys])).sort_index()
+        return counts.sort_values(ascending=False)
+
+    order = ["first"]
+    if not isinstance(columns, list) and isinstance(counts[columns].dtype, pd.CategoricalDtype):
+        counts["first"] = counts[columns].cat.codes
+    elif all(isinstance(combined_df[c].dtype, pd.CategoricalDtype) for c in keys):
+        order = firsts
+    counts = counts.sort_values(by=["count"] + order, ascending=[False] + [True] * len(order), kind="stable")
+
+    if isinstance(columns, list): return pd.Series(counts["count"].to_numpy(), index=pd.MultiIndex.from_frame(counts[keys]))
+    return pd.Series(counts["count"].to_numpy(), index=pd.Index(counts[columns]))
+
+
+def sql_sum(df, sheet, column):
+    """
+    SQL sum of a column, 0 when empty as in pandas. Integer and boolean columns sum as BIGINT, DuckDB sums
+    them as HUGEINT which comes back as float
+
+    :param df: the combined sheet
+    :param sheet: the sheet name
+    :param column: the DataFrame column name
+    :return: the SQL expression, column quoted with its spreadsheet name
+    """
+    dtype = df[column].dtype
+    total = "COALESCE(SUM(" + sql_quote(sql_columns(sheet).get(column, column)) + "), 0)"
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype): return "CAST(" + total + " AS BIGINT)"
+    return total
+
+
+def sql_groupby(df_dict, sheet, columns, sum=False):
+    """
+    SQL grouping of the groupby helper: keys sorted, rows with an empty key ignored, the last column counted
+    or summed
+
+    :param df_dict: Dictionary containing all the Excel sheets.
+    :param sheet: the sheet name
+    :param columns: DataFrame names of the key columns and the counted or summed column
+    :param sum: Boolean to sum (True) or count (False) the last column
+    :return: the grouped DataFrame with the columns as named in "columns"
+    """
+    names = sql_columns(sheet)
+    keys = [sql_quote(names.get(c, c)) for c in columns[:-1]]
+    value = sql_quote(names.get(columns[-1], columns[-1]))
+    combined_df = combine_data_sheets(df_dict, sheet)
+    aggregate = sql_sum(combined_df, sheet, columns[-1]) if sum else "COUNT(" + value + ")"
+
+    grouped = sql_query("SELECT " + ", ".join(keys + [aggregate]) + " FROM " + sql_table(df_dict, sheet, columns) +
+                        " WHERE " + " AND ".join(k + " IS NOT NULL" for k in keys) +
+                        " GROUP BY " + ", ".join(keys) + " ORDER BY " + ", ".join(keys))
+    grouped.columns = columns
+
+    for c in columns[:-1]: grouped[c] = sql_values(grouped[c], combined_df[c])
+    return grouped
+
+
+def sql_count_rows(df_dict, sheet):
+    """
+    SQL count of the non-empty rows of a sheet, see count_rows
+
+    :param df_dict: Dictionary containing all the Excel sheets.
+    :param sheet: the sheet name
+    :return: number of rows with any data
+    """
+    combined_df = combine_data_sheets(df_dict, sheet)
+    names = sql_columns(sheet)
+    data_columns = [sql_quote(names.get(c, c)) for c in combined_df.columns if c != source_file_column]
+    if len(data_columns) == 0: return 0
+
+    counted = sql_query("SELECT COUNT(*) FROM " + sql_table(df_dict, sheet) + " WHERE " +
+                        " OR ".join(c + " IS NOT NULL" for c in data_columns))
+    return int(counted.iloc[0, 0])
+
+
+# Inverted token index, see build_search_index
+search_index = {}  # (sheet name, column name): column index
+search_index_sheets = ['vInfo', 'vNetwork', 'vNIC', 'vSwitch', 'vPort', 'dvSwitch', 'dvPort', 'vPartition']
+search_token = re.compile(r"\w+")
+search_index_term = re.compile(r"(\\b)?([A-Za-z0-9_]+)(\\b)?")
+
+
+def build_search_index(sheets_dict, sheet_names_list=None, debug=False):
+    """
+    Build an inverted index (word -> rows) of every text column in the sheets, so
+    global_search and get_rows answer literal and word boundary expressions without scanning the columns.
+    Each distinct value is tokenized once. Index entries are ignored when their sheet is invalidated
+    (see invalidate_sheets), so it must be built after clean_and_fix_data and anonymize_names.
+
+    :param sheets_dict: Dictionary containing all the Excel sheets.
+    :param sheet_names_list: list of sheets (tabs) to index. search_index_sheets if None
+    :param debug: Boolean to print debug information.
+    :return: number of indexed columns
+    """
+    if sheet_names_list is None: sheet_names_list = search_index_sheets
+
+    search_index.clear()
+    for sheet in sheet_names_list:
+        df = combine_data_sheets(sheets_dict, sheet)
+        for column, series in df.items():
+            if column == source_file_column: continue  # not RVTools data
+            if not (isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series)
+                    or str(series.dtype) == "object"):
+                continue
+            codes, uniques = pd.factorize(series)
+            tokens = {}
+            for value_id, value in enumerate(uniques):
+                if not isinstance(value, str): continue
+                for token in set(search_token.findall(value)):
+                    tokens.setdefault(token, []).append(value_id)
+            # rows of each distinct value are positions[starts[value_id]:ends[value_id]]
+            positions = np.argsort(codes, kind='stable')
+            sorted_codes = codes[positions]
+            value_ids = np.arange(len(uniques))
+            search_index[(sheet, column)] = {"version": sheets_registry_versions.get(sheet),
+                                             "tokens": tokens, "positions": positions,
+                                             "starts": np.searchsorted(sorted_codes, value_ids, side='left'),
+                                             "ends": np.searchsorted(sorted_codes, value_ids, side='right')}
+            if debug: print("build_search_index() " + sheet + "/" + column + ": " + str(len(tokens)) + " tokens")
+    return len(search_index)
+
+
+def column_search_index(sheet, column):
+    """
+    Returns the search index of a column, None if the column is not indexed or its sheet changed since indexed
+
+    :param sheet: the sheet (tab) name
+    :param column: the column name
+    :return: column index or None
+    """
+    index = search_index.get((sheet, column))
+    if index is None or index["version"] != sheets_registry_versions.get(sheet): return None
+    return index
+
+
+def search_index_query(expression):
+    """
+    Parse a case insensitive expression the search index can answer: an alternation of words
+    ([A-Za-z0-9_]) optionally delimited by boundaries, e.g. 'jboss', 'BsapB|hana' (see global_search warnings).
+    Characters matching a word ignoring case (ie: "K" for k, "ſ" for s) are word characters too, so every
+    match lies inside a single token, at its start when it starts on a boundary and at its end when it ends on one.
+
+    :param expression: the regular expression
+    :return: list of (word, starts on a boundary, ends on a boundary), None if the index can't answer it
+    """
+    query = []
+    for alternative in expression.split("|"):
+        m = search_index_term.fullmatch(alternative)
+        if m is None: return None
+        query.append((m.group(2), m.group(1) is not None, m.group(3) is not None))
+    return query
+
+
+def search_index_values(index, query):
+    """
+    Distinct values of an indexed column matching a query (see search_index_query)
+
+    :param index: column index (see column_search_index)
+    :param query: list of (word, starts on a boundary, ends on a boundary)
+    :return: set of value ids
+    """
+    value_ids = set()
+    for word, start, end in query:
+        # the regular expression case folding, not str.lower (ie: "İ".lower() is two characters)
+        pattern = re.compile(word + (r"\Z" if end and not start else ""), re.I)
+        matches = pattern.fullmatch if start and end else pattern.match if start else pattern.search
+        for token, ids in index["tokens"].items():
+            if matches(token): value_ids.update(ids)
+    return value_ids
+
+
+def search_index_count(index, query):
+    """
+    Number of rows of an indexed column matching a query (see search_index_query)
+
+    :param index: column index (see column_search_index)
+    :param query: list of (word, starts on a boundary, ends on a boundary)
+    :return: number of rows
+    """
+    return int(sum(index["ends"][v] - index["starts"][v] for v in search_index_values(index, query)))
+
+
+def search_index_rows(index, query):
+    """
+    Row positions of an indexed column matching a query (see search_index_query)
+
+    :param index: column index (see column_search_index)
+    :param query: list of (word, starts on a boundary, ends on a boundary)
+    :return: sorted numpy array of row positions
+    """
+    rows = [index["positions"][index["starts"][v]:index["ends"][v]] for v in search_index_values(index, query)]
+    if len(rows) == 0: return np.array([], dtype=np.intp)
+    return np.sort(np.concatenate(rows))
+
+
+@profiled
+@memoized
 def calculate_percentage(df_dict, sheet, columns, ascending=False, debug=False):
     """
     Calculates the value and percentage represented by each unique combination of
@@ -325,8 +1237,6 @@ def calculate_percentage(df_dict, sheet, columns, ascending=False, debug=False):
     # validate column...
     if isinstance(columns, list):
         for col in columns:
-            # Prevent crashing due to possible NaN
-            combined_df[col] = combined_df[col].fillna('-')
             if not col in combined_df.columns:
                 print("ERROR calculate_percentage(): column [" + col + "] not found in sheet [" + sheet + "]")
                 return data
@@ -340,7 +1250,17 @@ def calculate_percentage(df_dict, sheet, columns, ascending=False, debug=False):
             if (debug): print("column [" + columns + "] found in sheet [" + sheet + "]")
 
     # Calculate value counts and percentages
-    counts = combined_df[columns].value_counts(dropna=True)  # Not sure if we are loosing some info with dropna=True
+    if sql_enabled() and combined_df.size > 0:
+        counts = sql_value_counts(df_dict, sheet, columns)
+    else:
+        if isinstance(columns, list):
+            # Prevent crashing due to possible NaN. On a copy, combined sheets are shared by all the report sections
+            combined_df = combined_df[columns].copy()
+            for col in columns:
+                add_categories(combined_df, col, ['-'])
+                combined_df[col] = combined_df[col].fillna('-')
+        counts = combined_df[columns].value_counts(dropna=True)  # Not sure if we are loosing some info with dropna=True
+        counts = counts[counts > 0]  # categorical columns count unused categories too
     counts = counts.where(pd.notnull(counts), 'Unknown')  # replace nan by none
     total_count = counts.sum()
     percentages = (counts / total_count) * 100
@@ -357,6 +1277,15 @@ def calculate_percentage(df_dict, sheet, columns, ascending=False, debug=False):
     return data
 
 
+def unfiltered_rows(arguments):
+    """
+    get_rows arguments only selecting columns: the combined sheet itself, nothing worth memoizing
+    """
+    return arguments["key_columns"] is None and arguments["query_expr"] is None and arguments["contains_expr"] is None
+
+
+@profiled
+@memoized(unless=unfiltered_rows)
 def get_rows(df_dict, sheet, key_columns=None, columns=None, query_expr=None, contains_column=None, contains_expr=None,
              contains_case=True, debug=False):
     """
@@ -376,9 +1305,8 @@ def get_rows(df_dict, sheet, key_columns=None, columns=None, query_expr=None, co
     - contains word1 or word2: 'Bword1B|Bword2B' # using boundaries escape sequence. See warning
     - contains word1 and word2: '(?=.*Bstring1B)(?=.*Bstring2B)' #using both non-consuming match and boundaries. See warning
 
-    Updating data is only possible when "columns" == None because in other case it will return a copy
-    for index, row in df.iterrows():  #iterate
-        df.at[index,'Column name'] = new_value   #update
+    Results are memoized (see memoized) and always a copy: update the combined sheet from combine_data_sheets
+    instead, then call invalidate_sheets.
 
     :param df_dict: Dictionary containing all the Excel sheets.
     :param sheet: Name of the sheet to search for and get rows.
@@ -394,6 +1322,7 @@ def get_rows(df_dict, sheet, key_columns=None, columns=None, query_expr=None, co
     """
     cols_prepare(sheet, key_columns)
     cols_prepare(sheet, columns)
+    cols_prepare(sheet, contains_column)
 
     if debug:
         print("get_rows(df_dict, sheet_name_search:" + str(sheet) + ", key_column:" + str(
@@ -409,6 +1338,14 @@ def get_rows(df_dict, sheet, key_columns=None, columns=None, query_expr=None, co
         print("get_rows():df.SIZE:" + str(combined_df.size))
         # print(combined_df)
 
+    if contains_expr is not None and not contains_case:
+        index = column_search_index(sheet, contains_column)
+        query = search_index_query(contains_expr)
+        if index is not None and query is not None:
+            if debug: print("get_rows(): Contains: Column:" + str(contains_column) + " Index:" + str(query))
+            combined_df = combined_df.iloc[search_index_rows(index, query)]
+            contains_expr = None  # already filtered
+
     if query_expr is not None:
         combined_df = combined_df.query(query_expr)
 
@@ -438,6 +1375,7 @@ def get_rows(df_dict, sheet, key_columns=None, columns=None, query_expr=None, co
     return combined_df
 
 
+@profiled
 def count_rows(df_dict, sheet, key_columns=None, count_unique=True, query_expr=None, contains_column=None,
                contains_expr=None, contains_case=True, debug=False):
     """
@@ -454,34 +1392,159 @@ def count_rows(df_dict, sheet, key_columns=None, count_unique=True, query_expr=N
     :param debug: Boolean to print debug information.
     :return: Number of non-empty rows (unique or all depending on the flag) in the specified sheet(s).
     """
-    if debug:
-        print("count_rows(df_dict," + sheet + "," + key_columns + "," + str(count_unique) + "," + str(query_expr))
+    if debug:
+        print("count_rows(df_dict," + sheet + "," + key_columns + "," + str(count_unique) + "," + str(query_expr))
+
+    if sql_enabled() and key_columns is None and query_expr is None and contains_expr is None:
+        return sql_count_rows(df_dict, sheet)
+
+    combined_unique_df = get_rows(df_dict, sheet, key_columns, None, query_expr, contains_column, contains_expr, contains_case,
+                                  False)
+
+    if debug:
+        print(">>>>>>>count_rows() combined_unique_df")
+        if contains_column is not None:
+            showcols = []
+            showcols.append(key_columns)
+            showcols.append(contains_column)
+            # print(str(combined_unique_df[showcols]))
+        # else:
+        #  print(str(combined_unique_df))
+        print("<<<<<<<count_rows() combined_unique_df")
+
+    # Count non-empty rows in the combined DataFrame
+    data_columns = [col for col in combined_unique_df.columns if col != source_file_column]
+    total_rows = combined_unique_df.dropna(how='all', subset=data_columns).shape[0]
+
+    # Display the result if debug is activated
+    if debug:
+        print(
+            f"count_rows(): Total {'unique' if count_unique else 'all'} non-empty rows in the sheet '{sheet}': {total_rows}")
+
+    return total_rows
+
+
+# Check predicate operators, see evaluate_checks
+check_operators = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+                   "==": operator.eq, "!=": operator.ne, "in": lambda series, values: series.isin(values)}
+
+
+def check_mask(df, predicate):
+    """
+    Compile a check predicate to a vectorized boolean mask of the DataFrame rows.
+    NaN values do not match, except for "!=" (as in DataFrame.query)
+
+    :param df: the combined sheet DataFrame
+    :param predicate: list of (column, operator, value) conditions, all of them must match. See check_operators
+    :return: numpy boolean array
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in predicate:
+        if column not in df.columns: raise pd.errors.UndefinedVariableError(column)  # same error as DataFrame.query
+        mask &= check_operators[op](df[column], value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+def not_empty_rows(df):
+    """
+    Rows with any RVTools data, the rows count_rows counts
+
+    :param df: the combined sheet DataFrame
+    :return: numpy boolean array
+    """
+    data_columns = [col for col in df.columns if col != source_file_column]
+    return df[data_columns].notna().any(axis=1).to_numpy()
+
+
+def bucket_index(values, edges, right=True):
+    """
+    Classify values into the bands between consecutive edges (as np.histogram or pd.cut, using np.searchsorted)
+
+    :param values: numeric numpy array
+    :param edges: ascending band edges, -np.inf / np.inf for open ends
+    :param right: bands include the right edge, edges[i] < value <= edges[i+1]. If False edges[i] <= value < edges[i+1]
+    :return: numpy array with the band of each value, -1 for NaN and values out of the edges
+    """
+    bands = np.searchsorted(edges, values, side='left' if right else 'right') - 1
+    bands[(bands >= len(edges) - 1) | np.isnan(values)] = -1
+    return bands
+
+
+def bucket_counts_df(df, column, edges, right=True, filter=None, cumulative=False, rows=None):
+    """
+    Count the rows per column band, all the bands in one vectorized pass. See bucket_index
+    e.g. bucket_counts_df(df, 'Capacity_MiB', [1048576, 2097152, np.inf]) counts disks in (1TiB, 2TiB]
+    and greater than 2TiB. evaluate_checks counts the non-empty rows of the sheets with it
+
+    :param df: the combined sheet DataFrame
+    :param column: numeric column to classify
+    :param edges: ascending band edges, -np.inf / np.inf for open ends
+    :param right: bands include the right edge (True) or the left one (False)
+    :param filter: predicate the counted rows must match. See check_mask
+    :param cumulative: accumulate each band count with the previous ones (e.g. "less than" bands)
+    :param rows: boolean array of the rows to count, all if None
+    :return: list of len(edges) - 1 counts
+    """
+    if column not in df.columns: raise pd.errors.UndefinedVariableError(column)  # same error as DataFrame.query
 
-    combined_unique_df = get_rows(df_dict, sheet, key_columns, None, query_expr, contains_column, contains_expr, contains_case,
-                                  False)
+    bands = bucket_index(df[column].to_numpy(dtype=float, na_value=np.nan), np.asarray(edges, dtype=float), right)
+    selected = bands >= 0
+    if rows is not None: selected &= rows
+    if filter is not None: selected &= check_mask(df, filter)
 
-    if debug:
-        print(">>>>>>>count_rows() combined_unique_df")
-        if contains_column is not None:
-            showcols = []
-            showcols.append(key_columns)
-            showcols.append(contains_column)
-            # print(str(combined_unique_df[showcols]))
-        # else:
-        #  print(str(combined_unique_df))
-        print("<<<<<<<count_rows() combined_unique_df")
+    counts = np.bincount(bands[selected], minlength=len(edges) - 1)
+    if cumulative: counts = np.cumsum(counts)
+    return [int(count) for count in counts]
 
-    # Count non-empty rows in the combined DataFrame
-    total_rows = combined_unique_df.dropna(how='all').shape[0]
 
-    # Display the result if debug is activated
-    if debug:
-        print(
-            f"count_rows(): Total {'unique' if count_unique else 'all'} non-empty rows in the sheet '{sheet}': {total_rows}")
+@profiled
+def evaluate_checks(sheets_dict, checks):
+    """
+    Count the non-empty rows matching each check predicate, same as count_rows(sheet, query_expr=...).
+    Checks are grouped by sheet so each sheet is combined and its non-empty rows found once.
+    When a check can't be evaluated (e.g. missing column) its result is the error text
 
-    return total_rows
+    Example: ("Hosts with more than 64 cores (vHost)", 'vHost', [("N_Cores", ">", 64)])
+
+    Size bands checks are counted at once with bucket_counts_df, giving a key per band and the
+    bucket_counts_df arguments instead of the predicate:
+    (("Disks up to 2TiB (vDisk)", "Disks with more than 2TiB (vDisk)"), 'vDisk',
+     {"column": "Capacity_MiB", "edges": [0, 2097152, np.inf]})
+
+    :param sheets_dict: the global sheets dictionary
+    :param checks: list of (key, sheet, predicate) or (keys, sheet, bands) checks. See check_mask
+    :return: dictionary of key: count or error text, in checks order
+    """
+    results = {}
+    sheet_checks = {}
+    for key, sheet, predicate in checks:
+        for k in (key if isinstance(predicate, dict) else [key]): results[k] = None
+        sheet_checks.setdefault(sheet, []).append((key, predicate))
+        if isinstance(predicate, dict):
+            cols_prepare(sheet, [predicate["column"]] + [col for col, op, value in predicate.get("filter") or []])
+        else:
+            cols_prepare(sheet, [col for col, op, value in predicate])
+
+    for sheet, predicates in sheet_checks.items():
+        df = combine_data_sheets(sheets_dict, sheet)
+        not_empty = not_empty_rows(df) if df.size > 0 else None
+        for key, predicate in predicates:
+            keys = key if isinstance(predicate, dict) else [key]
+            try:
+                if not_empty is None:
+                    counts = [0] * len(keys)
+                elif isinstance(predicate, dict):
+                    counts = bucket_counts_df(df, rows=not_empty, **predicate)
+                else:
+                    counts = [int(np.count_nonzero(check_mask(df, predicate) & not_empty))]
+            except Exception as ex:
+                counts = [str(ex)] * len(keys)
+            results.update(zip(keys, counts))
 
+    return results
 
+
+@profiled
 def sum_rows(df_dict, sheet_name, key_column, debug=False):
     """
     Calculates the sum of key_colum values in sheet_name sheet
@@ -500,12 +1563,18 @@ def sum_rows(df_dict, sheet_name, key_column, debug=False):
     sheetExists = False
 
     combined_df = combine_data_sheets(df_dict, sheet_name)
-    count = combined_df[key_column].sum()
+    if sql_enabled() and key_column in combined_df.columns:
+        count = sql_query("SELECT " + sql_sum(combined_df, sheet_name, key_column) + " FROM " +
+                          sql_table(df_dict, sheet_name, [key_column])).iloc[0, 0]
+    else:
+        count = combined_df[key_column].sum()
 
     if debug: print("sum_rows('" + sheet_name + "','" + key_column + "') =" + str(count))
     return count
 
 
+@profiled
+@memoized
 def groupby(df_dict, sheet='vInfo', columns=None, trunk=True, ascending=None, sum=False, result_name=None, debug=False):
     """
     group by a list of columns in a sheet
@@ -539,11 +1608,15 @@ def groupby(df_dict, sheet='vInfo', columns=None, trunk=True, ascending=None, su
     new_columns = columns.copy()
     new_columns.pop()
 
-    if sum:
-        grouped = combined_df.groupby(new_columns)[lastcol].sum().reset_index()
+    if trunk and sql_enabled() and combined_df.size > 0 and not (sum and combined_df[lastcol].dtype == object):
+        # object columns (mixed types, ie: booleans with empty cells) are summed by pandas, keeping their values
+        grouped = sql_groupby(df_dict, sheet, columns, sum)
+        if result_name is None: result_name = 'Sum' if sum else 'Count'
+    elif sum:
+        grouped = combined_df.groupby(new_columns, observed=True)[lastcol].sum().reset_index()
         if result_name is None: result_name = 'Sum'
     else:
-        grouped = combined_df.groupby(new_columns).count().reset_index()
+        grouped = combined_df.groupby(new_columns, observed=True).count().reset_index()
         if result_name is None: result_name = 'Count'
 
     # if trunk return the requested columns only
@@ -560,6 +1633,7 @@ def groupby(df_dict, sheet='vInfo', columns=None, trunk=True, ascending=None, su
     return grouped
 
 
+@profiled
 def groupby_df(combined_df, columns=None, trunk=True, ascending=None, sum=False, result_name=None, debug=False):
     """
     group by a list of columns in a sheet
@@ -587,10 +1661,10 @@ def groupby_df(combined_df, columns=None, trunk=True, ascending=None, sum=False,
     # print("groupby() combined")
     # print(combined_df)
     if sum:
-        grouped = combined_df.groupby(new_columns)[lastcol].sum().reset_index()
+        grouped = combined_df.groupby(new_columns, observed=True)[lastcol].sum().reset_index()
         if result_name is None: result_name = 'Sum'
     else:
-        grouped = combined_df.groupby(new_columns).count().reset_index()
+        grouped = combined_df.groupby(new_columns, observed=True).count().reset_index()
         if result_name is None: result_name = 'Count'
 
     if trunk: grouped = grouped[columns]
@@ -607,6 +1681,34 @@ def groupby_df(combined_df, columns=None, trunk=True, ascending=None, sum=False,
     return grouped
 
 
+@profiled
+def subtotals_df(df, keys, columns, casefold=True, count_name="Count"):
+    """
+    Grouped table with subtotals: sums the columns and counts the rows for each combination of keys, then rolls
+    the groups up one key at a time to the grand total, as a control break listing over the sorted rows would do.
+    Groups are sorted by key, and show the key values of their last row.
+
+    :param df: DataFrame to group
+    :param keys: List of key columns, outer level first
+    :param columns: List of columns to sum
+    :param casefold: Boolean to group and sort keys ignoring case
+    :param count_name: Name of the rows count column
+    :return: List of DataFrames, one per level from all keys to the grand total (no key columns)
+    """
+    sums = columns + [count_name]
+    by = [(df[k].astype("string").str.lower() if casefold else df[k]).rename("_" + k) for k in keys]
+    grouped = df.groupby(by, observed=True, dropna=False).agg(**{k: (k, "last") for k in keys},
+                                                             **{c: (c, "sum") for c in columns},
+                                                             **{count_name: (keys[0], "size")})
+    levels = [grouped]
+    for depth in range(len(keys) - 1, 0, -1):
+        levels.append(levels[-1].groupby(level=list(range(depth)), observed=True, sort=False, dropna=False).agg(
+            **{k: (k, "last") for k in keys[:depth]}, **{c: (c, "sum") for c in sums}))
+    levels.append(pd.DataFrame({c: [grouped[c].sum()] for c in sums}))
+
+    return [level.reset_index(drop=True) for level in levels]
+
+
 '''
 ############################################################################################
 # %% UTILITY Functions
@@ -614,25 +1716,72 @@ def groupby_df(combined_df, columns=None, trunk=True, ascending=None, sum=False,
 '''
 
 
-def lapse(msg="", on=None):
+def parse_options(argv, options):
+    """
+    Extract "--name [value]" options from the command-line arguments.
+
+    Options with a boolean default are flags and take no value, ie: "--cache".
+    Any other option takes the next argument as value converted to the default value type, ie: "--jobs 4".
+
+    :param argv: the command-line arguments (sys.argv)
+    :param options: dictionary of option names (without "--") and default values. Updated in place
+    :return: the remaining (positional) arguments list
+    """
+    args = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        name = arg[2:]
+        if arg.startswith("--") and name in options.keys():
+            if isinstance(options[name], bool):
+                options[name] = True
+            else:
+                if i + 1 >= len(argv):
+                    print("ERROR: Option [" + arg + "] requires a value")
+                    exit(1)
+                i += 1
+                try:
+                    options[name] = type(options[name])(argv[i])
+                except ValueError:
+                    print("ERROR: Wrong value [" + argv[i] + "] for option [" + arg + "]")
+                    exit(1)
+        elif arg.startswith("--"):
+            print("ERROR: Unknown option [" + arg + "]")
+            exit(1)
+        else:
+            args.append(arg)
+        i += 1
+
+    return args
+
+
+def lapse(msg="", on=None, profile=None):
     """
     Print message and time lapse from previous lapse invocation.
+    When profiling, every lapse message also closes a profile section (see profile_section).
 
     - To activate lapse printing: lapse(on=True)
     - To deactivate lapse printing: lapse(on=False)
+    - To activate profiling: lapse(profile=True)
     - To print a lapse: lapse("Lapse message")
 
     :param msg: lapse message
     :param on: True/False to activate/deactivate lapse
+    :param profile: True/False to activate/deactivate profiling
     :return: None
     """
-    from time import time
 
     if not hasattr(lapse, "on"):
         lapse.on = False
 
     if on is not None: lapse.on = on
 
+    if profile is not None:
+        profile_state["on"] = profile
+        profile_restart()
+    elif profile_state["on"]:
+        profile_section(msg)
+
     if lapse.on is False:
         return
 
@@ -747,8 +1896,8 @@ def urlRead(base, path):
 ####################################################################################
 """
 
-def keep_table_on_one_page(doc):
-    tags = doc.element.xpath('//w:tr[position() < last()]/w:tc/w:p')
+def keep_table_on_one_page(element):
+    tags = element.xpath('.//w:tr[position() < last()]/w:tc/w:p')
     for tag in tags:
         ppr = tag.get_or_add_pPr()
         ppr.keepNext_val = True
@@ -818,7 +1967,9 @@ def set_cell_margins(cell, **kwargs):
 
 def set_table_borders(table, **kwargs):
     """
-    Set table`s borders
+    Set table`s borders, the same border for every cell: the table edges plus the inside
+    edges between cells (insideH as top/bottom, insideV as start/end) unless given.
+    Borders are set once on the table properties (w:tblBorders) instead of on each cell
 
     set_table_borders(
         table,
@@ -828,9 +1979,33 @@ def set_table_borders(table, **kwargs):
         end={"sz": 12, "val": "dashed"},
     )
     """
-    for row in table.rows:
-        for cell in row.cells:
-            set_cell_border(cell, **kwargs)
+    tblPr = table._tbl.tblPr
+
+    # check for tag existence, if none found, then create one
+    tblBorders = tblPr.first_child_found_in("w:tblBorders")
+    if tblBorders is None:
+        tblBorders = OxmlElement('w:tblBorders')
+        tblPr.insert_element_before(tblBorders, 'w:shd', 'w:tblLayout', 'w:tblCellMar', 'w:tblLook',
+                                    'w:tblCaption', 'w:tblDescription', 'w:tblPrChange')
+
+    edges = dict(kwargs)
+    edges.setdefault('insideH', kwargs.get('bottom') or kwargs.get('top'))
+    edges.setdefault('insideV', kwargs.get('end') or kwargs.get('start'))
+
+    # tblBorders children order is important, start/end are named left/right on tables
+    for edge, tag in (('top', 'w:top'), ('start', 'w:left'), ('bottom', 'w:bottom'), ('end', 'w:right'),
+                      ('insideH', 'w:insideH'), ('insideV', 'w:insideV')):
+        edge_data = edges.get(edge)
+        if edge_data:
+            element = tblBorders.find(qn(tag))
+            if element is None:
+                element = OxmlElement(tag)
+                tblBorders.append(element)
+
+            # looks like order of attributes is important
+            for key in ["sz", "val", "color", "space", "shadow"]:
+                if key in edge_data:
+                    element.set(qn('w:{}'.format(key)), str(edge_data[key]))
 
 
 def set_run_title_style(run):
@@ -901,6 +2076,70 @@ def set_cell_border(cell, **kwargs):
                     element.set(qn('w:{}'.format(key)), str(edge_data[key]))
 
 
+table_border = {"sz": 10, "color": "#CCCCCC", "val": "single"}  # default tables border
+table_text_separators = re.compile(r"([\t\r\n])")
+
+
+def table_run_xml(text, bold=False):
+    """
+    XML of a text run, the same python-docx writes for run.text = text (tabs and line breaks included)
+
+    :param text: the run text
+    :param bold: True for a bold run
+    :return: w:r XML string
+    """
+    xml = "<w:r>"
+    if bold: xml += "<w:rPr><w:b/></w:rPr>"
+    for part in table_text_separators.split(text):
+        if part == "\t":
+            xml += "<w:tab/>"
+        elif part == "\r" or part == "\n":
+            xml += "<w:br/>"
+        elif part != "":
+            preserve = ' xml:space="preserve"' if len(part.strip()) < len(part) else ""
+            xml += "<w:t" + preserve + ">" + escape(part) + "</w:t>"
+    return xml + "</w:r>"
+
+
+def add_table_rows(table, rows, bold=False, aligns=None, widths=None):
+    """
+    Append rows to a document table. The XML of all the rows is built and parsed in one pass,
+    instead of adding and formatting the cells one by one through python-docx, which is slow on large tables.
+    Cells look the same as python-docx cells written with cell.text, font.bold and paragraph alignment
+
+    :param table: the document table
+    :param rows: list of rows, each one a list of cell texts (None for an empty cell)
+    :param bold: True to write the text in bold (headers)
+    :param aligns: list of rows, each one a list of WD_ALIGN_PARAGRAPH.xxx (or None) for each cell. None to not align
+    :param widths: list of cell widths in points for each column. None to use the table columns width
+    :return: None
+    """
+    if len(rows) == 0: return
+
+    if widths is None:
+        widths = [None if col.w is None else col.w.twips for col in table._tbl.tblGrid.gridCol_lst]
+    else:
+        widths = [Pt(width).twips for width in widths]
+    tc_prs = ["<w:tc>" if width is None else '<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="' + str(width) + '"/></w:tcPr>'
+              for width in widths]
+
+    xml = []
+    for r, row in enumerate(rows):
+        xml.append("<w:tr>")
+        for c, text in enumerate(row):
+            xml.append(tc_prs[c] + "<w:p>")
+            if aligns is not None and aligns[r][c] is not None:
+                xml.append('<w:pPr><w:jc w:val="' + aligns[r][c].xml_value + '"/></w:pPr>')
+            if text is not None: xml.append(table_run_xml(text, bold))
+            xml.append("</w:p></w:tc>")
+        xml.append("</w:tr>")
+
+    tbl = table._tbl
+    for tr in list(parse_xml("<w:tbl " + nsdecls('w') + ">" + "".join(xml) + "</w:tbl>")):
+        tbl.append(tr)
+
+
+@profiled
 def table_from_df(df, document, grid=False, columnWidths=None, title=None):
     """
     Populates a document table from pandas DataFrame data
@@ -912,46 +2151,31 @@ def table_from_df(df, document, grid=False, columnWidths=None, title=None):
     :param title: the resulting table title (or None)
     :return: the document added table object
     """
-    rows = df.shape[0] + 1
     cols = df.shape[1]
 
-    table = document.add_table(rows, cols)
+    table = document.add_table(0, cols)
     if grid: table.style = 'Table Grid'
+    if columnWidths is not None:
+        for c in range(cols): table.columns[c].width = Pt(columnWidths[c])
 
-    r = 0
-    for row in table.rows:
-        c = 0
-        for cell in row.cells:
+    # Headers
+    add_table_rows(table, [[str(text) for text in df.columns]], bold=True)
 
-            if r == 0:  # Headers
-                text = df.columns[c]
-                cell.text = str(text)
-                cell.paragraphs[0].runs[0].font.bold = True
-                if columnWidths is not None: table.columns[c].width = Pt(columnWidths[c])
-            else:  # Data
-                text = df.iloc[[r - 1]].values[0][c]
-                # print("TYPE of CELL is "+str(type(text)))
-                cell.text = str(text)
-                if isinstance(text, int) or isinstance(text, float): cell.paragraphs[
-                    0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-
-            if columnWidths is not None: cell.width = Pt(columnWidths[c])
-
-            set_cell_border(
-                cell,
-                top={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                bottom={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                start={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                end={"sz": 10, "color": "#CCCCCC", "val": "single"}
-            )
-            c = c + 1
-        r = r + 1
+    # Data, converted once. Rows keep the DataFrame values type (numbers are right aligned)
+    values = df.to_numpy()
+    right = WD_ALIGN_PARAGRAPH.RIGHT
+    add_table_rows(table, [[str(text) for text in row] for row in values],
+                   aligns=[[right if isinstance(text, int) or isinstance(text, float) else None for text in row]
+                           for row in values])
+
+    set_table_borders(table, top=table_border, bottom=table_border, start=table_border, end=table_border)
 
     set_table_title(table, title)
 
     return table
 
 
+@profiled
 def add_percentage_table(document, mylist, data, rowColor=None, style=None, borderColor=None, links=None, title=None):
     """
     Populates a document table from a list of "value, count, percentage" rows
@@ -999,10 +2223,9 @@ def add_percentage_table(document, mylist, data, rowColor=None, style=None, bord
     table.cell(0, 1).width = w1
     table.cell(0, 2).width = w2
 
-    i = 0
+    rows = []
+    texts = []
     for value, count, percentage in mylist:
-        row = table.add_row().cells
-
         # avoid data concatenation without separator
         if isinstance(value, tuple) and len(value) > 1:
             vText = ''
@@ -1010,27 +2233,23 @@ def add_percentage_table(document, mylist, data, rowColor=None, style=None, bord
             vText = vText[0:len(vText) - 3]  # clean last /
         else:
             vText = str(value)
+        texts.append(vText)
 
-        if links is None:
-            row[0].text = vText
-        else:
-            paragraph = row[0].paragraphs[0]
-            run = add_hyperlink(paragraph, vText, links[i])
-            run.font.underline = True
-            run.font.color.rgb = blue_color
+        rows.append([vText if links is None else None, str(count), "{pct:.2f}".format(pct=percentage) + "%"])
 
-        if rowColor is not None:
-            row[0].paragraphs[0].runs[0].font.color.rgb = rowColor[i]
+    right = WD_ALIGN_PARAGRAPH.RIGHT
+    add_table_rows(table, rows, aligns=[[None, right, right]] * len(rows))
 
-        row[1].text = str(count)
-        row[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        row[2].text = "{pct:.2f}".format(pct=percentage) + "%"
-        row[2].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        # row[0].width = w0
-        # row[1].width = w1
-        # row[2].width = w2
+    if links is not None or rowColor is not None:
+        for i, row in enumerate(table.rows[1:]):
+            cell = row.cells[0]
+            if links is not None:
+                run = add_hyperlink(cell.paragraphs[0], texts[i], links[i])
+                run.font.underline = True
+                run.font.color.rgb = blue_color
 
-        i = i + 1
+            if rowColor is not None:
+                cell.paragraphs[0].runs[0].font.color.rgb = rowColor[i]
 
     if borderColor is None: borderColor = "#CCCCCC"
 
@@ -1046,6 +2265,7 @@ def add_percentage_table(document, mylist, data, rowColor=None, style=None, bord
     return table
 
 
+@profiled
 def table_from_list(list, document, grid=False, columns_width=None, columns_wd_align=None, title=None):
     """
       Populates a document table from a list of rows
@@ -1061,47 +2281,29 @@ def table_from_list(list, document, grid=False, columns_width=None, columns_wd_a
           The created table which is writable
     """
 
-    rows = len(list)
     cols = len(list[0])
 
-    # print("table_from_list() rows="+str(rows))
-    # print("table_from_list() cols="+str(cols))
-    # print(list)
-
-    table = document.add_table(rows, cols)
+    table = document.add_table(0, cols)
     if grid: table.style = 'Table Grid'
+    if columns_width is not None:
+        for c in range(cols): table.columns[c].width = Pt(columns_width[c])  # for Libre Office
 
-    r = 0
-    for row in table.rows:
-        c = 0
-        for cell in row.cells:
-            # print("["+str(r)+","+str(c)+"] ", end=None)
-            cell.text = str(list[r][c])
+    # Headers are bold and data aligned only when columns width are provided
+    add_table_rows(table, [[str(list[0][c]) for c in range(cols)]], bold=columns_width is not None)
 
-            if columns_width is not None:
-                if r == 0:
-                    table.columns[c].width = Pt(columns_width[c])  # for Libre Office
-                    cell.paragraphs[0].runs[0].font.bold = True
-                else:
-                    if columns_wd_align != None and columns_wd_align[c] != None:
-                        cell.paragraphs[0].alignment = columns_wd_align[c]
-                cell.width = Pt(columns_width[c])
-
-            set_cell_border(
-                cell,
-                top={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                bottom={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                start={"sz": 10, "color": "#CCCCCC", "val": "single"},
-                end={"sz": 10, "color": "#CCCCCC", "val": "single"}
-            )
-            c = c + 1
-        r = r + 1
+    aligns = None
+    if columns_width is not None and columns_wd_align is not None:
+        aligns = [columns_wd_align] * (len(list) - 1)
+    add_table_rows(table, [[str(row[c]) for c in range(cols)] for row in list[1:]], aligns=aligns)
+
+    set_table_borders(table, top=table_border, bottom=table_border, start=table_border, end=table_border)
 
     set_table_title(table, title)
 
     return table
 
 
+@profiled
 def table_from_dict(dict, document, grid=False, columns_width=None, keyHeader="Key", dataHeader="Data", align_r=None,
                     title=None):
     """
@@ -1151,23 +2353,10 @@ def table_from_dict(dict, document, grid=False, columns_width=None, keyHeader="K
             row.cells[0].width = Pt(columns_width[0])
             row.cells[1].width = Pt(columns_width[1])
 
-        set_cell_border(
-            row.cells[0],
-            top={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            bottom={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            start={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            end={"sz": 10, "color": "#CCCCCC", "val": "single"}
-        )
-
-        set_cell_border(
-            row.cells[1],
-            top={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            bottom={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            start={"sz": 10, "color": "#CCCCCC", "val": "single"},
-            end={"sz": 10, "color": "#CCCCCC", "val": "single"}
-        )
         r = r + 1
 
+    set_table_borders(table, top=table_border, bottom=table_border, start=table_border, end=table_border)
+
     set_table_title(table, title)
 
     return table
@@ -1208,96 +2397,580 @@ def stops_table(list, document, grid=False, stops=None, columns_align_r=None):
 
     """
 
-    print("stopsTable() ERROR: NOT IMPLEMENTED")
-    return None
-
+    print("stopsTable() ERROR: NOT IMPLEMENTED")
+    return None
+
+
+def add_h(txt='', p=None):
+    """
+    Add a header (txt) to global document
+    :param txt: The header text
+    :param p: The paragraph to add the header to. A new one is created if None is passed in
+
+
+    :return: header paragraph
+    """
+    space_before = 6
+    space_after = 6
+
+
+    if p is None: p = document.add_paragraph()
+    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    p.paragraph_format.space_before = Pt(space_before)  # Espacio antes del párrafo
+    p.add_run(txt).bold = True
+    p.paragraph_format.space_after = Pt(space_after)  # Espacio detrás del párrafo
+    return p
+
+
+def add_p():
+    """
+    Add a paragraph to global document
+    :return: paragraph
+    """
+    space_after = 6
+
+    # Agregar un párrafo
+    p = document.add_paragraph()
+    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    p.paragraph_format.space_after = Pt(space_after)  # Espacio detrás del párrafo
+    return p
+
+
+# Global document body streaming, see stream_document
+document_stream = {"file": None}
+
+
+def stream_document(output_file):
+    """
+    Stream the global document body to a temporary part file (next to output_file) instead of keeping
+    the whole document tree in memory. flush_document moves the body rendered so far to the part
+    file and save_document assembles the final package. Styles, headers and relationships (hyperlinks)
+    stay in the global document, only the body content is streamed
+
+    :param output_file: the report file
+    :return: None
+    """
+    folder = os.path.dirname(os.path.abspath(output_file))
+    document_stream["file"] = tempfile.NamedTemporaryFile("wb", dir=folder, prefix=".rvt2doc_", suffix=".part",
+                                                          delete=False)
+    atexit.register(discard_document)
+
+
+def discard_document():
+    """
+    Remove the stream part file when the document is not saved (errors, early exit), it holds customer data.
+    Registered at exit by stream_document, nothing is done once save_document ran
+
+    :return: None
+    """
+    part = document_stream["file"]
+    if part is None: return
+
+    document_stream["file"] = None
+    part.close()
+    if os.path.exists(part.name): os.remove(part.name)
+
+
+def flush_document():
+    """
+    Move the global document body content rendered so far (all but the section properties) to the
+    stream part file, see stream_document. Nothing is done when the document is not streamed
+
+    :return: None
+    """
+    part = document_stream["file"]
+    if part is None: return
+
+    root_ns = document.element.nsmap
+    body = document.element.body
+    sectPr = body.sectPr
+    size = 0
+    for element in body:
+        if element is sectPr: continue
+        keep_table_on_one_page(element)
+        xml = etree.tostring(element, encoding="utf-8")
+
+        # the fragment start tag declares all the namespaces in scope, already declared by the document
+        end = xml.index(b">")
+        start_tag = re.sub(rb' xmlns:(\w+)="([^"]*)"',
+                           lambda m: b"" if root_ns.get(m.group(1).decode()) == m.group(2).decode() else m.group(0),
+                           xml[:end])
+        part.write(start_tag + xml[end:])
+        size += len(xml)
+
+    # clear() frees the flushed elements at once when no python proxy references them, otherwise lxml
+    # moves them to a new document, much slower on large tables. python-docx tables cache their rows
+    # and columns (reference cycles), so their proxies are only released by the garbage collector
+    element = None
+    if size > 262144: gc.collect()
+    body.clear()
+    if sectPr is not None: body.append(sectPr)
+
+
+def save_document(output_file):
+    """
+    Save the global document. When streamed (see stream_document) the package is saved with an
+    empty body and word/document.xml is rewritten with the part file content as body
+
+    :param output_file: the report file
+    :return: None
+    """
+    part = document_stream["file"]
+    if part is None:
+        keep_table_on_one_page(document.element)
+        document.save(output_file)
+        return
+
+    try:
+        flush_document()
+        part.close()
+
+        package = BytesIO()
+        document.save(package)
+        with zipfile.ZipFile(package) as source, zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as target:
+            for item in source.infolist():
+                if item.filename != "word/document.xml":
+                    target.writestr(item, source.read(item))
+                    continue
+
+                xml = source.read(item)
+                body = xml.index(b"<w:body>") + len(b"<w:body>")
+                with target.open(item, "w") as document_xml, open(part.name, "rb") as fragments:
+                    document_xml.write(xml[:body])
+                    while True:
+                        chunk = fragments.read(1048576)
+                        if not chunk: break
+                        document_xml.write(chunk)
+                    document_xml.write(xml[body:])
+    finally:
+        document_stream["file"] = None
+        os.remove(part.name)
+
+
+'''
+########################################################################################################
+# INITIALIZE FUNCTIONS
+########################################################################################################
+'''
+
+
+cache_max_size = 4 * 1024 ** 3  # bytes kept in cache_folder, least recently used entries are evicted, see cache_evict
+
+
+def cache_folder():
+    """
+    Return the per-user cache folder of the loaded spreadsheets: %LOCALAPPDATA%\\rvt2doc on Windows,
+    $XDG_CACHE_HOME/rvt2doc (~/.cache/rvt2doc) elsewhere.
+    The cache is never kept next to the spreadsheets, as pickles are only loaded from a folder owned by the user.
+
+    :return: the cache folder path
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "rvt2doc")
+
+
+def cache_paths(file_path):
+    """
+    Return the cache index (.json) and data (.pkl) paths for a spreadsheet.
+    Entries are named after the hash of the spreadsheet absolute path, so equal file names in different folders
+    don't collide.
+
+    :param file_path: the spreadsheet file path
+    :return: tuple with index path and data path
+    """
+    name = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    folder = cache_folder()
+    return os.path.join(folder, name + ".json"), os.path.join(folder, name + ".pkl")
+
+
+def cache_signature(projection=False, streaming=False):
+    """
+    Everything, other than the spreadsheet itself, changing the loaded data.
+    A cache entry created with a different signature is not valid.
+
+    :param projection: True if only the report sheets and columns are loaded
+    :param streaming: True if sheets are loaded with read_sheet_streaming
+    :return: signature dictionary (json serializable)
+    """
+    return json.loads(json.dumps({"version": version, "pandas": pd.__version__, "required_sheets": required_sheets,
+                                  "projection": report_sheets if projection else None, "streaming": streaming}))
+
+
+def file_hash(file_path):
+    """
+    Calculate the sha256 hash of a file content
+
+    :param file_path: the file path
+    :return: hex digest string
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_read(file_path, signature):
+    """
+    Read the sheets of a spreadsheet from cache.
+
+    Cache entries are valid when the signature matches and the spreadsheet size and mtime are unchanged.
+    When only the mtime changed (ie: file copied or touched) the content hash decides, and the entry is kept.
+    The data file repeats the index (but the mtime), so an index and a data file written by different runs
+    are never taken as an entry. A valid entry is marked as recently used, see cache_evict.
+
+    :param file_path: the spreadsheet file path
+    :param signature: the current cache_signature
+    :return: the cached list of (sheet_key, df) pairs or None if there is no valid entry
+    """
+    index_path, data_path = cache_paths(file_path)
+    if not os.path.exists(index_path) or not os.path.exists(data_path):
+        return None
+
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+
+        stat = os.stat(file_path)
+        if index["signature"] != signature or index["size"] != stat.st_size:
+            return None
+
+        if index["mtime"] != stat.st_mtime:
+            if index["sha256"] != file_hash(file_path):
+                return None
+            index["mtime"] = stat.st_mtime  # same content, avoid hashing next time
+            with open(index_path, "w") as f:
+                json.dump(index, f)
+
+        with open(data_path, "rb") as f:
+            entry, sheets_list = pickle.load(f)
+        if entry != {key: value for key, value in index.items() if key != "mtime"}:
+            return None
+        os.utime(data_path)
+        return sheets_list
+    except Exception as ex:
+        print("WARNING: Ignoring cache for [" + file_path + "]: " + str(ex))
+        return None
+
+
+def cache_write(file_path, sheets_list, signature):
+    """
+    Write the sheets of a spreadsheet to cache (pickle protocol 5), along with its index, see cache_read
+
+    :param file_path: the spreadsheet file path
+    :param sheets_list: list of (sheet_key, df) pairs to be cached
+    :param signature: the current cache_signature
+    :return: None
+    """
+    index_path, data_path = cache_paths(file_path)
+    try:
+        os.makedirs(os.path.dirname(index_path), mode=0o700, exist_ok=True)
+        stat = os.stat(file_path)
+        index = {"signature": signature, "size": stat.st_size, "mtime": stat.st_mtime,
+                 "sha256": file_hash(file_path)}
+
+        # write to temporary files first so an interrupted run never leaves a broken entry
+        entry = {key: value for key, value in index.items() if key != "mtime"}
+        with open(data_path + ".tmp", "wb") as f:
+            pickle.dump((entry, sheets_list), f, protocol=5)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(index_path + ".tmp", index_path)
+    except Exception as ex:
+        print("WARNING: Can't write cache for [" + file_path + "]: " + str(ex))
+
+
+def cache_entries():
+    """
+    Files of each cache entry: index, data and temporary files share the spreadsheet path hash name
+
+    :return: dictionary of entry name: list of file paths
+    """
+    folder = cache_folder()
+    if not os.path.isdir(folder): return {}
+
+    entries = {}
+    for file in os.listdir(folder):
+        entries.setdefault(file.split(".")[0], []).append(os.path.join(folder, file))
+    return entries
+
+
+def cache_evict(file_paths, max_size=None):
+    """
+    Remove the least recently used cache entries (see cache_read) until the cache takes max_size bytes
+    at most. The entries of file_paths, the spreadsheets just loaded, are never removed
+
+    :param file_paths: the spreadsheets file paths loaded with cache
+    :param max_size: bytes to keep, cache_max_size if None
+    :return: None
+    """
+    if max_size is None: max_size = cache_max_size
+    keep = set(os.path.basename(cache_paths(file_path)[0]).split(".")[0] for file_path in file_paths)
+
+    try:
+        entries = []
+        for name, paths in cache_entries().items():
+            stats = [os.stat(path) for path in paths]
+            entries.append((max(stat.st_mtime for stat in stats), sum(stat.st_size for stat in stats), name, paths))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name, paths in sorted(entries):
+            if size <= max_size: break
+            if name in keep: continue
+            for path in paths: os.remove(path)
+            size -= entry_size
+    except Exception as ex:
+        print("WARNING: Can't evict cache entries: " + str(ex))
+
+
+def cache_clear():
+    """
+    Remove all the cache entries (--cache-clear)
+
+    :return: None
+    """
+    entries = cache_entries()
+    for paths in entries.values():
+        for path in paths: os.remove(path)
+    print("Cache cleared: " + str(len(entries)) + " entries removed from " + cache_folder())
+
+
+def convert_cell_value(value):
+    """
+    Convert a cell value (openpyxl values_only) the same way pandas read_excel does
+
+    :param value: the cell value
+    :return: the converted value
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+    elif isinstance(value, str) and value in ERROR_CODES:
+        return float("nan")
+    return value
+
+
+def header_names(header):
+    """
+    Column names read_excel gives to a header row, usecols are matched against them:
+    duplicated names are renamed "VM.1", "VM.2"... and empty ones "Unnamed: n"
+
+    :param header: list of converted header cell values
+    :return: list of unique column names
+    """
+    if len(header) == 0: return []
+    return list(TextParser([header], header=0).read().columns)
+
+
+def read_sheet_streaming(ws, usecols=None, chunk_rows=20000):
+    """
+    Read a worksheet into a DataFrame streaming its rows
+
+    Rows are iterated as plain values (no cell objects) and parsed every chunk_rows rows with the same
+    TextParser used by read_excel, so the types are the same and the raw sheet data held in memory
+    is bounded by chunk_rows, whatever the sheet size.
+
+    :param ws: a worksheet from a read_only workbook
+    :param usecols: list of columns to load, None for all
+    :param chunk_rows: number of rows parsed at once
+    :return: the sheet DataFrame
+    """
+    ws.reset_dimensions()  # dimensions stored in the file could be wrong
+    rows = ws.iter_rows(values_only=True)
+
+    header = [convert_cell_value(v) for v in next(rows, ())]
+    while header and header[-1] == "":
+        header.pop()
+    header = header_names(header)
+    if usecols is not None:
+        indexes = [i for i, name in enumerate(header) if name in usecols]
+    else:
+        indexes = list(range(len(header)))
+
+    chunks = []
+    names = None  # final column names, set by the first parsed chunk
+    chunk = []
+    blank_rows = []  # kept apart until a non blank row comes, trailing blank rows are dropped
+
+    def parse(data):
+        nonlocal names
+        if names is None:
+            header_row = [header[i] if i < len(header) else "" for i in indexes]
+            df = TextParser([header_row] + data, header=0, skip_blank_lines=False).read()
+            names = list(df.columns)
+        else:
+            df = TextParser(data, header=None, names=names, skip_blank_lines=False).read()
+        return df
+
+    for values in rows:
+        row = [convert_cell_value(v) for v in values]
+        while row and row[-1] == "":
+            row.pop()
+        if len(row) == 0:
+            blank_rows.append(row)
+            continue
+
+        if usecols is None and len(row) > len(indexes):
+            # wider than the header, read_excel names these columns "Unnamed: n"
+            if names is not None:
+                names = names + ["Unnamed: " + str(i) for i in range(len(indexes), len(row))]
+            indexes = list(range(len(row)))
+
+        chunk.extend(blank_rows)
+        blank_rows = []
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            chunks.append(parse([[r[i] if i < len(r) else "" for i in indexes] for r in chunk]))
+            chunk = []
+
+    if len(chunk) > 0 or len(chunks) == 0:
+        if len(indexes) == 0:
+            return pd.DataFrame()
+        chunks.append(parse([[r[i] if i < len(r) else "" for i in indexes] for r in chunk]))
+
+    if len(chunks) == 1:
+        return chunks[0]
+    # types inferred per chunk could differ (ie: a chunk with all values empty), infer them again once joined
+    return pd.concat(chunks, ignore_index=True).infer_objects()
+
+
+def load_spreadsheet(file_path, capture=False, use_cache=False, projection=False, streaming=False):
+    """
+    Load and validate all the sheets of a single RVTools spreadsheet
+
+    This is the unit of work for load_spreadsheets, so it must remain a module level function
+    to be usable from a process pool. When capture is True the messages printed while loading
+    and validating are returned instead of printed, so they can be shown in file order.
+
+    :param file_path: the spreadsheet (.xlsx or .xlsm) file path
+    :param capture: True to return printed messages instead of printing them
+    :param use_cache: True to read from and write to the spreadsheets cache (see cache_read)
+    :param projection: True to load only the sheets and columns used by the report (see projection_columns)
+    :param streaming: True to read the sheets with read_sheet_streaming instead of read_excel
+    :return: tuple with a list of (sheet_key, df) pairs, True if data is ok, and the captured messages
+    """
+    from contextlib import redirect_stdout
+
+    file = os.path.basename(file_path)
+    sheets_list = []
+    data_ok = True
 
-def add_h(txt='', p=None):
-    """
-    Add a header (txt) to global document
-    :param txt: The header text
-    :param p: The paragraph to add the header to. A new one is created if None is passed in
+    signature = cache_signature(projection, streaming)
+    out = StringIO()
+    with redirect_stdout(out if capture else sys.stdout):
+        if use_cache:
+            sheets_list = cache_read(file_path, signature)
+            if sheets_list is not None:
+                print("    loading [" + file_path + "] from cache (" + str(len(sheets_list)) + " sheets)")
+                return sheets_list, data_ok, out.getvalue()
+            sheets_list = []
 
+        print("    loading [" + file_path + "]")
 
-    :return: header paragraph
-    """
-    space_before = 6
-    space_after = 6
+        if streaming:
+            # Leer las sheets fila a fila
+            sheets = {}
+            book = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+            try:
+                for ws in book.worksheets:
+                    if not projection:
+                        sheets[ws.title] = read_sheet_streaming(ws)
+                    elif ws.title in required_sheets.keys() or ws.title in report_sheets.keys():
+                        sheets[ws.title] = read_sheet_streaming(ws, projection_columns(ws.title))
+            finally:
+                book.close()
+        elif projection:
+            # Leer solo las sheets y columnas que usa el informe
+            sheets = {}
+            with pd.ExcelFile(file_path, engine='openpyxl') as xl:
+                for sheet_name in xl.sheet_names:
+                    if sheet_name in required_sheets.keys() or sheet_name in report_sheets.keys():
+                        cols = projection_columns(sheet_name)
+                        sheets[sheet_name] = xl.parse(sheet_name, usecols=None if cols is None else lambda c: c in cols)
+        else:
+            # Leer todas las sheets del archivo Excel
+            sheets = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
 
+        # validate we have all sheets we need
+        if not tabs_validate(file, sheets):
+            data_ok = False
 
-    if p is None: p = document.add_paragraph()
-    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    p.paragraph_format.space_before = Pt(space_before)  # Espacio antes del párrafo
-    p.add_run(txt).bold = True
-    p.paragraph_format.space_after = Pt(space_after)  # Espacio detrás del párrafo
-    return p
+        # Guardar cada sheet en el diccionario
+        for sheet_name, df in sheets.items():
+            sheet_key = f"{sheet_name}@{file}"  # Crear una clave única
+            print("        storing sheet [" + sheet_key + "] in dictionary")
 
+            # validate we have all columns we need before replacing spaces
+            if not cols_validate(sheet_name, file, df):
+                data_ok = False
 
-def add_p():
-    """
-    Add a paragraph to global document
-    :return: paragraph
-    """
-    space_after = 6
+            # Replace all spaces in column names by underscores and # by N
+            df.columns = [column_name(c) for c in df.columns]
 
-    # Agregar un párrafo
-    p = document.add_paragraph()
-    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    p.paragraph_format.space_after = Pt(space_after)  # Espacio detrás del párrafo
-    return p
+            sheets_list.append((sheet_key, df))
 
+        # incomplete data aborts the run, so it is not worth caching
+        if use_cache and data_ok:
+            cache_write(file_path, sheets_list, signature)
 
-'''
-########################################################################################################
-# INITIALIZE FUNCTIONS
-########################################################################################################
-'''
+    return sheets_list, data_ok, out.getvalue()
 
 
-def load_spreadsheets(path):
+def load_spreadsheets(path, jobs=1, use_cache=False, projection=False, streaming=False):
     '''
     #######################################################################
     # %% LOAD RVTools spreadsheets
     #
+    Files are parsed by a pool of "jobs" processes when jobs > 1 (all cpus when jobs < 1).
+    Results are always merged in file name order, so the dictionary is the same either way.
+    Parsed sheets are cached in the per-user cache_folder when use_cache is True, up to cache_max_size.
+    With projection only the sheets and columns used by the report are loaded (see projection_columns).
+    With streaming sheets are read row by row in bounded memory (see read_sheet_streaming).
     '''
 
     sheets_dict = {}  # Spreadsheets dictionary
+    projection_state["on"] = projection  # report accesses are checked, see projection_check
 
     # obtain the list of files
-    files = [f for f in os.listdir(path) if f.endswith('.xlsx') or f.endswith('.xlsm')]
+    files = sorted([f for f in os.listdir(path) if f.endswith('.xlsx') or f.endswith('.xlsm')])
+    file_paths = [os.path.join(path, f) for f in files]
+
+    if jobs < 1: jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(files))
+
+    if jobs > 1:
+        print("    loading " + str(len(files)) + " files using " + str(jobs) + " processes")
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(partial(load_spreadsheet, capture=True, use_cache=use_cache, projection=projection,
+                                   streaming=streaming), file_paths)
+    else:
+        pool = None
+        results = map(partial(load_spreadsheet, use_cache=use_cache, projection=projection, streaming=streaming),
+                      file_paths)
 
     sheetCount = 0
     filesCount = 0
     data_ok = True
-    for file in files:
-        file_path = os.path.join(path, file)
-        print("    loading [" + file_path + "]")
-
-        # Leer todas las sheets del archivo Excel
-        sheets = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
-
-        # validate we have all sheets we need
-        if not tabs_validate(os.path.basename(file), sheets):
-            data_ok = False
-
-        # Guardar cada sheet en el diccionario
-        for sheet_name, df in sheets.items():
-            sheet_key = f"{sheet_name}@{os.path.basename(file)}"  # Crear una clave única
-            print("        storing sheet [" + sheet_key + "] in dictionary")
-
-            # validate we have all columns we need before replacing spaces
-            if not cols_validate(sheet_name, os.path.basename(file), df):
+    try:
+        for sheets_list, file_ok, messages in results:
+            print(messages, end='')
+            if not file_ok:
                 data_ok = False
 
-            # Replace all spaces in column names by underscores
-            df.columns = [c.replace(' ', '_') for c in df.columns]
-            # Replace # by N due to https://github.com/pandas-dev/pandas/issues/59285
-            df.columns = [c.replace('#', 'N') for c in df.columns]
+            for sheet_key, df in sheets_list:
+                sheets_dict[sheet_key] = df
+                sheetCount = sheetCount + 1
 
-            sheets_dict[sheet_key] = df
-            sheetCount = sheetCount + 1
+            filesCount = filesCount + 1
+    finally:
+        if pool is not None: pool.shutdown()
 
-        filesCount = filesCount + 1
+    if use_cache: cache_evict(file_paths)
 
     if filesCount == 0:
         print("No .xlsx or .xlsm files found in [" + path + "]")
@@ -1316,6 +2989,12 @@ def clean_and_fix_data(sheets_dict):
     Clean some column values for later convenience
 
     """
+    cols_prepare('vMultiPath', ['Display_name', 'Disk'])
+    cols_prepare('vHost', ['CPU_Model'])
+    cols_prepare('vHBA', ['Type'])
+    cols_prepare('vInfo', ['OS_according_to_the_VMware_Tools', 'OS_according_to_the_configuration_file'])
+    cols_prepare('vDatastore', ['Type', 'Address', 'Name'])
+
     # remove everything between '(' and ')' in storage Display Name
     vMultiPath_df = combine_data_sheets(sheets_dict, 'vMultiPath')
     vMultiPath_df['Display_name'] = vMultiPath_df['Display_name'].str.replace(r'\(.*\)', '', regex=True)
@@ -1326,164 +3005,121 @@ def clean_and_fix_data(sheets_dict):
 
     # Fix empty values. Empty columns will be deleted by "combine_data_sheets()"
     for sheet in ["vInfo", "vCPU", "vHost", "vMemory", "vDisk", "vPartition", "vNetwork", "vHBA", "vNIC", "vMultiPath"]:
+        cols_prepare(sheet, 'Cluster')
         df = combine_data_sheets(sheets_dict, sheet)
+        add_categories(df, 'Cluster', ['NoCluster'])
         df.replace({'Cluster': {None: 'NoCluster'}}, inplace=True)
         # df.replace({'Cluster': {'': 'NoCluster'}}, inplace=True)
 
     for sheet in ["vInfo", "vCPU", "vMemory", "vDisk", "vPartition", "vNetwork"]:
+        cols_prepare(sheet, 'Annotation')
         df = combine_data_sheets(sheets_dict, sheet)
         df['Annotation'] = df['Annotation'].str.replace('.*@.*.com|.*@.*.es', 'xxx@acme.com', regex=True)
 
     vHBA_df = combine_data_sheets(sheets_dict, 'vHBA')
+    add_categories(vHBA_df, 'Type', ['-'])
     vHBA_df.Type = vHBA_df.Type.fillna('-')
 
+    # Repair empty OS according to the VMware Tools with the configuration file one
+    fill_missing_os(combine_data_sheets(sheets_dict, 'vInfo'))
+
     #######################################################
     # Include Display_name column in vDatastore based on Type and Address
     #   Type == NFS  then Display_name is the server part of vDatastore.Address
     #   Type == VMFS then Display_name is copied from vMultipath.Display_name where vMultipath.Disk == vDatastore.Address
     #   Type == VSAN then Display_name is the vDatastore.Name
     vDatastore_df = combine_data_sheets(sheets_dict, 'vDatastore')
-    values = []
-    dname = "UNKNOWN"
-
-    # Iterate Datastore Address
-    for index, row in vDatastore_df.iterrows():
-        vtype = str(row['Type']).strip()
-        addr = str(row['Address']).strip()
-        acc = str(row['Accessible'])
-        name = str(row['Name'])
-        dname = ''
-
-        if vtype.upper() == "NFS":
-            dname = re.sub(" /.*", "", addr)
-        elif vtype.upper() == "VMFS":
-            vMultiPaths = get_rows(sheets_dict, sheet='vMultiPath',
-                                   key_columns='Disk', columns=['Host', 'Disk', 'Display_name', 'Vendor', 'Model'],
-                                   query_expr="Disk=='" + addr + "'")
-            for multipath in vMultiPaths.itertuples():
-                dname = multipath.Display_name
-        elif vtype.upper() == "VSAN":
-            dname = str(row['Name']).strip()
-        else:
-            dname = "UNKNOWN TYPE  [" + vtype + "]"
-
-        if str(dname).strip().startswith('NoDisplay'):  # SEE cols_validate() about 'NoDisplay' value
-            warns.append(
-                "Datastore " + name + " Type:" + vtype.upper() + " with addr [" + addr + "] Not Accessible or Disconnected")
-            dname = "Not Accessible or Disconnected"  # Probably Accessible == False or "# Hosts" = 0
 
-        values.append(dname)
+    vtype = vDatastore_df['Type'].map(str).str.strip()
+    vtype_upper = vtype.str.upper()
+    addr = vDatastore_df['Address'].map(str).str.strip()
+    is_nfs = vtype_upper == "NFS"
+    is_vmfs = vtype_upper == "VMFS"
+    is_vsan = vtype_upper == "VSAN"
+
+    # Disk > Display_name lookup, first multipath of each disk
+    multipaths = vMultiPath_df.drop_duplicates(subset='Disk')
+    disk_display_name = dict(zip(multipaths['Disk'], multipaths['Display_name']))
+
+    values = pd.Series("UNKNOWN TYPE  [" + vtype + "]", index=vDatastore_df.index, dtype=object)
+    values[is_nfs] = addr[is_nfs].str.replace(" /.*", "", regex=True)
+    values[is_vmfs] = [disk_display_name.get(a, '') for a in addr[is_vmfs]]
+    values[is_vsan] = vDatastore_df['Name'].map(str).str.strip()[is_vsan]
+
+    # SEE cols_validate() about 'NoDisplay' value
+    not_accessible = values.map(str).str.strip().str.startswith('NoDisplay')
+    for index in vDatastore_df.index[not_accessible]:
+        warns.append("Datastore " + str(vDatastore_df.at[index, 'Name']) + " Type:" + vtype_upper[index] +
+                     " with addr [" + addr[index] + "] Not Accessible or Disconnected")
+    values[not_accessible] = "Not Accessible or Disconnected"  # Probably Accessible == False or "# Hosts" = 0
+
+    vDatastore_df.insert(3, "Display_name", values.tolist(), True)
+
+    invalidate_sheets(["vMultiPath", "vHost", "vInfo", "vCPU", "vMemory", "vDisk", "vPartition", "vNetwork", "vHBA",
+                       "vNIC", "vDatastore"])
+    return
 
-    vDatastore_df.insert(3, "Display_name", values, True)
 
-    return
+# Anonymized identifiers: mask format and the (sheet, column) holding them, None for any sheet.
+# vDatastore Hosts is a comma separated list of hosts
+anonymize_identifiers = {
+    "datacenter": ("Datacenter-{:02}", [(None, "Datacenter")]),
+    "cluster": ("Cluster-{:03}", [(None, "Cluster"), ("vCluster", "Name")]),
+    "host": ("Host-{:04}", [(None, "Host"), ("vDatastore", "Hosts")]),
+    "vm": ("VM-{:05}", [(None, "VM")]),
+}
+anonymize_list_columns = [("vDatastore", "Hosts")]
 
 
 def anonymize_names(sheets_dict, anonymize=False):
     """
-    EXPERIMENTAL !!
-    Anonymize data like Datacenter, cluster and VMs names
-    :param sheets_dict:
-    :param anonymize:
-    :return:
-    """
-    #######################################################
-    # Anonymize
-    #######################################################
+    Anonymize Datacenter, Cluster, Host and VM names in all the combined sheets.
+    Each identifier mask comes from pd.factorize over the sorted union of its values in all the
+    sheets, so masks are stable for the same data and consistent across sheets (joins keep working).
+    Masks are applied with map, once per distinct value for categorical columns.
+    Empty values and cols_validate "No<column>" placeholders are kept
 
+    :param sheets_dict: the global sheets dictionary
+    :param anonymize: anonymize (True) or do nothing (False)
+    :return: dictionary of identifier: {original name: mask}, None if not anonymized
+    """
     if not anonymize: return None
 
-    data = {}
-
-    anonym_datacenter = {}
-    anonym_cluster = {}
-    seqDatacenter = 0
-    seqCluster = 0
-
-    #######################################################
-    if debug: print("Anonymize vCluster: Name")
-    #######################################################
-    vCluster_df = combine_data_sheets(sheets_dict, 'vCluster')
-
-    # Iterate vInfo for Datacenter and Cluster
-    for index, row in vCluster_df.iterrows():
-        vCluster = str(row['Name']).strip()
-        if anonym_cluster.get(vCluster) is None:
-            seqCluster = seqCluster + 1
-            anonym_cluster[vCluster] = "Cluster-" + '{n:03}'.format(n=seqCluster)
-            # print("Anonym: "+vDatacenter+"/"+vCluster+" as "+anonym_datacenter[vDatacenter]+"/"+anonym_cluster[vCluster])
-        vCluster_df.at[index, "Name"] = anonym_cluster[vCluster]
-
-    ########################################################
-    if debug: print("Anonymize vInfo: Datacenter Cluster")  #
-    ########################################################
-    vInfo_df = combine_data_sheets(sheets_dict, 'vInfo')
-
-    # Iterate vInfo for Datacenter and Cluster
-    for index, row in vInfo_df.iterrows():
-
-        vDatacenter = str(row['Datacenter']).strip()
-        # if Datacenter not in anonymization dictionary add it
-        if anonym_datacenter.get(vDatacenter) is None:
-            seqDatacenter = seqDatacenter + 1
-            anonym_datacenter[vDatacenter] = "Datacenter-" + '{n:02}'.format(n=seqDatacenter)
-            # print("Anonym: " + vDatacenter + " as " + anonym_datacenter[vDatacenter])
-
-        vCluster = str(row['Cluster']).strip()
-        # if Cluster not in anonymization dictionary add it although this could mean corrupted data
-        if anonym_cluster.get(vCluster) is None:
-            seqCluster = seqCluster + 1
-            warns.append(vCluster + " cluster exists in vInfo but not in vCluster !! ")
-            anonym_cluster[vCluster] = "Cluster-" + '{n:03}'.format(n=seqCluster) + "(!)"
-            # print("Anonym: "+vDatacenter+"/"+vCluster+" as "+anonym_datacenter[vDatacenter]+"/"+anonym_cluster[vCluster])
-
-        # Update df
-        vInfo_df.at[index, "Datacenter"] = anonym_datacenter[vDatacenter]
-        vInfo_df.at[index, "Cluster"] = anonym_cluster[vCluster]
-
-    ########################################################
-    if debug: print("Anonymize vHost: Datacenter Cluster")  #
-    ########################################################
-    vHost_df = combine_data_sheets(sheets_dict, 'vHost')
-
-    # Iterate vInfo for Datacenter and Cluster
-    for index, row in vHost_df.iterrows():
-        vCluster = str(row['Cluster']).strip()
-        vDatacenter = str(row['Datacenter']).strip()
-
-        if anonym_cluster.get(vCluster) is None:
-            warns.append(vCluster + " cluster exists in vHost but not in vCluster !! ")
-        else:
-            vHost_df.at[index, "Cluster"] = anonym_cluster[vCluster]
-
-        if anonym_datacenter.get(vDatacenter) is None:
-            warns.append('"' + vDatacenter + '" datacenter exists in vHost but not in vInfo !! ')
-        else:
-            vHost_df.at[index, "Datacenter"] = anonym_datacenter[vDatacenter]
-
-    ########################################################
-    if debug: print("Anonymize vNIC: Datacenter Cluster")  #
-    ########################################################
-    vNIC_df = combine_data_sheets(sheets_dict, 'vNIC')
+    # (sheet, column, identifier) to anonymize
+    targets = []
+    for sheet in sheets_registry.keys():
+        df = combine_data_sheets(sheets_dict, sheet)
+        for identifier, (mask_format, columns) in anonymize_identifiers.items():
+            for column_sheet, column in columns:
+                if column_sheet in (None, sheet) and column in df.columns: targets.append((sheet, column, identifier))
 
-    # Iterate vInfo for Datacenter and Cluster
-    for index, row in vNIC_df.iterrows():
-        vCluster = str(row['Cluster']).strip()
-        vDatacenter = str(row['Datacenter']).strip()
+    def names(sheet, column):
+        values = combine_data_sheets(sheets_dict, sheet)[column].dropna().unique()
+        if (sheet, column) in anonymize_list_columns:
+            values = [name for value in values for name in str(value).split(",")]
+        return [str(value).strip() for value in values]
 
-        if anonym_cluster.get(vCluster) is None:
-            warns.append(vCluster + " cluster exists in vNIC but not in vCluster !! ")
-        else:
-            vNIC_df.at[index, "Cluster"] = anonym_cluster[vCluster]
+    def mask_list(masks, value):
+        return ", ".join(masks.get(name.strip(), name.strip()) for name in str(value).split(","))
 
-        if anonym_datacenter.get(vDatacenter) is None:
-            warns.append('"' + vDatacenter + '" datacenter exists in vNIC but not in vInfo !! ')
-        else:
-            vNIC_df.at[index, "Datacenter"] = anonym_datacenter[vDatacenter]
+    def mask_value(masks, value):
+        return masks.get(str(value).strip(), value)
 
-    data["datacenter"] = anonym_datacenter
-    data["cluster"] = anonym_cluster
+    data = {}
+    for identifier, (mask_format, columns) in anonymize_identifiers.items():
+        values = pd.unique(pd.Series([name for sheet, column, target in targets if target == identifier
+                                      for name in names(sheet, column)], dtype=object))
+        placeholders = [missing_value(column) for sheet, column, target in targets if target == identifier]
+        values = [value for value in values if value != "" and value not in placeholders]
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=True)
+        data[identifier] = {name: mask_format.format(code + 1) for code, name in enumerate(uniques)}
+
+    for sheet, column, identifier in targets:
+        df = combine_data_sheets(sheets_dict, sheet)
+        mask = mask_list if (sheet, column) in anonymize_list_columns else mask_value
+        df[column] = df[column].map(partial(mask, data[identifier]), na_action='ignore')
 
+    invalidate_sheets(sorted(set(sheet for sheet, column, identifier in targets)))
     return data
 
 
@@ -1492,42 +3128,64 @@ def anonymize_names(sheets_dict, anonymize=False):
 # PRINT FUNCTIONS
 ########################################################################################################
 '''
-def print_versions(sheets_dict):
-    # see: https://www.robware.net/readMore
-
-    add_p().add_run("rvt2doc Version: " + str(version) + " - © Red Hat, 2025")
+def compute_versions(sheets_dict):
+    """
+    Compute phase of print_versions
 
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    model = {"metadata": None, "metadata_error": None, "sources": [], "sources_error": None}
     try:
         metadata = get_rows(sheets_dict, sheet='vMetaData', key_columns='RVTools_major_version',
                             columns=['RVTools_major_version', 'xlsx_creation_datetime'], debug=False)
         if metadata.size > 0:
-            p = add_p()
-            p.add_run("RVTools Version:" + str(metadata['RVTools_major_version'].iloc[0]) + "  Creation Date:" + str(
-                metadata['xlsx_creation_datetime'].iloc[0]))
-        else:
-            add_p().add_run(
-                'There is no information about RVTools Version and XLS creation date: "Empty vMetaData sheet"').font.color.rgb = red_color
+            model["metadata"] = "RVTools Version:" + str(metadata['RVTools_major_version'].iloc[0]) + \
+                                "  Creation Date:" + str(metadata['xlsx_creation_datetime'].iloc[0])
     except Exception as ex:
-        add_p().add_run("Error retrieving RVTools version and XLS creation date from vMetaData: " + str(
-            ex)).font.color.rgb = red_color
+        model["metadata_error"] = str(ex)
 
-    # VERSIONS
-    # #####################################################################################################################
     # ver: https://www.robware.net/readMore
-
-    p = add_p()
     try:
         systemIDs = get_rows(sheets_dict, sheet='vSource', key_columns='Fullname', columns=["Fullname", "API_version"],
                              debug=False)
         supportedAPI = "6.5"
         for row in systemIDs.itertuples():
-            p.add_run("API Connection: " + row.Fullname)
-            if str(row.API_version) < supportedAPI:
-                run = p.add_run(" (unsupported: Version " + supportedAPI + " or later is required)")
-                run.font.color.rgb = red_color
-            run = p.add_run("\n")
+            model["sources"].append(("API Connection: " + row.Fullname, str(row.API_version) < supportedAPI))
     except Exception as ex:
-        p.add_run('ERROR: Can\'t check API Version: ' + str(ex) + '\n').font.color.rgb = red_color
+        model["sources_error"] = str(ex)
+
+    return model
+
+
+def print_versions(sheets_dict, model=None):
+    # see: https://www.robware.net/readMore
+    if model is None: model = compute_versions(sheets_dict)
+
+    add_p().add_run("rvt2doc Version: " + str(version) + " - © Red Hat, 2025")
+
+    if model["metadata_error"] is not None:
+        add_p().add_run("Error retrieving RVTools version and XLS creation date from vMetaData: " +
+                        model["metadata_error"]).font.color.rgb = red_color
+    elif model["metadata"] is not None:
+        p = add_p()
+        p.add_run(model["metadata"])
+    else:
+        add_p().add_run(
+            'There is no information about RVTools Version and XLS creation date: "Empty vMetaData sheet"').font.color.rgb = red_color
+
+    # VERSIONS
+    # #####################################################################################################################
+    supportedAPI = "6.5"
+    p = add_p()
+    for text, unsupported in model["sources"]:
+        p.add_run(text)
+        if unsupported:
+            run = p.add_run(" (unsupported: Version " + supportedAPI + " or later is required)")
+            run.font.color.rgb = red_color
+        run = p.add_run("\n")
+    if model["sources_error"] is not None:
+        p.add_run('ERROR: Can\'t check API Version: ' + model["sources_error"] + '\n').font.color.rgb = red_color
         p.add_run('Column "API Version" does not exist in vSource' + '\n')
         p.add_run('Check the API Version is equal or greater than "6.5"' + '\n')
 
@@ -1555,35 +3213,52 @@ def print_initialize(document):
     return
 
 
-def print_vmw_products(sheets_dict):
-    try:
-        licenses = get_rows(sheets_dict, sheet='vLicense', key_columns='Name', columns=["Name"], debug=False)
-        if licenses.size > 0:
-            table_from_df(licenses, document, True, [500], "VMWare Installed Products")
-            add_p().add_run("")
-        else:
-            add_p().add_run(
-                'There is no VMWare installed products information: "Empty vLicense sheet"').font.color.rgb = red_color
-            print("vLicense WARNING: vLicense tab not found in spreadsheet. Report will be partially generated")
-            print("vLicense WARNING: Please add it to RVTools output configuration for better analysis results")
+def compute_vmw_products(sheets_dict):
+    """
+    Compute phase of print_vmw_products
 
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    model = {"licenses": None, "licenses_error": None}
+    try:
+        model["licenses"] = get_rows(sheets_dict, sheet='vLicense', key_columns='Name', columns=["Name"], debug=False)
     except Exception as ex:
-        add_p().add_run("Error retrieving VMWare installed products information from vLicense: " + str(
-            ex)).font.color.rgb = red_color
+        model["licenses_error"] = str(ex)
+
+    # Calculate ESX percentages
+    model["esx"] = calculate_percentage(sheets_dict, sheet='vHost', columns='ESX_Version')
+
+    # Calculate VMWare Tools status percentages
+    # https://docs.redhat.com/en/documentation/migration_toolkit_for_virtualization/2.5/html/installing_and_using_the_migration_toolkit_for_virtualization/prerequisites#vmware-prerequisites_mtv
+    # TODO: check if this is required to validate some specific or minimum VMWare Tools version
+    model["tools"] = calculate_percentage(sheets_dict, sheet='vTools', columns='Tools')
+    return model
 
-    # Calculate ESX percentages and print the results
-    # #####################################################################################################################
 
-    ESX_data = calculate_percentage(sheets_dict, sheet='vHost', columns='ESX_Version')
-    add_percentage_table(document, ESX_data, "ESX_Version", None, "Table Grid", None, None)
+def print_vmw_products(sheets_dict, model=None):
+    if model is None: model = compute_vmw_products(sheets_dict)
+
+    if model["licenses_error"] is not None:
+        add_p().add_run("Error retrieving VMWare installed products information from vLicense: " +
+                        model["licenses_error"]).font.color.rgb = red_color
+    elif model["licenses"].size > 0:
+        table_from_df(model["licenses"], document, True, [500], "VMWare Installed Products")
+        add_p().add_run("")
+    else:
+        add_p().add_run(
+            'There is no VMWare installed products information: "Empty vLicense sheet"').font.color.rgb = red_color
+        print("vLicense WARNING: vLicense tab not found in spreadsheet. Report will be partially generated")
+        print("vLicense WARNING: Please add it to RVTools output configuration for better analysis results")
+
+    # Print the ESX percentages
+    # #####################################################################################################################
+    add_percentage_table(document, model["esx"], "ESX_Version", None, "Table Grid", None, None)
     add_p().add_run("")
 
     # VMWare Tools Status
     # #####################################################################################################################
-    # Calculate VMWare Tools status percentages and print the results
-    # https://docs.redhat.com/en/documentation/migration_toolkit_for_virtualization/2.5/html/installing_and_using_the_migration_toolkit_for_virtualization/prerequisites#vmware-prerequisites_mtv
-    # TODO: check if this is required to validate some specific or minimum VMWare Tools version
-    tools_data = calculate_percentage(sheets_dict, sheet='vTools', columns='Tools')
+    tools_data = model["tools"]
     rowColor = []
     for value, count, percentage in tools_data:
         if value == "toolsOk":
@@ -1603,35 +3278,39 @@ def print_vmw_products(sheets_dict):
     return
 
 
-def print_compute_sizing(sheets_dict):
+def compute_compute_sizing(sheets_dict):
+    """
+    Compute phase of print_compute_sizing
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    model = {}
+
     # Host Servers COMPUTE sizing
     # #####################################################################################################################
-
     vHostCores = groupby(sheets_dict, sheet='vHost', columns=["N_CPU", "Cores_per_CPU", "N_Cores", "CPU_Model", "Host"],
                          ascending=False, debug=False)
-    table = table_from_df(vHostCores, document, grid=True, columnWidths=[50, 90, 60, 250, 50], title="Hardware")
+    model["hardware"] = vHostCores
 
-    # calculate totals and Set RED color for processors with less than 8 cores.
+    # calculate totals and rows of processors with less than 8 cores (as printed in the table)
     totCPU = 0
     avgCoresCPU = 0
     totCores = 0
     totSPairs = 0
-    for row in table.rows:
-        if row.cells[1].text.isnumeric():
-            totCPU = totCPU + int(row.cells[0].text) * int(row.cells[4].text)
-            totCores = totCores + int(row.cells[2].text) * int(row.cells[4].text)
-            socks = int(row.cells[0].text)
+    model["hardware_red_rows"] = []
+    for i, values in enumerate(vHostCores.to_numpy()):
+        cells = [str(value) for value in values]
+        if cells[1].isnumeric():
+            totCPU = totCPU + int(cells[0]) * int(cells[4])
+            totCores = totCores + int(cells[2]) * int(cells[4])
+            socks = int(cells[0])
             if (socks == 1): socks = 2  # manage hosts with just 1 socket
-            totSPairs = totSPairs + (socks / 2) * int(row.cells[4].text)
-            if int(row.cells[1].text) < 8:
-                for cell in row.cells: cell.paragraphs[0].runs[0].font.color.rgb = red_color
+            totSPairs = totSPairs + (socks / 2) * int(cells[4])
+            if int(cells[1]) < 8: model["hardware_red_rows"].append(i)
 
-    # print(str(totCPU))
-    # print(str(totCores))
-    add_p().add_run(
-        "Total CPUs:" + str(totCPU) + "     Avg.Cores/CPU:" + str(int(totCores / totCPU)) + "     Total Cores:" + str(
-            totCores) + "     Total Socket Pairs:" + str(int(totSPairs)))
-    # addP().add_run("")
+    model["hardware_totals"] = "Total CPUs:" + str(totCPU) + "     Avg.Cores/CPU:" + str(
+        int(totCores / totCPU)) + "     Total Cores:" + str(totCores) + "     Total Socket Pairs:" + str(int(totSPairs))
 
     # Host server models
     # #####################################################################################################################
@@ -1645,90 +3324,102 @@ def print_compute_sizing(sheets_dict):
         else:
             searchStr = value[1]
         searchStr = searchStr.replace(':', '')  # Usually found an undesired ":" after model
-        # print("value[1]=" + value[1] + "     slash=" + str(stop) + "    searchStr=" + searchStr)
         rowLink.append(
             "https://catalog.redhat.com/search?gs&q=" + urllib.parse.quote(searchStr, safe='/', encoding=None,
                                                                            errors=None) + "&target_platforms=Red Hat OpenShift")
-
-    add_percentage_table(document, dataList, "[vHost] Vendor/Model", None, "Table Grid", None, rowLink,
-                         title="Host servers models")
-    add_p().add_run("")
+    model["models"] = dataList
+    model["models_links"] = rowLink
 
     # CPU, VMs, Resource Pools... table
     # get data per datacenter/cluster from vHost (#VMs from vHost can be slightly different to count rows in vInfo)
     # #####################################################################################################################
 
-    total_number_of_Datacenters = '0'
-    total_number_of_Clusters = '0'
-    total_number_of_Hosts = '0'
-    total_number_of_CPUs = '0'
-    total_number_of_Cores = '0'
-    total_number_of_running_vCPU = '0'
-    total_number_of_vCPU = '0'
-    total_number_of_GiB = '0'
-    total_number_of_VMs = '0'
-    total_rpools_per_cluster = '0'
-
-    hosts_per_cluster = groupby(sheets_dict, sheet='vHost', columns=["Datacenter", "Cluster", "N_Cores"], trunk=True,
-                                result_name="Hosts", sum=False, debug=False)
-    # print("===== hosts_per_cluster =====")
-    # print(hosts_per_cluster)
-    cpu_per_cluster = groupby(sheets_dict, sheet='vHost', columns=["Datacenter", "Cluster", "N_CPU"], trunk=True,
-                              result_name="CPUs", sum=True, debug=False)
-    # print("===== cpu_per_cluster =====")
-    # print(cpu_per_cluster)
-    cores_per_cluster = groupby(sheets_dict, sheet='vHost', columns=["Datacenter", "Cluster", "N_Cores"], trunk=True,
-                                result_name="Total\nCores", sum=True, debug=False)
-    # print("===== cores_per_cluster =====")
-    # print(cores_per_cluster)
-    running_vcpu_per_cluster = groupby(sheets_dict, sheet='vHost', columns=["Datacenter", "Cluster", "N_vCPUs"],
-                                       trunk=True, result_name="Run\nvCPUs", sum=True, debug=False)
-    # print("===== running_vcpu_per_cluster =====")
-    # print(running_vcpu_per_cluster)
-    vcpu_per_cluster = groupby(sheets_dict, sheet='vCPU', columns=["Datacenter", "Cluster", "CPUs"], trunk=True,
-                               result_name="Total\nvCPUs", sum=True, debug=False)
-    # print("===== vcpu_per_cluster =====")
-    # print(vcpu_per_cluster)
-    mem_per_cluster = groupby(sheets_dict, sheet='vInfo', columns=["Datacenter", "Cluster", "Memory"], trunk=True,
-                              result_name="Mem\nGiB", sum=True, debug=False)
-
-    # print("===== maxmem_per_cluster =====")
-    # print(maxmem_per_cluster)
-
-    vms_per_cluster = groupby(sheets_dict, sheet='vHost', columns=["Datacenter", "Cluster", "N_VMs_total"], trunk=True,
-                              result_name="VMs", sum=True, debug=False)
-
-    rpools_per_cluster = get_rows(sheets_dict, sheet='vInfo', key_columns=["Datacenter", "Cluster", "Resource_pool"],
-                                  columns=["Datacenter", "Cluster", "Resource_pool"], debug=False)
-    rpools_per_cluster = groupby_df(rpools_per_cluster, columns=["Datacenter", "Cluster", "Resource_pool"], trunk=True,
-                                    result_name="Res.\nPools", debug=False)
-    # tot_rps = rpools_per_cluster["RPs"].sum(numeric_only=True)
-    total_rpools_per_cluster = 0
-    for index, row in rpools_per_cluster.iterrows(): total_rpools_per_cluster = total_rpools_per_cluster + row[
-        "Res.\nPools"]
+    # One named aggregation pass per sheet. Rows with empty Datacenter/Cluster are grouped too (dropna=False)
+    # so the sheet totals come from the same pass, but they are not shown per cluster
+    keys = ["Datacenter", "Cluster"]
+    cols_prepare('vHost', keys + ["N_Cores", "N_CPU", "N_vCPUs", "N_VMs_total"])
+    cols_prepare('vCPU', keys + ["CPUs"])
+    cols_prepare('vInfo', keys + ["Memory", "Resource_pool"])
+    vHost_df = combine_data_sheets(sheets_dict, 'vHost')
+    vHost_df = vHost_df.assign(Not_empty=not_empty_rows(vHost_df))
+    host_agg = vHost_df.groupby(keys, observed=True, dropna=False).agg(**{
+        "Hosts": ("N_Cores", "count"), "CPUs": ("N_CPU", "sum"), "Total\nCores": ("N_Cores", "sum"),
+        "Run\nvCPUs": ("N_vCPUs", "sum"), "VMs": ("N_VMs_total", "sum"), "Rows": ("Not_empty", "sum")}).reset_index()
+    vcpu_agg = combine_data_sheets(sheets_dict, 'vCPU').groupby(keys, observed=True, dropna=False).agg(**{
+        "Total\nvCPUs": ("CPUs", "sum")}).reset_index()
+    vInfo_df = combine_data_sheets(sheets_dict, 'vInfo')
+    vInfo_df = vInfo_df.assign(Not_empty=not_empty_rows(vInfo_df))
+    info_agg = vInfo_df.groupby(keys, observed=True, dropna=False).agg(**{
+        "Mem\nGiB": ("Memory", "sum"), "Res.\nPools": ("Resource_pool", "nunique"),
+        "Rows": ("Not_empty", "sum")}).reset_index()
 
     # Merge
-    merged_df = pd.merge(hosts_per_cluster, cpu_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, cores_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, running_vcpu_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, vcpu_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, mem_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, vms_per_cluster, on=["Datacenter", 'Cluster'])
-    merged_df = pd.merge(merged_df, rpools_per_cluster, on=["Datacenter", 'Cluster'])
-    # print("===== merged_df =====")
-    # print(merged_df)
-
-    oversubs_ratio = []  # oversubscription ratio for each cluster and Memory MiB > Gib
-    for index, row in merged_df.iterrows():
-        # CPU Oversubscription
-        oversubs_ratio.append(round(row["Total\nvCPUs"] / row["Total\nCores"] / 2, 2))
-        # print("oversubs_ratio["+str(index)+"] = "+ str(row["Total\nvCPUs"]) + " / " + str(row["Total\nCores"]) + " / 2 = " + str(oversubs_ratio[index]))
-
-        # MEMORY  MiB >> GiB
-        merged_df.at[index, 'Mem\nGiB'] = int(int(row['Mem\nGiB']) / 1000)
-
+    merged_df = pd.merge(host_agg.dropna(subset=keys), vcpu_agg.dropna(subset=keys), on=keys)
+    merged_df = pd.merge(merged_df, info_agg.dropna(subset=keys), on=keys)
+
+    # CPU Oversubscription
+    oversubs_ratio = [round(vcpus / cores / 2, 2) for vcpus, cores in
+                      zip(merged_df["Total\nvCPUs"].tolist(), merged_df["Total\nCores"].tolist())]
+    # MEMORY  MiB >> GiB
+    memory = merged_df["Mem\nGiB"]
+    merged_df["Mem\nGiB"] = np.trunc(np.trunc(memory) / 1000).astype(memory.dtype)
+
+    merged_df = merged_df[keys + ["Hosts", "CPUs", "Total\nCores", "Run\nvCPUs", "Total\nvCPUs", "Mem\nGiB", "VMs",
+                                  "Res.\nPools"]]
     merged_df.insert(7, "CPU\nOvers", oversubs_ratio, True)
-    table = table_from_df(merged_df, document, grid=True, columnWidths=[80, 120, 34, 32, 34, 36, 36, 35, 35, 30, 32],
+    model["clusters"] = merged_df.reset_index(drop=True)
+
+    # Totals row
+    total_number_of_Datacenters = str(info_agg.loc[info_agg["Rows"] > 0, "Datacenter"].nunique(dropna=False))
+    total_number_of_Clusters = str(count_rows(sheets_dict, 'vCluster'))
+    total_number_of_Hosts = str(host_agg["Rows"].sum())
+    total_number_of_CPUs = str(host_agg["CPUs"].sum())
+    total_number_of_Cores = str(host_agg["Total\nCores"].sum())
+    total_number_of_running_vCPU = str(host_agg["Run\nvCPUs"].sum())
+    total_number_of_vCPU = str(int(vcpu_agg["Total\nvCPUs"].sum()))  # int( because sometimes found floats :-0
+    total_number_of_GiB = str(int(sum_rows(sheets_dict, 'vMemory', 'Max', debug=False) / 1000))
+    total_number_of_VMs = str(host_agg["VMs"].sum())
+    total_rpools_per_cluster = int(info_agg.dropna(subset=keys)["Res.\nPools"].sum())
+
+    model["totals"] = [total_number_of_Datacenters, total_number_of_Clusters, total_number_of_Hosts,
+                       total_number_of_CPUs, total_number_of_Cores, total_number_of_running_vCPU,
+                       total_number_of_vCPU,
+                       str(round(int(total_number_of_vCPU) / int(total_number_of_Cores) / 2, 2)),
+                       total_number_of_GiB, total_number_of_VMs, str(total_rpools_per_cluster)]
+    return model
+
+
+def print_compute_sizing(sheets_dict, model=None):
+    """
+    Print the compute sizing tables
+
+    :param sheets_dict: the global sheets dictionary
+    :param model: the compute_compute_sizing result, computed if None
+    :return: the totals row texts (Datacenters, Clusters, Hosts, CPUs, Cores, Run vCPUs, vCPUs, CPU Overs, GiB, VMs, Res. Pools)
+    """
+    if model is None: model = compute_compute_sizing(sheets_dict)
+
+    # Host Servers COMPUTE sizing
+    # #####################################################################################################################
+    table = table_from_df(model["hardware"], document, grid=True, columnWidths=[50, 90, 60, 250, 50], title="Hardware")
+
+    # Set RED color for processors with less than 8 cores. Rows 0 and 1 are the title and the headers
+    rows = table.rows
+    for i in model["hardware_red_rows"]:
+        for cell in rows[i + 2].cells: cell.paragraphs[0].runs[0].font.color.rgb = red_color
+
+    add_p().add_run(model["hardware_totals"])
+
+    # Host server models
+    # #####################################################################################################################
+    add_percentage_table(document, model["models"], "[vHost] Vendor/Model", None, "Table Grid", None,
+                         model["models_links"], title="Host servers models")
+    add_p().add_run("")
+
+    # CPU, VMs, Resource Pools... table
+    # #####################################################################################################################
+    table = table_from_df(model["clusters"], document, grid=True,
+                          columnWidths=[80, 120, 34, 32, 34, 36, 36, 35, 35, 30, 32],
                           title="[vHost/vCPU] Hosts per Cluster")
 
     # Alternate background color for datacenters and reduce font
@@ -1762,28 +3453,8 @@ def print_compute_sizing(sheets_dict):
             for cell in row.cells: set_cell_background(cell, "E5E5EE")
 
     row = table.add_row()
-    total_number_of_Datacenters = str(count_rows(sheets_dict, 'vInfo', key_columns='Datacenter', debug=False))
-    total_number_of_Clusters = str(count_rows(sheets_dict, 'vCluster'))
-    total_number_of_Hosts = str(count_rows(sheets_dict, 'vHost'))
-    total_number_of_CPUs = str(sum_rows(sheets_dict, 'vHost', 'N_CPU', debug=False))
-    total_number_of_Cores = str(sum_rows(sheets_dict, 'vHost', 'N_Cores', debug=False))
-    total_number_of_running_vCPU = str(sum_rows(sheets_dict, 'vHost', 'N_vCPUs', debug=False))
-    total_number_of_vCPU = str(
-        int(sum_rows(sheets_dict, 'vCPU', 'CPUs', debug=False)))  # int( because sometimes found floats :-0
-    total_number_of_GiB = str(int(sum_rows(sheets_dict, 'vMemory', 'Max', debug=False) / 1000))
-    total_number_of_VMs = str(sum_rows(sheets_dict, 'vHost', 'N_VMs_total', debug=False))
-
-    row.cells[0].text = total_number_of_Datacenters
-    row.cells[1].text = total_number_of_Clusters
-    row.cells[2].text = total_number_of_Hosts
-    row.cells[3].text = total_number_of_CPUs
-    row.cells[4].text = total_number_of_Cores
-    row.cells[5].text = total_number_of_running_vCPU
-    row.cells[6].text = total_number_of_vCPU
-    row.cells[7].text = str(round(int(total_number_of_vCPU) / int(total_number_of_Cores) / 2, 2))
-    row.cells[8].text = total_number_of_GiB
-    row.cells[9].text = total_number_of_VMs
-    row.cells[10].text = str(total_rpools_per_cluster)
+    for cell, text in zip(row.cells, model["totals"]):
+        cell.text = text
 
     for cell in row.cells:
         cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
@@ -1798,218 +3469,156 @@ def print_compute_sizing(sheets_dict):
 
     add_p().add_run("Oversubscription Ratio = (Total vCPUs / Total Cores / 2)")
 
-    return row
-
-
-def print_memory_ranks(sheets_dict):
-    ################################################################################
-    # VM's Memory List
-    ################################################################################
-
-    # Retrieve information
-    memory_config = get_rows(sheets_dict, 'vInfo', key_columns=None, columns=['VM', 'Memory'])
-    memory_config = memory_config.sort_values(by=['Memory'], ascending=False)
-
-    lmemory = []
-    pre_vm = ''
-    pre_memory = ''
-    vm = ''
-    count = 0
+    return model["totals"]
 
-    # Add headers
-    lmemory.append(["VMs", "GiB", "Cnt"])
 
-    # Add content
-    for index, row in memory_config.iterrows():
+def memory_ranks(df, name_column, memory_column):
+    """
+    Group the names by memory size in GiB, from the largest size. The memory MiB values are
+    classified into the GiB ranks with bucket_index and the names of each rank are contiguous
+    once sorted, so there is no per row loop
+
+    :param df: DataFrame with the name and memory (MiB) columns
+    :param name_column: VM or host name column
+    :param memory_column: memory MiB column
+    :return: list of [names, GiB, count] rows
+    """
+    df = df.sort_values(by=[memory_column], ascending=False)
+    mib = df[memory_column].to_numpy(dtype=float, na_value=np.nan)
+    names = [str(name) for name in df[name_column]]
 
-        memory = f'{int(int(row["Memory"]) / 1024):n}'
-        vm = row['VM']
+    gib = np.unique(np.trunc(mib[~np.isnan(mib)] / 1024))  # ranks, ascending
+    bands = bucket_index(mib, np.append(gib * 1024, np.inf), right=False)
+    counts = np.bincount(bands[bands >= 0], minlength=len(gib))
 
-        if pre_memory != memory:
-            if pre_vm != '':  # do not add the first empty element
-                lmemory.append([pre_vm, pre_memory, count])
-            pre_vm = ''
-            count = 1
-        else:
-            count += 1
+    ranks = []
+    start = 0
+    for band in range(len(gib) - 1, -1, -1):
+        end = start + counts[band]
+        ranks.append([", ".join(names[start:end]), f'{int(gib[band]):n}', int(counts[band])])
+        start = end
 
-        pre_memory = memory
-        if pre_vm == '':
-            pre_vm = str(vm)
-        else:
-            pre_vm = pre_vm + ", " + str(vm)
+    if len(ranks) == 0: ranks.append(['', '', 0])
+    return ranks
 
-    lmemory.append([pre_vm, pre_memory, count])
 
-    # Write to DOC
-    if memory_config is not None:
-        add_p().add_run("")
+def compute_memory_ranks(sheets_dict):
+    """
+    Compute phase of print_memory_ranks
 
-        L = WD_ALIGN_PARAGRAPH.LEFT
-        R = WD_ALIGN_PARAGRAPH.RIGHT
-        table = table_from_list(lmemory, document, True, [440, 30, 30], [L, R, R],
-                                "[vInfo] VMs grouped by memory size")
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    model = {}
 
-        # Adjust fonts and lengths
-        # 0:VMs - 1:MemoryCapacity - 2:Annotations - 3:Count
-        count = 0
-        for row in table.rows:
-            count += 1
-            if count > 2:  # jump headers
-                for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
-                max_len = 250
-                if len(str(row.cells[0].text)) > max_len: row.cells[0].text = row.cells[0].text[0:max_len] + "..."
-                row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
+    ################################################################################
+    # VM's Memory List
+    ################################################################################
+    memory_config = get_rows(sheets_dict, 'vInfo', key_columns=None, columns=['VM', 'Memory'])
+    model["vms"] = [["VMs", "GiB", "Cnt"]] + memory_ranks(memory_config, 'VM', 'Memory')
 
     ################################################################################
     # Hosts Memory List
     ################################################################################
-
-    # Retrieve information
     memory_config = get_rows(sheets_dict, 'vHost', key_columns=None, columns=['Host', 'N_Memory'])
-    memory_config = memory_config.sort_values(by=['N_Memory'], ascending=False)
-    # print("====================================")
-    # print(memory_config)
-
-    lmemory = []
-    pre_host = ''
-    pre_memory = ''
-    host = ''
-    count = 0
-
-    # Add headers
-    lmemory.append(["Hosts", "GiB", "Cnt"])
-
-    # Add content
-    for index, row in memory_config.iterrows():
-        memory = f'{int(int(row["N_Memory"]) / 1024):n}'
-        host = row['Host']
+    model["hosts"] = [["Hosts", "GiB", "Cnt"]] + memory_ranks(memory_config, 'Host', 'N_Memory')
 
-        # print("memory:"+str(memory)+"    host:"+host)
-        if pre_memory != memory:
-            if pre_memory != '':  # do not add the first empty element
-                lmemory.append([pre_host, pre_memory, count])
-            pre_host = ''
-            count = 1
-        else:
-            count += 1
-
-        pre_memory = memory
-        if pre_host == '':
-            pre_host = str(host)
-        else:
-            pre_host = pre_host + ", " + str(host)
-
-    lmemory.append([pre_host, pre_memory, count])
-
-    # Write to DOC
-    if memory_config is not None:
-        add_p().add_run("")
-
-        L = WD_ALIGN_PARAGRAPH.LEFT
-        R = WD_ALIGN_PARAGRAPH.RIGHT
-        table = table_from_list(lmemory, document, True, [430, 40, 30], [L, R, R],
-                                "[vHost] Hosts grouped by physical memory size")
-
-        # Adjust fonts and lengths
-        # 0:VMs - 1:MemoryCapacity - 2:Annotations - 3:Count
-        count = 0
-        for row in table.rows:
-            count += 1
-            if count > 2:  # jump headers
-                for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
+    return model
 
-                if len(str(row.cells[0].text)) > 300: row.cells[0].text = row.cells[0].text[0:300] + "..."
-                row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
 
-    return
+def print_memory_ranks(sheets_dict, model=None):
+    if model is None: model = compute_memory_ranks(sheets_dict)
 
+    L = WD_ALIGN_PARAGRAPH.LEFT
+    R = WD_ALIGN_PARAGRAPH.RIGHT
 
-def print_compute_checks_and_hints(sheets_dict, sizing_row):
-    # #####################################################################################################################
-    # Compute Checks & Hints... table
-    # #####################################################################################################################
+    ################################################################################
+    # VM's Memory List
+    ################################################################################
     add_p().add_run("")
 
-    compute_checks = {}
-    key = "Clusters with less than 3 hosts (vCluster)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vCluster', query_expr='NumHosts < 3')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
-
-    key = "VMs with CBT not activated (vInfo)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, "vInfo", query_expr="CBT!=True")
-    except Exception as ex:
-        compute_checks[key] = str(ex)
-
-    key = "Hosts with more than 64 cores (vHost)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vHost', query_expr='N_Cores > 64')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
-
-    key = "Hosts with more than 128 cores (vHost)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vHost', query_expr='N_Cores > 128')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
-
-    key = "VMs with CPU HotAdd (vCPU)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vCPU', query_expr='Hot_Add == True')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
+    table = table_from_list(model["vms"], document, True, [440, 30, 30], [L, R, R],
+                            "[vInfo] VMs grouped by memory size")
 
-    # key = "VMs with CPU HotRemove (vCPU)"
-    # try: compute_checks[key] = count_rows(sheets_dict, 'vCPU', query_expr='Hot_Remove == True')
-    # except Exception as ex: compute_checks[key] = str(ex)
+    # Adjust fonts and lengths
+    # 0:VMs - 1:MemoryCapacity - 2:Annotations - 3:Count
+    count = 0
+    for row in table.rows:
+        count += 1
+        if count > 2:  # jump headers
+            for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
+            max_len = 250
+            if len(str(row.cells[0].text)) > max_len: row.cells[0].text = row.cells[0].text[0:max_len] + "..."
+            row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
 
-    # key = "VMs with CPU Numa HotAdd Exposed (vCPU)"
-    # try: compute_checks[key] = count_rows(sheets_dict, 'vCPU', query_expr='Numa_Hotadd_Exposed == True')
-    # except Exception as ex: compute_checks[key] = str(ex)
+    ################################################################################
+    # Hosts Memory List
+    ################################################################################
+    add_p().add_run("")
 
-    # key = "VMs with RAM btw 1TB and 2TB (vInfo)"
-    # try: compute_checks[key] = count_rows(sheets_dict, 'vInfo', query_expr='Memory > 100000 and Memory < 200000 ')
-    # except Exception as ex: compute_checks[key] = str(ex)
+    table = table_from_list(model["hosts"], document, True, [430, 40, 30], [L, R, R],
+                            "[vHost] Hosts grouped by physical memory size")
 
-    key = "VMs with RAM btw 2TB and 6TB (vInfo)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vInfo', query_expr='Memory >= 200000 and Memory <= 600000 ')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
+    # Adjust fonts and lengths
+    # 0:VMs - 1:MemoryCapacity - 2:Annotations - 3:Count
+    count = 0
+    for row in table.rows:
+        count += 1
+        if count > 2:  # jump headers
+            for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
 
-    key = "VMs with RAM greater than 6TB (vInfo)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vInfo', query_expr='Memory > 600000')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
+            if len(str(row.cells[0].text)) > 300: row.cells[0].text = row.cells[0].text[0:300] + "..."
+            row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
 
-    key = "VMs with memory HotAdd (vMemory)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vMemory', query_expr='Hot_Add == True')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
+    return
 
-    key = "VMs with Ballooned memory (vMemory)"
-    try:
-        compute_checks[key] = count_rows(sheets_dict, 'vMemory', query_expr='Ballooned == True')
-    except Exception as ex:
-        compute_checks[key] = str(ex)
 
+# Compute Checks & Hints, see evaluate_checks
+compute_checks = [
+    ("Clusters with less than 3 hosts (vCluster)", 'vCluster', [("NumHosts", "<", 3)]),
+    ("VMs with CBT not activated (vInfo)", 'vInfo', [("CBT", "!=", True)]),
+    ("Hosts with more than 64 cores (vHost)", 'vHost', [("N_Cores", ">", 64)]),
+    ("Hosts with more than 128 cores (vHost)", 'vHost', [("N_Cores", ">", 128)]),
+    ("VMs with CPU HotAdd (vCPU)", 'vCPU', [("Hot_Add", "==", True)]),
+    # ("VMs with CPU HotRemove (vCPU)", 'vCPU', [("Hot_Remove", "==", True)]),
+    # ("VMs with CPU Numa HotAdd Exposed (vCPU)", 'vCPU', [("Numa_Hotadd_Exposed", "==", True)]),
+    # ("VMs with RAM btw 1TB and 2TB (vInfo)", 'vInfo', [("Memory", ">", 100000), ("Memory", "<", 200000)]),
+    (("VMs with RAM btw 2TB and 6TB (vInfo)", "VMs with RAM greater than 6TB (vInfo)"), 'vInfo',
+     {"column": "Memory", "edges": [np.nextafter(200000, 0), 600000, np.inf]}),  # 200000 included
+    ("VMs with memory HotAdd (vMemory)", 'vMemory', [("Hot_Add", "==", True)]),
+    ("VMs with Ballooned memory (vMemory)", 'vMemory', [("Ballooned", "==", True)]),
     # vCluster Num VMotions
     # vCluster DRS vmotion rate
     # vHost VMotion support
     # vHost Storage VMotion support
+]
+
+
+def compute_compute_checks_and_hints(sheets_dict):
+    """
+    Compute phase of print_compute_checks_and_hints
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model, the checks dictionary
+    """
+    return evaluate_checks(sheets_dict, compute_checks)
+
+
+def print_compute_checks_and_hints(sheets_dict, sizing_totals, model=None):
+    # #####################################################################################################################
+    # Compute Checks & Hints... table
+    # #####################################################################################################################
+    if model is None: model = compute_compute_checks_and_hints(sheets_dict)
+
+    add_p().add_run("")
 
-    table = table_from_dict(compute_checks, document, True, None,
+    table = table_from_dict(model, document, True, None,
                             "Check", "Data", True, "Compute Checks & Hints")
 
-    # TODO: Avoid this ugly and crazy way to reuse information
-    total_number_of_Clusters = sizing_row.cells[1].text
-    total_number_of_Hosts = sizing_row.cells[2].text
-    total_number_of_VMs = sizing_row.cells[9].text
+    # sizing_totals are the print_compute_sizing totals row texts
+    total_number_of_Clusters = sizing_totals[1]
+    total_number_of_Hosts = sizing_totals[2]
+    total_number_of_VMs = sizing_totals[9]
 
     run = add_p().add_run("Reference:  Total Clusters=" + total_number_of_Clusters +
                          "   Total Hosts=" + total_number_of_Hosts +
@@ -2019,11 +3628,14 @@ def print_compute_checks_and_hints(sheets_dict, sizing_row):
     return
 
 
-def print_networking(sheets_dict):
-    #######################################################################################################################
-    # %%% REPORT Networking
+def compute_networking(sheets_dict):
+    """
+    Compute phase of print_networking
 
-    add_p().add_run("")
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    model = {}
 
     # Show the NIC drivers by datacenter and link status
     # #####################################################################################################################
@@ -2066,33 +3678,20 @@ def print_networking(sheets_dict):
     '''
     # Show the number of NICs per host
     # #####################################################################################################################
-
-    nics_host_shortList = {}
     NIC_Host = groupby(sheets_dict, sheet='vNIC', columns=["Host", "MAC"], ascending=False, debug=False)
     NIC_Host = NIC_Host.groupby(["Count"]).count().reset_index().sort_values(by=['Count'], ascending=True)
-
-    set_run_title_style(add_p().add_run("[vNIC] NIC/Host (NICs per Host)"))
-    p = add_p()
-    for index, row in NIC_Host.iterrows():
-        p.add_run("There are " + str(row["Host"]) + " hosts with " + str(row["Count"]) + " MAC address (NICs)\n")
+    model["nics_host"] = ["There are " + str(row["Host"]) + " hosts with " + str(row["Count"]) + " MAC address (NICs)\n"
+                          for index, row in NIC_Host.iterrows()]
 
     # Show the number of NICs per VM
     # #####################################################################################################################
-    nics_vm_shortList = {}
     NIC_VM = groupby(sheets_dict, sheet='vInfo', columns=["NICs", "VM"]).sort_values(by=['NICs'], ascending=True)
-    # print("NICs per VM")
-    # print(NIC_VM)
-
-    set_run_title_style(add_p().add_run("[vInfo] NIC/VM (NICs per VM)"))
-    p = add_p()
-    for index, row in NIC_VM.iterrows():
-        p.add_run("There are " + str(row["Count"]) + " VMs with " + str(row["NICs"]) + " NICs\n")
+    model["nics_vm"] = ["There are " + str(row["Count"]) + " VMs with " + str(row["NICs"]) + " NICs\n"
+                        for index, row in NIC_VM.iterrows()]
 
     # Show the number of VMs attached to each network
     # #####################################################################################################################
-
     network_VM_shortList = {}
-    set_run_title_style(add_p().add_run("[vNetwork] Network/VM (VMs per Network)"))
     network_VM = groupby(sheets_dict, sheet='vNetwork', columns=["Network", "VM"], ascending=False, debug=False)
     network_VM = network_VM.groupby(["Count"]).count().reset_index().sort_values(by=['Count'], ascending=True)
 
@@ -2123,14 +3722,40 @@ def print_networking(sheets_dict):
             newValue = currentValue + row.Network
             network_VM_shortList.update({index: newValue})
 
+    model["networks_vm"] = ["There are " + str(value) + " networks with " + key + " VMs attached\n"
+                            for key, value in network_VM_shortList.items()]
+    return model
+
+
+def print_networking(sheets_dict, model=None):
+    #######################################################################################################################
+    # %%% REPORT Networking
+    if model is None: model = compute_networking(sheets_dict)
+
+    add_p().add_run("")
+
+    set_run_title_style(add_p().add_run("[vNIC] NIC/Host (NICs per Host)"))
+    p = add_p()
+    for text in model["nics_host"]: p.add_run(text)
+
+    set_run_title_style(add_p().add_run("[vInfo] NIC/VM (NICs per VM)"))
+    p = add_p()
+    for text in model["nics_vm"]: p.add_run(text)
+
+    set_run_title_style(add_p().add_run("[vNetwork] Network/VM (VMs per Network)"))
     p = add_p()
-    for key, value in network_VM_shortList.items():
-        p.add_run("There are " + str(value) + " networks with " + key + " VMs attached\n")
+    for text in model["networks_vm"]: p.add_run(text)
 
     return
 
 
-def print_network_terms(sheets_dict):
+def compute_network_terms(sheets_dict):
+    """
+    Compute phase of print_network_terms
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     # Search Network related terms
     # #####################################################################################################################
 
@@ -2145,19 +3770,29 @@ def print_network_terms(sheets_dict):
 
     sheets = ['vNetwork', 'vNIC', 'vSwitch', 'dvSwitch', 'vPort', 'dvPort']
 
-    headers = [["Search Term", "Count", "Column", "Spreadsheet"]]
+    return {"sheets": sheets, "results": global_search(sheets_dict, terms, sheets)}
 
-    results = global_search(sheets_dict, terms, sheets)
-    network_findings = headers + results
+
+def print_network_terms(sheets_dict, model=None):
+    if model is None: model = compute_network_terms(sheets_dict)
+
+    headers = [["Search Term", "Count", "Column", "Spreadsheet"]]
+    network_findings = headers + model["results"]
 
     tb = table_from_list(network_findings, document, columns_width=[300, 50, 75, 75], grid=True,
-                         title="Network related terms in " + str(sheets))
+                         title="Network related terms in " + str(model["sheets"]))
     # title="Search of network related terms in vNetwork,vNIC,vSwitch,vPort and dvSwitch sheets")
     add_p().add_run("")
     return
 
 
-def print_workload_terms(sheets_dict):
+def compute_workload_terms(sheets_dict):
+    """
+    Compute phase of print_workload_terms
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     # Search workload related terms
     # #####################################################################################################################
     # search examples:
@@ -2228,28 +3863,44 @@ def print_workload_terms(sheets_dict):
     # the sheets we are going to search in
     sheets = ['vNetwork', 'vNIC', 'vSwitch', 'vPort', 'dvSwitch', 'vPartition']
 
-    headers = [["Search Term", "Count", "Column", "Spreadsheet"]]
-
     results = global_search(sheets_dict, terms, sheets)
 
     results = [tup for tup in results if tup[1] > 5 and "OS_according_to_" not in tup[2]]
-    network_findings = headers + results
+    return {"sheets": sheets, "results": results}
+
+
+def print_workload_terms(sheets_dict, model=None):
+    if model is None: model = compute_workload_terms(sheets_dict)
+
+    headers = [["Search Term", "Count", "Column", "Spreadsheet"]]
+    network_findings = headers + model["results"]
 
     tb2 = table_from_list(network_findings, document, columns_width=[300, 50, 75, 75], grid=True,
-                          title="Workload related terms in " + str(sheets))
+                          title="Workload related terms in " + str(model["sheets"]))
 
     add_p().add_run("")
     return
 
 
-def print_appliances_n_OVA_annotations(sheets_dict):
+def compute_appliances_n_OVA_annotations(sheets_dict):
+    """
+    Compute phase of print_appliances_n_OVA_annotations
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model, the grouped annotations DataFrame
+    """
     # Search for appliance or OVA in annotations contains_expr='appliance|\\bova\\b'
     # #####################################################################################################################
     appliances = get_rows(sheets_dict, 'vInfo', debug=False, contains_column='Annotation',
                           contains_expr='appliance|\\bova\\b', contains_case=False)
     groupedAppliances = groupby_df(appliances, columns=["Annotation", "VM"], debug=False)
-    groupedAppliances = groupedAppliances.sort_values(by=['Count'], ascending=False)
-    tb = table_from_df(groupedAppliances, document, grid=True, columnWidths=[450, 50],
+    return groupedAppliances.sort_values(by=['Count'], ascending=False)
+
+
+def print_appliances_n_OVA_annotations(sheets_dict, model=None):
+    if model is None: model = compute_appliances_n_OVA_annotations(sheets_dict)
+
+    tb = table_from_df(model, document, grid=True, columnWidths=[450, 50],
                        title="[vInfo] Annotation filtered by 'Appliance and OVA'")
 
     for row in tb.rows:
@@ -2264,72 +3915,103 @@ def print_appliances_n_OVA_annotations(sheets_dict):
     return
 
 
-def print_operating_systems(sheets_dict):
-    # List all Operating Systems with its supportability status
-    # https://access.redhat.com/articles/4234591
-    # #####################################################################################################################
+# List all Operating Systems with its supportability status
+# https://access.redhat.com/articles/4234591
+# #####################################################################################################################
+
+supported_OS = [
+    'Red Hat Enterprise Linux 9 (64-bit)'
+    , 'Red Hat Enterprise Linux 8 (64-bit)'
+    , 'Red Hat Enterprise Linux 7 (64-bit)'
+    , 'Microsoft Windows Server 2022 (64-bit)'
+    , 'Microsoft Windows Server 2019 (64-bit)'
+    , 'Microsoft Windows Server 2016 or later (64-bit)'
+    , 'Microsoft Windows Server 2016 (64-bit)'
+    , 'Microsoft Windows 10 (64-bit)'
+    , 'SUSE Linux Enterprise 15 (64-bit)'
+]
+
+EOL_OS = [
+    'Red Hat Enterprise Linux 6 (64-bit)'
+    , 'Microsoft Windows Server 2012 (64-bit)'
+    , 'Ubuntu Linux (64-bit)'
+]
+
+Community_OS = [
+    'CentOS 7 (64-bit)'
+    , 'CentOS 8 (64-bit)'
+    , 'CentOS 9 (64-bit)'
+    , 'Red Hat Fedora (64-bit)'
+]
+
+# OS name: support status, any other OS is "never" supported. See os_support_status
+os_support = {**{name: "community" for name in Community_OS}, **{name: "eol" for name in EOL_OS},
+              **{name: "supported" for name in supported_OS}}
+
+
+def os_support_status(os_names):
+    """
+    Classify OS names with the os_support map
+
+    :param os_names: Series or list of OS names
+    :return: Series of "supported", "eol", "community" or "never" status
+    """
+    return pd.Series(os_names, dtype=object).map(os_support).fillna("never")
 
-    supported_OS = [
-        'Red Hat Enterprise Linux 9 (64-bit)'
-        , 'Red Hat Enterprise Linux 8 (64-bit)'
-        , 'Red Hat Enterprise Linux 7 (64-bit)'
-        , 'Microsoft Windows Server 2022 (64-bit)'
-        , 'Microsoft Windows Server 2019 (64-bit)'
-        , 'Microsoft Windows Server 2016 or later (64-bit)'
-        , 'Microsoft Windows Server 2016 (64-bit)'
-        , 'Microsoft Windows 10 (64-bit)'
-        , 'SUSE Linux Enterprise 15 (64-bit)'
-    ]
-
-    EOL_OS = [
-        'Red Hat Enterprise Linux 6 (64-bit)'
-        , 'Microsoft Windows Server 2012 (64-bit)'
-        , 'Ubuntu Linux (64-bit)'
-    ]
-
-    Community_OS = [
-        'CentOS 7 (64-bit)'
-        , 'CentOS 8 (64-bit)'
-        , 'CentOS 9 (64-bit)'
-        , 'Red Hat Fedora (64-bit)'
-    ]
-
-    # Repair empty cells. get_rows without columns to allow update
-    os_data_df = get_rows(sheets_dict, sheet='vInfo')
-    for index, row in os_data_df.iterrows():
-        os = row['OS_according_to_the_VMware_Tools']
-        if os is None or str(os).upper() == 'NAN' or (isinstance(os, str) and os == ''):
-            # Update
-            os_data_df.at[index, 'OS_according_to_the_VMware_Tools'] = row['OS_according_to_the_configuration_file']
-
-    # Calculate OS percentages and print the results
+
+def fill_missing_os(df):
+    """
+    Fill the empty OS_according_to_the_VMware_Tools values (NaN, "nan" or "") with the
+    OS_according_to_the_configuration_file ones, in place
+
+    :param df: vInfo DataFrame
+    :return: the filled values mask
+    """
+    tools_os = df['OS_according_to_the_VMware_Tools']
+    config_os = df['OS_according_to_the_configuration_file']
+    missing = tools_os.isna() | tools_os.astype(str).str.upper().isin(['NAN', ''])
+
+    add_categories(df, 'OS_according_to_the_VMware_Tools', config_os)
+    df['OS_according_to_the_VMware_Tools'] = df['OS_according_to_the_VMware_Tools'].mask(missing,
+                                                                                         config_os.astype(object))
+    return missing
+
+
+def compute_operating_systems(sheets_dict):
+    """
+    Compute phase of print_operating_systems. Empty OS_according_to_the_VMware_Tools values are
+    filled from the configuration file in clean_and_fix_data (see fill_missing_os)
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    # Calculate OS percentages
     os_data = calculate_percentage(sheets_dict, sheet='vInfo', columns='OS_according_to_the_VMware_Tools')
 
-    supported = float(0);
-    eol = float(0);
-    comm = float(0);
-    never = float(0)
-    rowColor = []
-    for value, count, percentage in os_data:
-        if value in supported_OS:
-            rowColor.append(green_color); supported += percentage
-        elif value in EOL_OS:
-            rowColor.append(blue_color); eol += percentage
-        elif value in Community_OS:
-            rowColor.append(gray_color); comm += percentage
-        else:
-            rowColor.append(red_color); never += percentage
+    status = os_support_status([value for value, count, percentage in os_data]).tolist()
+    totals = {"supported": float(0), "eol": float(0), "community": float(0), "never": float(0)}
+    for (value, count, percentage), value_status in zip(os_data, status):
+        totals[value_status] += percentage
+
+    return {"os_data": os_data, "status": status, **totals}
+
+
+def print_operating_systems(sheets_dict, model=None):
+    if model is None: model = compute_operating_systems(sheets_dict)
 
-    table = add_percentage_table(document, os_data, "Operating System", rowColor, "Table Grid",
+    status_color = {"supported": green_color, "eol": blue_color, "community": gray_color, "never": red_color}
+    rowColor = [status_color[status] for status in model["status"]]
+
+    table = add_percentage_table(document, model["os_data"], "Operating System", rowColor, "Table Grid",
                                  title="[vInfo] OS_according_to_the_VMware_Tools\n")
     p = table.rows[0].cells[0].paragraphs[0]
-    p.add_run("Supported {:5.2f}".format(supported) + "%").font.color.rgb = green_color;
+    p.add_run("Supported {:5.2f}".format(model["supported"]) + "%").font.color.rgb = green_color;
     p.add_run(" - ")
-    p.add_run("End Of Life {:5.2f}".format(eol) + "%").font.color.rgb = blue_color;
+    p.add_run("End Of Life {:5.2f}".format(model["eol"]) + "%").font.color.rgb = blue_color;
     p.add_run(" - ")
-    p.add_run("Community support {:5.2f}".format(comm) + "%").font.color.rgb = gray_color;
+    p.add_run("Community support {:5.2f}".format(model["community"]) + "%").font.color.rgb = gray_color;
     p.add_run(" - ")
-    p.add_run("Not certified {:5.2f}".format(never) + "%").font.color.rgb = red_color
+    p.add_run("Not certified {:5.2f}".format(model["never"]) + "%").font.color.rgb = red_color
 
     add_p().add_run("\n")
     return
@@ -2358,103 +4040,78 @@ def print_operating_systems(sheets_dict):
     '''
 
 
-def print_storage_models(sheets_dict):
+def compute_storage_models(sheets_dict):
+    """
+    Compute phase of print_storage_models
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     dataList = calculate_percentage(sheets_dict, sheet='vMultiPath', columns=['Display_name', 'Vendor', 'Model'])
     rowLink = []
     for value, count, percentage in dataList:
         rowLink.append(
             "https://www.google.com/search?q=" + urllib.parse.quote(str(value[1]) + str(value[2]) + " CSI", safe='/',
                                                                     encoding=None, errors=None))
+    return {"data": dataList, "links": rowLink}
+
 
-    add_percentage_table(document, dataList, "[vMultipath] DisplayName/Vendor/Model", None, "Table Grid", links=rowLink,
+def print_storage_models(sheets_dict, model=None):
+    if model is None: model = compute_storage_models(sheets_dict)
+
+    add_percentage_table(document, model["data"], "[vMultipath] DisplayName/Vendor/Model", None, "Table Grid",
+                         links=model["links"],
                          title="Number of Datastore connections (from Host) per storage system type. 1:n")
     add_p().add_run("")
     return
 
 
-def print_storage_capacity(sheets_dict):
+def compute_storage_capacity(sheets_dict):
+    """
+    Compute phase of print_storage_capacity
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     # Datastores per type including capacity
     # #####################################################################################################################
+    model = {"error": None}
     try:
         datastores = get_rows(sheets_dict, sheet='vDatastore',
                               columns=["Type", "Display_name", "Capacity_MiB", "Provisioned_MiB", "In_Use_MiB",
                                        "Object_ID"], debug=False)
-        datastores = datastores.sort_values(by=["Type", "Display_name"], key=lambda x: x.str.lower())
+        levels = subtotals_df(datastores, ["Type", "Display_name"], ["Capacity_MiB", "Provisioned_MiB", "In_Use_MiB"])
+
+        def gib_rows(level, source=None):
+            return [[t, d if source is None else source, f"{c / 1000:,.0f}", f"{p / 1000:,.0f}", f"{u / 1000:,.0f}", n]
+                    for t, d, c, p, u, n in zip(level["Type"].tolist(),
+                                                level["Display_name"].tolist() if source is None else level["Type"].tolist(),
+                                                level["Capacity_MiB"].tolist(), level["Provisioned_MiB"].tolist(),
+                                                level["In_Use_MiB"].tolist(), level["Count"].tolist())]
+
+        main_list = [["Type", "Source", "Capacity", "Provsnd", "InUse", "Count"]] + gib_rows(levels[0])
+        t_main_list = gib_rows(levels[1], "Type Totals in GiB")
+        model["main_list"] = main_list
+        model["totals_list"] = t_main_list
+    except Exception as ex:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        model["error"] = str(ex)
+        model["error_line"] = exc_tb.tb_lineno
+
+    return model
 
-        Type = ""
-        Display = None
 
-        Capacity = 0;
-        Provisioned = 0;
-        InUse = 0;
-        Count = 0
-        tCapacity = 0;
-        tProvisioned = 0;
-        tInUse = 0;
-        tCount = 0
+def print_storage_capacity(sheets_dict, model=None):
+    if model is None: model = compute_storage_capacity(sheets_dict)
 
+    if model["error"] is None:
         L = WD_ALIGN_PARAGRAPH.LEFT
         R = WD_ALIGN_PARAGRAPH.RIGHT
-
-        main_list = []
-        t_main_list = []
-
-        main_list.append(["Type", "Source", "Capacity", "Provsnd", "InUse", "Count"])
-
         columns_width = [45, 210, 65, 65, 65, 50]
         columns_align = [L, L, R, R, R, R]
-        totals_text = "Type Totals in GiB"
-        i = 0
-        for index, row in datastores.iterrows():
-
-            # print(row.Display_name)
-            if Type != "" and Type.upper() != row.Type.upper():
-                # when Type changes we save previous data on list
-                t_main_list.append(
-                    [Type, totals_text, f"{tCapacity / 1000:,.0f}", f"{tProvisioned / 1000:,.0f}",
-                     f"{tInUse / 1000:,.0f}",
-                     tCount])
-
-                # initialize values at Type level
-                tCapacity = 0;
-                tProvisioned = 0;
-                tInUse = 0;
-                tCount = 0
-
-            tCapacity = tCapacity + row.Capacity_MiB
-            tProvisioned = tProvisioned + row.Provisioned_MiB
-            tInUse = tInUse + row.In_Use_MiB
-            tCount = tCount + 1
-
-            if Display != None and str(Display).upper() != str(row.Display_name).upper():
-                # print(Display + " != " + row.Display_name)
-                # when Display changes we save previous data on list
-                main_list.append(
-                    [Type, Display, f"{Capacity / 1000:,.0f}", f"{Provisioned / 1000:,.0f}", f"{InUse / 1000:,.0f}",
-                     Count])
-                i += 1
 
-                # initialize values at DisplayName level
-                Capacity = 0;
-                Provisioned = 0;
-                InUse = 0;
-                Count = 0
-
-            Type = row.Type
-            Display = row.Display_name
-            Capacity += row.Capacity_MiB
-            Provisioned += row.Provisioned_MiB
-            InUse += row.In_Use_MiB
-            Count += 1
-
-        # Save last row values
-        main_list.append(
-            [Type, Display, f"{Capacity / 1000:,.0f}", f"{Provisioned / 1000:,.0f}", f"{InUse / 1000:,.0f}", Count])
-        t_main_list.append(
-            [Type, totals_text, f"{tCapacity / 1000:,.0f}", f"{tProvisioned / 1000:,.0f}", f"{tInUse / 1000:,.0f}",
-             tCount])
-        added_rows = len(t_main_list)
-        tb = table_from_list(main_list + t_main_list, document, True, columns_width, columns_align,
+        added_rows = len(model["totals_list"])
+        tb = table_from_list(model["main_list"] + model["totals_list"], document, True, columns_width, columns_align,
                              title="[vDatastore] Datastores type, source (from address) and capacity in GiB")
         for x in range(added_rows):
             for y in range(len(tb.rows[0].cells)):
@@ -2463,73 +4120,60 @@ def print_storage_capacity(sheets_dict):
                 cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
                 set_cell_background(cell, "E5E5EE")
         p = add_p()
-    except Exception as ex:
-        exc_type, exc_obj, exc_tb = sys.exc_info()
+    else:
         p = add_p()
         p.add_run("[vDatastore] Datastores type, source (from address) and capacity in GiB")
-        p.add_run("\nERROR processing section:" + str(ex))
+        p.add_run("\nERROR processing section:" + model["error"])
         warns.append(
             "ERROR in section: [vDatastore] Datastores type, source (from address) and capacity in GiB (line:" + str(
-                exc_tb.tb_lineno) + ") " + str(ex))
+                model["error_line"]) + ") " + model["error"])
 
     return
 
 
-def print_storage_connections(sheets_dict):
+def compute_storage_connections(sheets_dict):
     """
-    Print NFS, VMFS, VSAN storage in use by each Datacenter/Cluster
-    Loop each DC/CL pair host in vHost. For each: check if storage exists in vDatastore and what type it is.
+    Compute phase of print_storage_connections
 
-    :param sheets_dict:
-    :return: generated table
+    :param sheets_dict: the global sheets dictionary
+    :return: render model, the connections DataFrame
     """
     # ####################################################################################################################
+    types = ["NFS", "VMFS", "VSAN"]
     hosts_per_cluster = get_rows(sheets_dict, sheet='vHost', key_columns=["Datacenter", "Cluster", "Host"],
-                                 columns=["Datacenter", "Cluster", "Host"]).sort_values(by=["Datacenter", "Cluster"],
-                                                                                        ascending=True)
+                                 columns=["Datacenter", "Cluster", "Host"])
+    cols_prepare('vDatastore', ["Hosts", "Type"])
     datastores = combine_data_sheets(sheets_dict, "vDatastore")
 
-    matrix = []
-    lastdc = "";
-    lastcl = ""
-    hasNFS = 0;
-    hasVMFS = 0;
-    hasVSAN = 0
-    totNFS = 0;
-    totVMFS = 0;
-    totVSAN = 0
-
-    #For each host
-    for index, row in hosts_per_cluster.iterrows():
-        dc = row["Datacenter"]
-        cl = row["Cluster"]
-        host = row["Host"]
-
-        #subtotals per DC and Cluster
-        if lastdc != dc or lastcl != cl:
-            if lastdc != "": matrix.append([lastdc, lastcl, hasNFS, hasVMFS, hasVSAN])
-            totNFS += hasNFS;
-            totVMFS += hasVMFS;
-            totVSAN += hasVSAN
-            lastdc = dc;
-            lastcl = cl;
-            hasNFS = 0;
-            hasVMFS = 0;
-            hasVSAN = 0
-
-        #datastores in use per current host
-        found = datastores[datastores["Hosts"].str.contains(host, na=False, case=True)]
-        for index2, dstore in found.iterrows():
-            dstype = str(dstore["Type"]).upper()
-            if dstype == "NFS": hasNFS += 1
-            if dstype == "VMFS": hasVMFS += 1
-            if dstype == "VSAN": hasVSAN += 1
-
-    matrix.append(["", "", totNFS, totVMFS, totVSAN])
-    matrixdf = pd.DataFrame(matrix, columns=["Datacenter", "Cluster", "NFS", "VMFS", "VSAN"])
+    # host -> datastore edges, from the comma separated datastore Hosts
+    edges = pd.DataFrame({"Host": datastores["Hosts"].str.split(","),
+                          "Type": datastores["Type"].astype(str).str.upper()}).explode("Host", ignore_index=True)
+    edges["Host"] = edges["Host"].str.strip()
+
+    # datastores in use per host and type, then per DC and Cluster
+    datastores_per_host = pd.crosstab(edges["Host"], edges["Type"]).reindex(columns=types, fill_value=0)
+    hosts_per_cluster = hosts_per_cluster.join(datastores_per_host, on="Host").fillna({t: 0 for t in types})
+    clusters, _, total = subtotals_df(hosts_per_cluster, ["Datacenter", "Cluster"], types, casefold=False)
+
+    # clusters and totals row
+    total = total.assign(Datacenter="", Cluster="")
+    matrix = pd.concat([clusters, total], ignore_index=True)[["Datacenter", "Cluster"] + types]
+    return matrix.astype({t: int for t in types})
+
+
+def print_storage_connections(sheets_dict, model=None):
+    """
+    Print NFS, VMFS, VSAN storage in use by each Datacenter/Cluster
+    Loop each DC/CL pair host in vHost. For each: check if storage exists in vDatastore and what type it is.
+
+    :param sheets_dict:
+    :param model: the compute_storage_connections result, computed if None
+    :return: generated table
+    """
+    if model is None: model = compute_storage_connections(sheets_dict)
 
     #generate document table
-    tb = table_from_df(matrixdf, document, True, [190, 190, 40, 40, 40],
+    tb = table_from_df(model, document, True, [190, 190, 40, 40, 40],
                        "[vHost/vDatastore] Host Datastore connections grouped by Cluster and Type")
 
     #adjust styles
@@ -2540,62 +4184,66 @@ def print_storage_connections(sheets_dict):
     return tb
 
 
-def print_storage_vms_per_disk_controller(sheets_dict):
+def compute_storage_vms_per_disk_controller(sheets_dict):
+    """
+    Compute phase of print_storage_vms_per_disk_controller
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
+    return calculate_percentage(sheets_dict, sheet='vDisk', columns='Controller')
+
+
+def print_storage_vms_per_disk_controller(sheets_dict, model=None):
     # [vDisk] Number of VMs using each type of Disk Controller"
     # ####################################################################################################################
-    dataList = calculate_percentage(sheets_dict, sheet='vDisk', columns='Controller')
+    if model is None: model = compute_storage_vms_per_disk_controller(sheets_dict)
+
     add_p().add_run("")
-    add_percentage_table(document, dataList, "vDisk Controller", None, "Table Grid",
+    add_percentage_table(document, model, "vDisk Controller", None, "Table Grid",
                          title="[vDisk] Number of VMs using each type of Disk Controller")
     return
 
 
-def print_storage_multiple_controllers(sheets_dict):
+def compute_storage_multiple_controllers(sheets_dict):
+    """
+    Compute phase of print_storage_multiple_controllers
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model, the VM/Details DataFrame or None if there are no VMs with multiple controllers types
+    """
     # [vDisk] VMs with more than 1 disk controller
     # ####################################################################################################################
-    add_p().add_run("")
 
-    # Retrieve unique combinations of VM+Controller
-    multiController_VM = get_rows(sheets_dict, sheet='vDisk', key_columns=["VM", "Controller"],
-                                  columns=["VM", "Controller"])
-    # Group to obtain the number of instances for each VM
-    multiController_VM = groupby_df(multiController_VM, columns=["VM", "Controller"], trunk=True)
+    # Disks per VM and Controller, each VM controllers in order of appearance
+    disks = get_rows(sheets_dict, sheet='vDisk', columns=["VM", "Controller"])
+    if disks.size == 0: return None
+    disks_per_controller = disks.groupby(["VM", "Controller"], observed=True, sort=False, dropna=False).size()
+    disks_per_controller = disks_per_controller.reset_index(name="Count")
+
     # Filter VMs with more than one Controller
-    controllersList = multiController_VM.query("Count > 1")
-    # Print the list
-    count = len(controllersList)
-    if count > 0:
-        query = ""
-        first = True
-
-        # build a query to retrieve all VM/Controller rows
-        for index, row in controllersList.iterrows():
-            if not first: query = query + " or "
-            first = False
-            query = query + "VM == '" + row["VM"] + "'"
-        multiController_VM = get_rows(sheets_dict, sheet='vDisk', key_columns=["VM", "Controller"],
-                                      columns=["VM", "Controller"], query_expr=query)
-        count = len(multiController_VM)
-
-        newValues = []
-        for index, row in controllersList.iterrows():
-            multiController_VM = get_rows(sheets_dict, sheet='vDisk', columns=["VM", "Controller"],
-                                          query_expr="VM == '" + row["VM"] + "'")
-            # print row.Controller
-            ctrList = {}
-            for index2, row2 in multiController_VM.iterrows():
-                if row2.Controller in ctrList.keys():
-                    ctrList[row2.Controller] = ctrList[row2.Controller] + 1
-                else:
-                    ctrList[row2.Controller] = 1
+    controllers = disks_per_controller.dropna(subset=["Controller"]).groupby("VM", observed=True).size()
+    controllersList = list(controllers[controllers > 1].index)
+    if len(controllersList) == 0: return None
+
+    ctrLists = {vm: {} for vm in controllersList}
+    for vm, controller, count in disks_per_controller.itertuples(index=False):
+        if vm in ctrLists: ctrLists[vm][controller] = int(count)
 
-            newValues.append(str(len(multiController_VM)) + ": " + str(ctrList))
+    newValues = [str(sum(ctrList.values())) + ": " + str(ctrList) for ctrList in ctrLists.values()]
+    return pd.DataFrame({"VM": controllersList, "Details": newValues})
+
+
+def print_storage_multiple_controllers(sheets_dict, model=None):
+    # [vDisk] VMs with more than 1 disk controller
+    # ####################################################################################################################
+    if model is None: model = compute_storage_multiple_controllers(sheets_dict)
 
-        controllersList = controllersList.drop('Count', axis=1)
-        controllersList.insert(1, "Details", newValues, True)
+    add_p().add_run("")
 
-        # Print the short list
-        tb = table_from_df(controllersList, document, grid=True, columnWidths=[150, 350],
+    # Print the short list
+    if model is not None:
+        tb = table_from_df(model, document, grid=True, columnWidths=[150, 350],
                            title="[vDisk] VM/Controller (VMs using multiple controllers types)")
     else:
         add_p().add_run("There are no VMs with multiple controllers types")
@@ -2603,261 +4251,332 @@ def print_storage_multiple_controllers(sheets_dict):
     return
 
 
-def print_storage_hba_models(sheets_dict):
-    ##################################
-    # HBA Models
-    #TODO
-    add_p().add_run("")
+def compute_storage_hba_models(sheets_dict):
+    """
+    Compute phase of print_storage_hba_models
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     rowLink = []
     dataList = calculate_percentage(sheets_dict, sheet='vHBA', columns=['Model', 'Type'])
     for value, count, percentage in dataList:
         rowLink.append("https://www.google.com/search?q==" + urllib.parse.quote(value[0], safe='/', encoding=None,
                                                                                       errors=None))
-    add_percentage_table(document, dataList, "[vHBA] Model/Type", None, "Table Grid", None, rowLink)
+    return {"data": dataList, "links": rowLink}
+
+
+def print_storage_hba_models(sheets_dict, model=None):
+    ##################################
+    # HBA Models
+    #TODO
+    if model is None: model = compute_storage_hba_models(sheets_dict)
+
+    add_p().add_run("")
+    add_percentage_table(document, model["data"], "[vHBA] Model/Type", None, "Table Grid", None, model["links"])
     return
 
 
-def print_storage_checks_and_hints(sheets_dict, compute_sizing_totals_row):
+# Storage Checks & Hints, see evaluate_checks
+root_partitions = ("Disk", "in", ['/', 'C:\\'])
+storage_checks = [
+    ("VMs with more than 20 disks (vInfo)", 'vInfo', [("Disks", ">", 20)]),
+    (("Disks between 1TiB and 2TiB (vDisk)", "Disks between 2TB and 4TB (vDisk)", "Disks between 4TB and 6TB (vDisk)",
+      "Disks with more than 6TB (vDisk)"), 'vDisk',
+     {"column": "Capacity_MiB", "edges": [1048576, 2097152, 4194304, 6291456, np.inf]}),
+    (("Partitions with less than 10 Mib free (vPartition)", "Partitions with less than 50 Mib free (vPartition)",
+      "Partitions with less than 100 Mib free (vPartition)"), 'vPartition',
+     {"column": "Free_MiB", "edges": [-np.inf, 10, 50, 100], "right": False, "cumulative": True}),
+    (("Root Partitions with less than 100 Mib free (vPartition)", "Root Partitions with less than 200 Mib free (vPartition)",
+      "Root Partitions with less than 500 Mib free (vPartition)"), 'vPartition',
+     {"column": "Free_MiB", "edges": [-np.inf, 100, 200, 500], "right": False, "cumulative": True,
+      "filter": [root_partitions]}),
+]
+
+
+def compute_storage_checks_and_hints(sheets_dict):
+    """
+    Compute phase of print_storage_checks_and_hints
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     # Storage Checks and Hints
     # #####################################################################################################################
-    storage_checks = {}
-    add_p().add_run("")
-
     total_number_of_Disks = str(count_rows(sheets_dict, 'vDisk'))
     total_number_of_Partitions = str(count_rows(sheets_dict, 'vPartition'))
 
-    key = "VMs with more than 20 disks (vInfo)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, 'vInfo', query_expr='Disks > 20')
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Disks between 1TiB and 2TiB (vDisk)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, 'vDisk',
-                                         query_expr='Capacity_MiB > 1048576 and Capacity_MiB <= 2097152')
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Disks between 2TB and 4TB (vDisk)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, 'vDisk',
-                                         query_expr='Capacity_MiB > 2097152 and Capacity_MiB <= 4194304')
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Disks between 4TB and 6TB (vDisk)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, 'vDisk',
-                                         query_expr='Capacity_MiB > 4194304 and Capacity_MiB <= 6291456')
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Disks with more than 6TB (vDisk)"
-    try:
-        large_disks = None
-        storage_checks[key] = count_rows(sheets_dict, 'vDisk', query_expr='Capacity_MiB > 6291456')
-        if storage_checks[key] > 0:
-            large_disks = get_rows(sheets_dict, 'vPartition', key_columns=['Annotation', 'Capacity_MiB', 'Disk'],
-                                   columns=['VM', 'Disk', 'Capacity_MiB', 'Annotation'],
-                                   query_expr='Capacity_MiB > 6291456')
-            large_disks.sort_values(by=['Capacity_MiB', 'Disk', 'Annotation'], ascending=False, inplace=True)
-            # print(large_disks.head(50))
-
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Partitions with less than 10 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition', query_expr="Free_MiB < 10")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Partitions with less than 50 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition', query_expr="Free_MiB < 50")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
-
-    key = "Partitions with less than 100 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition', query_expr="Free_MiB < 100")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
+    return {"checks": evaluate_checks(sheets_dict, storage_checks), "disks": total_number_of_Disks,
+            "partitions": total_number_of_Partitions}
 
-    key = "Root Partitions with less than 100 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition',
-                                         query_expr="(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 100")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
 
-    key = "Root Partitions with less than 200 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition',
-                                         query_expr="(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 200")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
+def print_storage_checks_and_hints(sheets_dict, sizing_totals, model=None):
+    if model is None: model = compute_storage_checks_and_hints(sheets_dict)
 
-    key = "Root Partitions with less than 500 Mib free (vPartition)"
-    try:
-        storage_checks[key] = count_rows(sheets_dict, sheet='vPartition',
-                                         query_expr="(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 500")
-    except Exception as ex:
-        storage_checks[key] = str(ex)
+    add_p().add_run("")
 
-    table = table_from_dict(storage_checks, document, True, None,
+    table = table_from_dict(model["checks"], document, True, None,
                             "Check", "Data", True, "Storage Checks & Hints")
 
-    # TODO: Avoid this ugly and crazy way to reuse information
-    total_number_of_VMs = compute_sizing_totals_row.cells[9].text
+    # sizing_totals are the print_compute_sizing totals row texts
+    total_number_of_VMs = sizing_totals[9]
 
     run = add_p().add_run("Reference:  Total VMs=" + total_number_of_VMs +
-                         "   Total Disks=" + total_number_of_Disks +
-                         "   Total Partitions=" + total_number_of_Partitions)
+                         "   Total Disks=" + model["disks"] +
+                         "   Total Partitions=" + model["partitions"])
     run.font.color.rgb = gray_color
 
     return
 
 
-def print_storage_large_disks(sheets_dict):
+def compute_storage_large_disks(sheets_dict):
+    """
+    Compute phase of print_storage_large_disks
+
+    :param sheets_dict: the global sheets dictionary
+    :return: render model
+    """
     ################################################################################
     # TOP Large Disks List
     ################################################################################
 
     # Retrieve information
     size = 4000000
+    top = 40
+    model = {"size": size, "top": top, "disks": None}
     large_disks = get_rows(sheets_dict, 'vPartition', key_columns=None,
                            columns=['VM', 'Disk', 'Capacity_MiB', 'Annotation'],
                            query_expr='Capacity_MiB > ' + str(size))
 
     if large_disks.size > 0:
-        large_disks.sort_values(by=['Capacity_MiB', 'Disk', 'Annotation'], ascending=False, inplace=True)
-
-        ldisks = []
-        pre_vm = ''
-        pre_disk = ''
-        pre_capacity = ''
-        pre_annotation = ''
-        vm = ''
-        count = 1
-
-        # Add headers
-        ldisks.append(["Disk", "GiB", "VMs", "Annotations", "Cnt"])
-
-        # Add content
-        for index, row in large_disks.iterrows():
-            disk = row['Disk']
-            capacity = f'{int(int(row["Capacity_MiB"]) / 1024):n}'
-            vm = row['VM']
-            annotation = row['Annotation']
-
-            if pre_capacity != capacity or pre_disk != disk:
-                if pre_disk != '':  # do not add the first empty element
-                    ldisks.append([pre_disk, pre_capacity, pre_vm, pre_annotation, count])
-                pre_vm = ''
-                count = 1
-            else:
-                count += 1
+        keys = ['GiB', 'Disk']
+        large_disks = large_disks.assign(GiB=large_disks['Capacity_MiB'].astype('int64') // 1024)
+
+        # Top (GiB, Disk) groups: nlargest keeps the ties, so only those few groups need sorting
+        groups = large_disks[keys].drop_duplicates()
+        groups = groups.nlargest(top, 'GiB', keep='all').sort_values(by=keys, ascending=False).head(top)
+
+        # VMs and annotation of the top groups only
+        top_disks = large_disks.merge(groups, on=keys)
+        top_disks = top_disks.sort_values(by=keys + ['Capacity_MiB', 'Annotation'], ascending=False)
+        top_disks = top_disks.groupby(keys, observed=True, sort=False).agg(
+            VMs=('VM', lambda vms: ' '.join(vms) + ' '),
+            Annotation=('Annotation', lambda notes: next((n for n in reversed(notes.tolist()) if len(str(n)) > 5), '')),
+            Count=('VM', 'size')).reset_index()
 
-            pre_disk = disk
-            pre_capacity = capacity
-            pre_vm = pre_vm + vm + ' '
-            if len(str(annotation)) > 5: pre_annotation = annotation
+        ldisks = [["Disk", "GiB", "VMs", "Annotations", "Cnt"]]
+        ldisks += [[disk, f'{gib:n}', vms, annotation, count] for disk, gib, vms, annotation, count in
+                   zip(top_disks['Disk'].tolist(), top_disks['GiB'].tolist(), top_disks['VMs'].tolist(),
+                       top_disks['Annotation'].tolist(), top_disks['Count'].tolist())]
+        model["disks"] = ldisks
 
-        ldisks.append([pre_disk, pre_capacity, pre_vm, pre_annotation, count])
+    return model
 
+
+def print_storage_large_disks(sheets_dict, model=None):
+    if model is None: model = compute_storage_large_disks(sheets_dict)
+
+    size = model["size"]
+    ldisks = model["disks"]
+    if ldisks is not None:
         # Write to DOC
-        if large_disks is not None:
-            top = 40
-            add_p().add_run("")
-
-            L = WD_ALIGN_PARAGRAPH.LEFT
-            R = WD_ALIGN_PARAGRAPH.RIGHT
-            table = table_from_list(ldisks[:top], document, True, [100, 35, 170, 170, 25], [L, R, L, L, R],
-                                    "[vPartition] Top " + str(
-                                        top) + " large disks greater than " + f'{int(int(size / 1000)):n}' + " GiB")
-
-            # Adjust fonts and lengths
-            # 0:Disk - 1:Capacity - 2:VMs - 3:Annotations - 4:Count
-            count = 0
-            max_len = 130
-            for row in table.rows:
-                count += 1
-                if count > 2:  # jump headers
-                    for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
-
-                    if len(str(row.cells[0].text)) > 22: row.cells[0].paragraphs[0].runs[0].font.size = Pt(7)
-                    if len(str(row.cells[0].text)) > 26: row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
-
-                    if len(str(row.cells[2].text)) > max_len: row.cells[2].text = row.cells[2].text[0:max_len] + "..."
-                    if len(str(row.cells[2].text)) > 70: row.cells[2].paragraphs[0].runs[0].font.size = Pt(7)
-                    if len(str(row.cells[2].text)) > 120: row.cells[2].paragraphs[0].runs[0].font.size = Pt(6)
-
-                    if len(str(row.cells[3].text)) > max_len: row.cells[3].text = row.cells[3].text[0:max_len] + "..."
-                    if len(str(row.cells[3].text)) > 70: row.cells[3].paragraphs[0].runs[0].font.size = Pt(7)
-                    if len(str(row.cells[3].text)) > 100: row.cells[3].paragraphs[0].runs[0].font.size = Pt(6)
+        top = model["top"]
+        add_p().add_run("")
+
+        L = WD_ALIGN_PARAGRAPH.LEFT
+        R = WD_ALIGN_PARAGRAPH.RIGHT
+        table = table_from_list(ldisks[:top], document, True, [100, 35, 170, 170, 25], [L, R, L, L, R],
+                                "[vPartition] Top " + str(
+                                    top) + " large disks greater than " + f'{int(int(size / 1000)):n}' + " GiB")
+
+        # Adjust fonts and lengths
+        # 0:Disk - 1:Capacity - 2:VMs - 3:Annotations - 4:Count
+        count = 0
+        max_len = 130
+        for row in table.rows:
+            count += 1
+            if count > 2:  # jump headers
+                for cell in row.cells: cell.paragraphs[0].runs[0].font.size = Pt(8)
+
+                if len(str(row.cells[0].text)) > 22: row.cells[0].paragraphs[0].runs[0].font.size = Pt(7)
+                if len(str(row.cells[0].text)) > 26: row.cells[0].paragraphs[0].runs[0].font.size = Pt(6)
+
+                if len(str(row.cells[2].text)) > max_len: row.cells[2].text = row.cells[2].text[0:max_len] + "..."
+                if len(str(row.cells[2].text)) > 70: row.cells[2].paragraphs[0].runs[0].font.size = Pt(7)
+                if len(str(row.cells[2].text)) > 120: row.cells[2].paragraphs[0].runs[0].font.size = Pt(6)
+
+                if len(str(row.cells[3].text)) > max_len: row.cells[3].text = row.cells[3].text[0:max_len] + "..."
+                if len(str(row.cells[3].text)) > 70: row.cells[3].paragraphs[0].runs[0].font.size = Pt(7)
+                if len(str(row.cells[3].text)) > 100: row.cells[3].paragraphs[0].runs[0].font.size = Pt(6)
     else:
         add_p().add_run("There are no Disks greater than " + f'{int(int(size / 1000)):n}' + " GiB")
 
     return
 
 
-def print_anonymize_data(document, data):
+# Report sections compute phase, see compute_report_sections. Render (print_*) functions are called from main
+report_sections = {
+    "versions": compute_versions,
+    "vmw_products": compute_vmw_products,
+    "compute_sizing": compute_compute_sizing,
+    "memory_ranks": compute_memory_ranks,
+    "compute_checks_and_hints": compute_compute_checks_and_hints,
+    "networking": compute_networking,
+    "network_terms": compute_network_terms,
+    "workload_terms": compute_workload_terms,
+    "appliances_n_OVA_annotations": compute_appliances_n_OVA_annotations,
+    "operating_systems": compute_operating_systems,
+    "storage_models": compute_storage_models,
+    "storage_capacity": compute_storage_capacity,
+    "storage_connections": compute_storage_connections,
+    "storage_vms_per_disk_controller": compute_storage_vms_per_disk_controller,
+    "storage_multiple_controllers": compute_storage_multiple_controllers,
+    "storage_hba_models": compute_storage_hba_models,
+    "storage_checks_and_hints": compute_storage_checks_and_hints,
+    "storage_large_disks": compute_storage_large_disks,
+}
+report_sections_data = {}  # sheets_dict used by compute_report_section workers
+
+
+def compute_report_section(name):
     """
-    Print anonymize information to revert it
-    :param document:
-    :param data:
-    :return:
+    Run the compute phase of a report section (worker function of compute_report_sections)
+
+    When profiling, the section is recorded as "compute <name>" apart from the caller thread section,
+    and returned, since forked processes can't add it to the parent profile records.
+
+    The columns used but not loaded with --projection and the section memoized results hits and
+    misses are returned too, for the same reason.
+
+    :param name: report_sections key
+    :return: the section render model, the section profile (see profile_take) or None, the
+             projection_check (sheet, column) pairs and the section memo_stats
     """
-    ##########################################################
-    # %%% PRINT Anonymization information
-    if data is not None:
-        document.add_page_break()
-        document.add_heading("DataCenter/Cluster Masking Table", 1)
-        # mylist=[["Original","Mask"]]
-        mylist = []
+    memo_thread.stats = {"hits": 0, "misses": 0}
+    try:
+        if not profile_state["on"]:
+            model = report_sections[name](report_sections_data["sheets_dict"])
+            with projection_lock: return model, None, set(projection_state["unprojected"]), memo_thread.stats
+
+        caller = profile_current()
+        profile_restart()
+        try:
+            model = report_sections[name](report_sections_data["sheets_dict"])
+            profile = profile_take("compute " + name)
+            with projection_lock: return model, profile, set(projection_state["unprojected"]), memo_thread.stats
+        finally:
+            profile_thread.state = caller
+    finally:
+        memo_thread.stats = None
+
+
+def compute_report_sections(sheets_dict, jobs=1):
+    """
+    Run the compute phase of all the report sections. Sections only read the combined sheets, so
+    they run in parallel: in forked processes when available (they inherit the combined sheets,
+    only the small render models are sent back) or else in threads.
+    The render phase (print_* functions) must be called afterwards in the report order.
+    When profiling, each section profile is added in the report order (cpu time and memory of sections
+    computed in threads are the whole process ones). The sections memoized results hits and misses are
+    added to memo_stats.
 
-        anonym_datacenter = data.get("datacenter")
-        # print(anonym_datacenter)
-        for key in anonym_datacenter.keys():
-            row = [key, anonym_datacenter[key]]
-            mylist.append(row)
+    :param sheets_dict: the global sheets dictionary
+    :param jobs: number of parallel sections, 1 to compute them sequentially, 0 for all cpus
+    :return: dictionary of section name: render model
+    """
+    report_sections_data["sheets_dict"] = sheets_dict
+    names = list(report_sections.keys())
+    if jobs < 1: jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(names))
+
+    if jobs <= 1:
+        results = list(map(compute_report_section, names))
+    else:
+        if "fork" in multiprocessing.get_all_start_methods():
+            executor = ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("fork"))
+        else:
+            executor = ThreadPoolExecutor(jobs)
+        with executor:
+            results = list(executor.map(compute_report_section, names))
 
-        anonym_cluster = data.get("cluster")
-        # print(anonym_cluster)
-        for key in anonym_cluster.keys():
-            row = [key, anonym_cluster[key]]
-            mylist.append(row)
+    for model, profile, unprojected, stats in results:
+        with projection_lock: projection_state["unprojected"].update(unprojected)
+        with memo_lock:
+            for key in memo_stats.keys(): memo_stats[key] += stats[key]
+        if profile is None: continue
+        profile_sections.append(profile[0])
+        profile_calls.extend(profile[1])
 
-        # print(mylist)
-        table = table_from_list(mylist, document, True, None, None)
+    return dict(zip(names, [model for model, profile, unprojected, stats in results]))
+
+
+def write_anonymize_data(file_base, data):
+    """
+    Write the anonymization masks as file_base.csv (identifier, original name, mask) to revert them.
+    It is never added to the report, which is meant to be shared, and only the owner can read it
+
+    :param file_base: output file path without extension
+    :param data: anonymize_names result, nothing is written if None
+    :return: None
+    """
+    if data is None: return
+
+    path = file_base + ".csv"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", newline="") as f:
+        os.chmod(path, 0o600)  # the mode is only set when the file is created
+        writer = csv.writer(f)
+        writer.writerow(["Identifier", "Original", "Mask"])
+        for identifier, masks in data.items():
+            for name, mask in masks.items(): writer.writerow([identifier, name, mask])
+    print("Masking table (keep it private): " + file_base + ".csv")
 
-        return
 
 def main():
     import os
 
     # Get the arguments from the command-line except the filename
-    argv = sys.argv
+    options = {"jobs": 1, "cache": False, "cache-clear": False, "projection": False, "streaming": False, "category-threshold": 0.5,
+               "search-index": False, "profile": False, "anonymize": False, "sql": False}
+    argv = parse_options(sys.argv, options)
     path = None
     print("rvt2doc Version:" + str(version))
-    if len(sys.argv) < 2:
+    if options["cache-clear"]:
+        cache_clear()
+        if len(argv) < 2: exit()
+    if len(argv) < 2:
         print("Parameters:")
         print(
             "   Param1: Path_to_a_folder containing the *.xlsx and/or *.xlsm files to be processed. Use '.' for current folder")
         print('   Param2 (Optional): name of the resulting file. "rvtools.docx" by default')
+        print("Options:")
+        print("   --jobs N: number of processes loading spreadsheets and computing report sections in parallel."
+              " 1 by default, 0 for all cpus")
+        print("   --cache: read and write the loaded spreadsheets from a per-user cache (" + cache_folder() + ")."
+              " Next runs on the same spreadsheets start faster")
+        print("   --cache-clear: remove all the cached spreadsheets, then run the report if a folder is given")
+        print("   --projection: load only the sheets and columns used by the report. Reduces memory and load time")
+        print("   --streaming: read spreadsheets row by row. Reduces memory on very large sheets")
+        print("   --category-threshold R: store text columns with less than R unique values per row as categories."
+              " 0.5 by default, 0 to disable")
+        print("   --search-index: index the words of text columns once, so term searches don't scan the columns")
+        print("   --profile: record time, memory and rows of each report section and data helper call."
+              " Writes <output>.profile.json and .csv")
+        print("   --anonymize: mask Datacenter, Cluster, Host and VM names. The masking table is written to"
+              " <output>.masks.csv, not to the report")
+        print("   --sql: run the sheet sums, counts, groupings and percentages as SQL on an in-process database"
+              " (DuckDB if installed, else SQLite)")
         # argv.append("/home/marmendo/Documentos/PROYECTOS/FeasibilityReport/Customers/ACME/RVTools")
         exit()
 
     path = argv[1]
 
-    if len(sys.argv) > 2:
+    if len(argv) > 2:
         output_file = argv[2]
     else:
         output_file = "./rvtools.docx"
 
-    lapse(on=False)
+    lapse(on=False, profile=options["profile"])
 
     #######################
     # GLOBAL VARS
@@ -2868,71 +4587,108 @@ def main():
     pd.options.display.max_columns = 20
     pd.options.display.width = 2000
     pd.set_option("display.expand_frame_repr", True)
-    anonymize = False  # TODO: anonymize doesn't work as expected... yet
+    enable_copy_on_write()
 
-    sheets_dict = load_spreadsheets(path)
+    sheets_dict = load_spreadsheets(path, options["jobs"], options["cache"], options["projection"],
+                                    options["streaming"])
     lapse("load_spreadsheets()")
+    build_sheets_registry(sheets_dict, options["category-threshold"])
+    print(str(len(sheets_registry)) + " sheets combined (" +
+          "{:.1f}".format(sum(sheets_registry_memory().values()) / 1048576) + " MiB)")
+    lapse("build_sheets_registry()")
     clean_and_fix_data(sheets_dict)
     lapse("clean_and_fix_data()")
-    anonymize_data = anonymize_names(sheets_dict, anonymize)
+    anonymize_data = anonymize_names(sheets_dict, options["anonymize"])
     lapse("anonymize_names()")
+    if options["search-index"]:
+        build_search_index(sheets_dict)
+        lapse("build_search_index()")
+    if options["sql"]:
+        print("SQL backend: " + sql_open())
+
+    # Compute all the sections first (in parallel with --jobs), then render them in order
+    models = compute_report_sections(sheets_dict, options["jobs"])
+    lapse("compute_report_sections()")
+    if len(projection_state["unprojected"]) > 0:
+        print("ERROR: Report not written, it uses sheet columns not loaded with --projection (see above)")
+        exit(1)
 
     # TODO print_initialize should initialize and return "document"
     print_initialize(document)
+    stream_document(output_file)  # sections body is flushed to disk as they are rendered, see flush_document
+    flush_document()
     lapse("print_initialize()")
 
-    print_versions(sheets_dict)
+    print_versions(sheets_dict, models["versions"])
+    flush_document()
     lapse("print_versions()")
 
-    print_vmw_products(sheets_dict)
+    print_vmw_products(sheets_dict, models["vmw_products"])
+    flush_document()
     lapse("print_vmw_products()")
 
-    compute_sizing_totals_row = print_compute_sizing(sheets_dict)
+    compute_sizing_totals_row = print_compute_sizing(sheets_dict, models["compute_sizing"])
+    flush_document()
     lapse("compute_sizing_totals_row()")
 
-    print_memory_ranks(sheets_dict)
+    print_memory_ranks(sheets_dict, models["memory_ranks"])
+    flush_document()
     lapse("print_memory_ranks()")
 
-    print_compute_checks_and_hints(sheets_dict, compute_sizing_totals_row)
+    print_compute_checks_and_hints(sheets_dict, compute_sizing_totals_row, models["compute_checks_and_hints"])
+    flush_document()
     lapse("print_compute_checks_and_hints()")
 
-    print_networking(sheets_dict)
+    print_networking(sheets_dict, models["networking"])
+    flush_document()
     lapse("print_networking()")
 
-    print_network_terms(sheets_dict)
+    print_network_terms(sheets_dict, models["network_terms"])
+    flush_document()
     lapse("print_network_terms()")
 
-    print_workload_terms(sheets_dict)
+    print_workload_terms(sheets_dict, models["workload_terms"])
+    flush_document()
     lapse("print_workload_terms()")
 
-    print_appliances_n_OVA_annotations(sheets_dict)
+    print_appliances_n_OVA_annotations(sheets_dict, models["appliances_n_OVA_annotations"])
+    flush_document()
     lapse("print_appliances_n_OVA_annotations()")
 
-    print_operating_systems(sheets_dict)
+    print_operating_systems(sheets_dict, models["operating_systems"])
+    flush_document()
     lapse("print_operating_systems()")
 
-    print_storage_models(sheets_dict)
+    print_storage_models(sheets_dict, models["storage_models"])
+    flush_document()
     lapse("print_storage_models()")
 
-    print_storage_capacity(sheets_dict)
+    print_storage_capacity(sheets_dict, models["storage_capacity"])
+    flush_document()
     lapse("print_storage_capacity()")
 
-    print_storage_connections(sheets_dict)
+    print_storage_connections(sheets_dict, models["storage_connections"])
+    flush_document()
     lapse("print_storage_connections()")
 
-    print_storage_vms_per_disk_controller(sheets_dict)
+    print_storage_vms_per_disk_controller(sheets_dict, models["storage_vms_per_disk_controller"])
+    flush_document()
     lapse("print_storage_vms_per_disk_controller()")
 
-    print_storage_multiple_controllers(sheets_dict)
+    print_storage_multiple_controllers(sheets_dict, models["storage_multiple_controllers"])
+    flush_document()
     lapse("print_storage_multiple_controllers()")
 
-    print_storage_hba_models(sheets_dict)
+    print_storage_hba_models(sheets_dict, models["storage_hba_models"])
+    flush_document()
     lapse("print_storage_hba_models()")
 
-    print_storage_checks_and_hints(sheets_dict, compute_sizing_totals_row)
+    print_storage_checks_and_hints(sheets_dict, compute_sizing_totals_row, models["storage_checks_and_hints"])
+    flush_document()
     lapse("print_storage_checks_and_hints()")
 
-    print_storage_large_disks(sheets_dict)
+    print_storage_large_disks(sheets_dict, models["storage_large_disks"])
+    flush_document()
     lapse("print_storage_large_disks()")
 
 
@@ -2945,15 +4701,14 @@ def main():
         p = add_p()
         for warn in warns: p.add_run(warn + "\n")
 
-    ##########################################################
-    # %%% PRINT ANONYMIZE DATA
-    print_anonymize_data(document, anonymize_data)
-
     ##########################################################
     # %%% WRITE REPORT FILE
-    keep_table_on_one_page(document)
-    document.save(output_file)
+    save_document(output_file)
     print("File saved: " + output_file)
+    lapse("document.save()")
+
+    if options["profile"]: write_profile(os.path.splitext(output_file)[0] + ".profile")
+    write_anonymize_data(os.path.splitext(output_file)[0] + ".masks", anonymize_data)
 
     ##########################################################
     # Don't delete this line. See cols_prepare
@@ -2962,4 +4717,6 @@ def main():
     return
 
 
-main()
+if __name__ == '__main__':
+    freeze_support()  # required by process pools on frozen (pyinstaller) Windows binaries
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# rvt2doc is a single script, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rvt2doc  # noqa: E402
+
+
+@pytest.fixture
+def registry():
+    """
+    Build the combined sheets registry from {sheet: DataFrame}, as loaded from a single spreadsheet.
+    The module state (registry, memoized results, search index, SQL backend) is reset afterwards
+    """
+
+    def build(sheets, category_threshold=0.5):
+        sheets_dict = {sheet + "@test.xlsx": df for sheet, df in sheets.items()}
+        rvt2doc.build_sheets_registry(sheets_dict, category_threshold)
+        return sheets_dict
+
+    yield build
+    rvt2doc.sheets_registry.clear()
+    rvt2doc.memo_cache.clear()
+    rvt2doc.search_index.clear()
+    rvt2doc.sql_database["engine"] = None
+    rvt2doc.projection_state.update({"on": False, "unprojected": set()})
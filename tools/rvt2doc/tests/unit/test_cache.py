@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import rvt2doc
+
+
+@pytest.fixture
+def spreadsheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(rvt2doc, "cache_folder", lambda: str(tmp_path / "cache"))
+    paths = []
+    for i in range(3):
+        path = tmp_path / ("rvtools" + str(i) + ".xlsx")
+        path.write_bytes(b"spreadsheet " + str(i).encode() * 1000)
+        paths.append(str(path))
+    return paths
+
+
+def sheets(i):
+    return [("vInfo@rvtools" + str(i) + ".xlsx", pd.DataFrame({"VM": ["vm" + str(i)], "CPUs": [i]}))]
+
+
+def entry_size(path):
+    return sum(os.path.getsize(p) for p in rvt2doc.cache_paths(path))
+
+
+def test_cache_write_and_read(spreadsheets):
+    signature = rvt2doc.cache_signature()
+    rvt2doc.cache_write(spreadsheets[0], sheets(0), signature)
+
+    (key, df), = rvt2doc.cache_read(spreadsheets[0], signature)
+    assert key == "vInfo@rvtools0.xlsx"
+    assert_frame_equal(df, sheets(0)[0][1])
+    assert rvt2doc.cache_read(spreadsheets[0], rvt2doc.cache_signature(projection=True)) is None
+    assert rvt2doc.cache_read(spreadsheets[1], signature) is None
+
+
+def test_cache_read_ignores_data_of_another_write(spreadsheets):
+    index_path, data_path = rvt2doc.cache_paths(spreadsheets[0])
+    rvt2doc.cache_write(spreadsheets[0], sheets(0), rvt2doc.cache_signature(projection=True))
+    shutil.copy(data_path, data_path + ".old")
+    rvt2doc.cache_write(spreadsheets[0], sheets(0), rvt2doc.cache_signature())
+    # a run writing the data file while another one writes the index
+    os.replace(data_path + ".old", data_path)
+
+    assert rvt2doc.cache_read(spreadsheets[0], rvt2doc.cache_signature()) is None
+
+
+def test_cache_read_ignores_changed_spreadsheets(spreadsheets):
+    signature = rvt2doc.cache_signature()
+    rvt2doc.cache_write(spreadsheets[0], sheets(0), signature)
+    stat = os.stat(spreadsheets[0])
+
+    os.utime(spreadsheets[0], (stat.st_atime, stat.st_mtime + 10))  # same content
+    assert rvt2doc.cache_read(spreadsheets[0], signature) is not None
+    with open(spreadsheets[0], "r+b") as f: f.write(b"S")  # same size
+    assert rvt2doc.cache_read(spreadsheets[0], signature) is None
+
+
+def test_cache_evict_least_recently_used(spreadsheets):
+    signature = rvt2doc.cache_signature()
+    for i, path in enumerate(spreadsheets):
+        rvt2doc.cache_write(path, sheets(i), signature)
+        for cache_path in rvt2doc.cache_paths(path): os.utime(cache_path, (1000 + i, 1000 + i))
+    rvt2doc.cache_read(spreadsheets[0], signature)  # the oldest entry is used again
+
+    rvt2doc.cache_evict([spreadsheets[2]], entry_size(spreadsheets[0]) + entry_size(spreadsheets[2]))
+
+    assert [rvt2doc.cache_read(path, signature) is not None for path in spreadsheets] == [True, False, True]
+
+
+def test_cache_evict_keeps_the_loaded_spreadsheets(spreadsheets):
+    signature = rvt2doc.cache_signature()
+    for i, path in enumerate(spreadsheets): rvt2doc.cache_write(path, sheets(i), signature)
+    open(rvt2doc.cache_paths(spreadsheets[1])[1] + ".tmp", "wb").close()  # left by an interrupted run
+
+    rvt2doc.cache_evict(spreadsheets[:2], 0)
+
+    assert sorted(len(paths) for paths in rvt2doc.cache_entries().values()) == [2, 3]
+    assert [rvt2doc.cache_read(path, signature) is not None for path in spreadsheets] == [True, True, False]
+
+
+def test_cache_clear(spreadsheets):
+    signature = rvt2doc.cache_signature()
+    for i, path in enumerate(spreadsheets): rvt2doc.cache_write(path, sheets(i), signature)
+
+    rvt2doc.cache_clear()
+
+    assert rvt2doc.cache_entries() == {}
+    assert os.path.isdir(rvt2doc.cache_folder())
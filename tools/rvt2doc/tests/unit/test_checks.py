@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rvt2doc
+
+# count_rows queries the checks replaced, in report order
+check_queries = {
+    "Clusters with less than 3 hosts (vCluster)": ('vCluster', "NumHosts < 3"),
+    "VMs with CBT not activated (vInfo)": ('vInfo', "CBT!=True"),
+    "Hosts with more than 64 cores (vHost)": ('vHost', "N_Cores > 64"),
+    "Hosts with more than 128 cores (vHost)": ('vHost', "N_Cores > 128"),
+    "VMs with CPU HotAdd (vCPU)": ('vCPU', "Hot_Add == True"),
+    "VMs with RAM btw 2TB and 6TB (vInfo)": ('vInfo', "Memory >= 200000 and Memory <= 600000"),
+    "VMs with RAM greater than 6TB (vInfo)": ('vInfo', "Memory > 600000"),
+    "VMs with memory HotAdd (vMemory)": ('vMemory', "Hot_Add == True"),
+    "VMs with Ballooned memory (vMemory)": ('vMemory', "Ballooned == True"),
+    "VMs with more than 20 disks (vInfo)": ('vInfo', "Disks > 20"),
+    "Disks between 1TiB and 2TiB (vDisk)": ('vDisk', "Capacity_MiB > 1048576 and Capacity_MiB <= 2097152"),
+    "Disks between 2TB and 4TB (vDisk)": ('vDisk', "Capacity_MiB > 2097152 and Capacity_MiB <= 4194304"),
+    "Disks between 4TB and 6TB (vDisk)": ('vDisk', "Capacity_MiB > 4194304 and Capacity_MiB <= 6291456"),
+    "Disks with more than 6TB (vDisk)": ('vDisk', "Capacity_MiB > 6291456"),
+    "Partitions with less than 10 Mib free (vPartition)": ('vPartition', "Free_MiB < 10"),
+    "Partitions with less than 50 Mib free (vPartition)": ('vPartition', "Free_MiB < 50"),
+    "Partitions with less than 100 Mib free (vPartition)": ('vPartition', "Free_MiB < 100"),
+    "Root Partitions with less than 100 Mib free (vPartition)":
+        ('vPartition', "(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 100"),
+    "Root Partitions with less than 200 Mib free (vPartition)":
+        ('vPartition', "(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 200"),
+    "Root Partitions with less than 500 Mib free (vPartition)":
+        ('vPartition', "(Disk == '/' or Disk == 'C:\\\\') and Free_MiB < 500"),
+}
+
+
+def around(*edges):
+    """
+    Each edge and the floats right before and after it
+    """
+    return [value for edge in edges for value in (np.nextafter(edge, -np.inf), edge, np.nextafter(edge, np.inf))]
+
+
+@pytest.fixture(params=[0.5, 0], ids=["categorical", "plain"])
+def sheets_dict(request, registry):
+    memory = around(200000, 600000) + [0, 1024, 300000, 1e7, np.nan, np.nan]
+    capacity = around(1048576, 2097152, 4194304, 6291456) + [0, 512, 3e6, 1e8, np.nan]
+    free = around(10, 50, 100, 200, 500) + [-5, 0, 1e6, np.nan, np.nan, 75, 150]
+    disks = (["/", "C:\\", "/home", "D:\\", None] * len(free))[:len(free)]
+    vpartition = pd.DataFrame({"VM": ["vm" + str(i) for i in range(len(free))], "Disk": disks, "Free_MiB": free})
+    # rows without data are not counted
+    vpartition.loc[len(vpartition)] = [None, None, np.nan]
+    return registry({
+        "vInfo": pd.DataFrame({"VM": ["vm" + str(i) for i in range(len(memory))], "Memory": memory}),
+        "vDisk": pd.DataFrame({"VM": ["vm" + str(i) for i in range(len(capacity))], "Capacity_MiB": capacity}),
+        "vPartition": vpartition,
+    }, category_threshold=request.param)
+
+
+@pytest.mark.parametrize("checks", [rvt2doc.compute_checks, rvt2doc.storage_checks], ids=["compute", "storage"])
+def test_evaluate_checks_bands_match_count_rows(sheets_dict, checks):
+    results = rvt2doc.evaluate_checks(sheets_dict, checks)
+    bands = [key for keys, sheet, predicate in checks if isinstance(predicate, dict) for key in keys]
+
+    assert bands
+    for key in bands:
+        sheet, query = check_queries[key]
+        assert results[key] == rvt2doc.count_rows(sheets_dict, sheet, query_expr=query), key
+
+
+def count_rows_or_error(sheets_dict, sheet, query):
+    try:
+        return rvt2doc.count_rows(sheets_dict, sheet, query_expr=query)
+    except Exception as ex:
+        return str(ex)
+
+
+@pytest.mark.parametrize("category_threshold", [0.5, 0], ids=["categorical", "plain"])
+def test_checks_tables_match_count_rows(registry, category_threshold):
+    sheets_dict = registry({
+        "vCluster": pd.DataFrame({"Name": ["CL-A", "CL-B", "CL-C", "CL-D"], "NumHosts": [1, 3, 2, np.nan]}),
+        "vInfo": pd.DataFrame({"VM": ["vm1", "vm2", "vm3", "vm4", "vm5"], "CBT": [True, False, None, True, False],
+                               "Memory": [4096, 200000, 600000, 600001, np.nan], "Disks": [1, 20, 21, 40, np.nan]}),
+        "vHost": pd.DataFrame({"Host": ["esx1", "esx2", "esx3", "esx4"], "N_Cores": [64, 65, 128, 256]}),
+        "vCPU": pd.DataFrame({"VM": ["vm1", "vm2"], "Hot_Remove": [True, False]}),  # Hot_Add missing
+        "vMemory": pd.DataFrame({"VM": ["vm1", "vm2", "vm3"], "Hot_Add": [True, False, True],
+                                 "Ballooned": [False, None, True]}),
+        "vDisk": pd.DataFrame({"VM": ["vm1", "vm2", "vm3"], "Capacity_MiB": [1048576, 1048577, 7e6]}),
+        "vPartition": pd.DataFrame({"VM": ["vm1", "vm2", "vm3", "vm4"], "Disk": ["/", "C:\\", "/data", "/"],
+                                    "Free_MiB": [5, 150, 5, 400]}),
+    }, category_threshold=category_threshold)
+
+    compute = rvt2doc.compute_compute_checks_and_hints(sheets_dict)
+    storage = rvt2doc.compute_storage_checks_and_hints(sheets_dict)
+
+    assert list(compute.keys()) + list(storage["checks"].keys()) == list(check_queries.keys())
+    for key, count in list(compute.items()) + list(storage["checks"].items()):
+        assert count == count_rows_or_error(sheets_dict, *check_queries[key]), key
+    assert isinstance(compute["VMs with CPU HotAdd (vCPU)"], str)
+    assert compute["VMs with CBT not activated (vInfo)"] == 3  # empty values are not True
+    assert (storage["disks"], storage["partitions"]) == ("3", "4")
+
+
+@pytest.mark.parametrize("right", [True, False])
+@pytest.mark.parametrize("cumulative", [False, True])
+def test_bucket_counts_df_edges(right, cumulative):
+    edges = [-np.inf, 10, 50, 100, np.inf]
+    df = pd.DataFrame({"Free_MiB": around(10, 50, 100) + [-1e9, 1e9, np.nan, -np.inf, np.inf]})
+    values = df["Free_MiB"]
+
+    expected = []
+    for low, high in zip(edges, edges[1:]):
+        band = (values > low) & (values <= high) if right else (values >= low) & (values < high)
+        expected.append(int(band.sum()))
+    if cumulative: expected = np.cumsum(expected).tolist()
+
+    assert rvt2doc.bucket_counts_df(df, "Free_MiB", edges, right=right, cumulative=cumulative) == expected
+
+
+def test_bucket_counts_df_filter_and_rows():
+    df = pd.DataFrame({"Disk": ["/", "C:\\", "/home", None, "/", "/"],
+                       "Free_MiB": [5.0, 150.0, 5.0, 5.0, np.nan, 100.0]})
+    edges = [-np.inf, 100, 200]
+
+    assert rvt2doc.bucket_counts_df(df, "Free_MiB", edges, right=False) == [3, 2]
+    assert rvt2doc.bucket_counts_df(df, "Free_MiB", edges, right=False, filter=[rvt2doc.root_partitions]) == [1, 2]
+    rows = np.array([False, True, True, True, True, True])
+    assert rvt2doc.bucket_counts_df(df, "Free_MiB", edges, right=False, filter=[rvt2doc.root_partitions],
+                                    cumulative=True, rows=rows) == [0, 2]
+
+
+def test_evaluate_checks_bands_report_missing_columns(registry):
+    sheets_dict = registry({"vDisk": pd.DataFrame({"VM": ["vm1", "vm2"], "Path": ["a", "b"]})})
+    checks = [(("a", "b"), 'vDisk', {"column": "Capacity_MiB", "edges": [0, 1, 2]})]
+    results = rvt2doc.evaluate_checks(sheets_dict, checks)
+
+    with pytest.raises(pd.errors.UndefinedVariableError) as error:
+        rvt2doc.count_rows(sheets_dict, 'vDisk', query_expr="Capacity_MiB > 0")
+    assert results == {"a": str(error.value), "b": str(error.value)}
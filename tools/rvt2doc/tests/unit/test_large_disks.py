@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rvt2doc
+
+
+def large_disks_loop(sheets_dict, size=4000000):
+    """
+    The iterrows loop compute_storage_large_disks replaced
+    """
+    large_disks = rvt2doc.get_rows(sheets_dict, 'vPartition', key_columns=None,
+                                   columns=['VM', 'Disk', 'Capacity_MiB', 'Annotation'],
+                                   query_expr='Capacity_MiB > ' + str(size))
+    large_disks = large_disks.sort_values(by=['Capacity_MiB', 'Disk', 'Annotation'], ascending=False)
+
+    ldisks = [["Disk", "GiB", "VMs", "Annotations", "Cnt"]]
+    pre_vm = pre_disk = pre_capacity = pre_annotation = ''
+    count = 1
+    for index, row in large_disks.iterrows():
+        disk = row['Disk']
+        capacity = f'{int(int(row["Capacity_MiB"]) / 1024):n}'
+        if pre_capacity != capacity or pre_disk != disk:
+            if pre_disk != '': ldisks.append([pre_disk, pre_capacity, pre_vm, pre_annotation, count])
+            pre_vm = ''
+            count = 1
+        else:
+            count += 1
+        pre_disk = disk
+        pre_capacity = capacity
+        pre_vm = pre_vm + row['VM'] + ' '
+        if len(str(row['Annotation'])) > 5: pre_annotation = row['Annotation']
+    ldisks.append([pre_disk, pre_capacity, pre_vm, pre_annotation, count])
+    return ldisks
+
+
+def partitions(rows):
+    return pd.DataFrame(rows, columns=["VM", "Disk", "Capacity_MiB", "Annotation"])
+
+
+@pytest.fixture(params=[0.5, 0], ids=["categorical", "plain"])
+def category_threshold(request):
+    return request.param
+
+
+def test_large_disks_matches_loop(registry, category_threshold):
+    # one disk per GiB, more groups than the top
+    rows = [("vm" + str(i), "/data" + str(i % 3), 4100000 + i * 2048 + i % 2, "annotation " + str(i))
+            for i in range(60)]
+    rows += [("vm" + str(i), "/data" + str(i % 3), 4100000 + (i - 60) * 2048 + 1, np.nan) for i in range(60, 80, 3)]
+    rows += [("small" + str(i), "/", 4000000 - i, "too small") for i in range(5)]
+    sheets_dict = registry({"vPartition": partitions(rows)}, category_threshold=category_threshold)
+
+    model = rvt2doc.compute_storage_large_disks(sheets_dict)
+
+    top = model["top"]
+    assert len(model["disks"]) == top + 1
+    assert model["disks"][:top] == large_disks_loop(sheets_dict)[:top]  # rows rendered
+
+
+def test_large_disks_merges_interleaved_rows(registry, category_threshold):
+    # the same GiB of /data and /logs: sorted by MiB their rows interleave, the loop listed /data twice
+    sheets_dict = registry({"vPartition": partitions([
+        ("vm1", "/data", 5000000, "database server"),
+        ("vm2", "/logs", 5000005, "log collector"),
+        ("vm3", "/data", 5000010, np.nan),
+        ("vm4", "/data", 6000000, "big"),
+        ("vm5", "/data", 6000001, "archive server"),
+    ])}, category_threshold=category_threshold)
+
+    model = rvt2doc.compute_storage_large_disks(sheets_dict)
+
+    assert [row[:2] + row[4:] for row in large_disks_loop(sheets_dict)[1:]] == \
+           [["/data", f"{5859:n}", 2], ["/data", f"{4882:n}", 1], ["/logs", f"{4882:n}", 1], ["/data", f"{4882:n}", 1]]
+    assert model["disks"] == [
+        ["Disk", "GiB", "VMs", "Annotations", "Cnt"],
+        ["/data", f"{5859:n}", "vm5 vm4 ", "archive server", 2],
+        ["/logs", f"{4882:n}", "vm2 ", "log collector", 1],
+        ["/data", f"{4882:n}", "vm3 vm1 ", "database server", 2],
+    ]
+
+
+def test_large_disks_annotations_stay_in_their_group(registry):
+    # the loop showed "database server" for /logs too
+    sheets_dict = registry({"vPartition": partitions([
+        ("vm1", "/data", 5000000, "database server"),
+        ("vm2", "/logs", 4500000, "logs"),
+        ("vm3", "/logs", 4500000, np.nan),
+    ])})
+
+    model = rvt2doc.compute_storage_large_disks(sheets_dict)
+
+    assert large_disks_loop(sheets_dict)[2][3] == "database server"
+    assert model["disks"][1:] == [["/data", f"{4882:n}", "vm1 ", "database server", 1],
+                                  ["/logs", f"{4394:n}", "vm2 vm3 ", "", 2]]
+
+
+def test_large_disks_none(registry):
+    sheets_dict = registry({"vPartition": partitions([("vm1", "/", 1024, "small")])})
+
+    assert rvt2doc.compute_storage_large_disks(sheets_dict)["disks"] is None
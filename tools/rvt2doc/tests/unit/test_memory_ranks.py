@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rvt2doc
+
+
+def memory_ranks_loop(df, name_column, memory_column):
+    """
+    The iterrows loop memory_ranks replaced
+    """
+    df = df.sort_values(by=[memory_column], ascending=False)
+    ranks = []
+    pre_name = ''
+    pre_memory = ''
+    count = 0
+    for index, row in df.iterrows():
+        memory = f'{int(int(row[memory_column]) / 1024):n}'
+        if pre_memory != memory:
+            if pre_memory != '': ranks.append([pre_name, pre_memory, count])
+            pre_name = ''
+            count = 1
+        else:
+            count += 1
+        pre_memory = memory
+        pre_name = str(row[name_column]) if pre_name == '' else pre_name + ", " + str(row[name_column])
+    ranks.append([pre_name, pre_memory, count])
+    return ranks
+
+
+cases = {
+    "ties": [("vm1", 4096), ("vm2", 8192), ("vm3", 4096), ("vm4", 2048), ("vm5", 8192), ("vm6", 4096)],
+    "gib_edges": [("vm1", 1023), ("vm2", 1024), ("vm3", 2047.5), ("vm4", 2048), ("vm5", 1), ("vm6", 0)],
+    "fractions": [("vm1", 1536.75), ("vm2", 1024.25), ("vm3", 3071.9), ("vm4", 2048.1)],
+    "large": [("esx" + str(i), (i % 7 + 1) * 262144 + i) for i in range(50)],
+    "duplicated_names": [("vm1", 2048), ("vm1", 2048), ("vm2", 1024)],
+    "single": [("vm1", 16384)],
+    "empty": [],
+}
+
+
+@pytest.mark.parametrize("names", ["object", "category"])
+@pytest.mark.parametrize("case", list(cases.keys()))
+def test_memory_ranks_matches_loop(case, names):
+    df = pd.DataFrame(cases[case], columns=["VM", "Memory"]).astype({"VM": names, "Memory": float})
+
+    assert rvt2doc.memory_ranks(df, "VM", "Memory") == memory_ranks_loop(df, "VM", "Memory")
+
+
+def test_memory_ranks_skips_empty_memory():
+    # the loop failed on them (int(nan))
+    df = pd.DataFrame({"VM": ["vm1", "vm2", "vm3", "vm4"], "Memory": [2048, np.nan, 4096, 2048.5]})
+
+    assert rvt2doc.memory_ranks(df, "VM", "Memory") == [["vm3", "4", 1], ["vm4, vm1", "2", 2]]
+    assert rvt2doc.memory_ranks(df.iloc[[1]], "VM", "Memory") == [["", "", 0]]
+
+
+def test_compute_memory_ranks(registry):
+    sheets_dict = registry({
+        "vInfo": pd.DataFrame({"VM": ["vm1", "vm2", "vm3", "vm4"], "Memory": [4096, 1024, 4096, 512],
+                               "CPUs": [2, 1, 2, 1]}),
+        "vHost": pd.DataFrame({"Host": ["esx1", "esx2", "esx3"], "N_Memory": [524288, 1048576, 524288]}),
+    })
+
+    model = rvt2doc.compute_memory_ranks(sheets_dict)
+
+    assert model["vms"] == [["VMs", "GiB", "Cnt"], ["vm1, vm3", "4", 2], ["vm2", "1", 1], ["vm4", "0", 1]]
+    assert model["hosts"] == [["Hosts", "GiB", "Cnt"], ["esx2", f"{1024:n}", 1], ["esx1, esx3", "512", 2]]
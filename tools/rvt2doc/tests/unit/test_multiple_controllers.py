@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import rvt2doc
+
+
+def multiple_controllers_loop(sheets_dict):
+    """
+    The query and iterrows loop compute_storage_multiple_controllers replaced
+    """
+    vms = rvt2doc.get_rows(sheets_dict, sheet='vDisk', key_columns=["VM", "Controller"], columns=["VM", "Controller"])
+    vms = rvt2doc.groupby_df(vms, columns=["VM", "Controller"], trunk=True)
+    vms = vms.query("Count > 1")
+    if len(vms) == 0: return None
+
+    details = []
+    for index, row in vms.iterrows():
+        disks = rvt2doc.get_rows(sheets_dict, sheet='vDisk', columns=["VM", "Controller"],
+                                 query_expr="VM == '" + row["VM"] + "'")
+        controllers = {}
+        for index2, row2 in disks.iterrows():
+            controllers[row2.Controller] = controllers.get(row2.Controller, 0) + 1
+        details.append(str(len(disks)) + ": " + str(controllers))
+    vms = vms.drop('Count', axis=1)
+    vms.insert(1, "Details", details, True)
+    return vms
+
+
+cases = {
+    "mixed": [
+        ("vm2", "SCSI controller 0"), ("vm1", "SCSI controller 0"), ("vm2", "NVME controller 0"),
+        ("vm1", "SCSI controller 0"), ("vm3", "IDE 0"), ("vm2", "SCSI controller 0"), ("vm1", "SATA controller 0"),
+        ("vm4", "SCSI controller 0"), ("vm4", "SCSI controller 1"), ("vm4", "SCSI controller 0"),
+    ],
+    "empty_controllers": [  # empty cells are NaN, as read_excel loads them
+        ("vm1", "SCSI controller 0"), ("vm1", np.nan), ("vm1", "SCSI controller 1"), ("vm2", np.nan),
+        ("vm2", "SCSI controller 0"), ("vm3", np.nan), ("vm3", np.nan),
+    ],
+    "single_controllers": [("vm1", "SCSI controller 0"), ("vm1", "SCSI controller 0"), ("vm2", "IDE 0")],
+}
+
+
+@pytest.fixture(params=[0.5, 0], ids=["categorical", "plain"])
+def category_threshold(request):
+    return request.param
+
+
+@pytest.mark.parametrize("case", list(cases.keys()))
+def test_multiple_controllers_matches_loop(registry, category_threshold, case):
+    sheets_dict = registry({"vDisk": pd.DataFrame(cases[case], columns=["VM", "Controller"])},
+                           category_threshold=category_threshold)
+
+    expected = multiple_controllers_loop(sheets_dict)
+    actual = rvt2doc.compute_storage_multiple_controllers(sheets_dict)
+
+    if expected is None:
+        assert actual is None
+    else:
+        assert_frame_equal(actual, expected.reset_index(drop=True), check_dtype=False, check_categorical=False)
+
+
+def test_multiple_controllers(registry, category_threshold):
+    sheets_dict = registry({"vDisk": pd.DataFrame(cases["mixed"], columns=["VM", "Controller"])},
+                           category_threshold=category_threshold)
+
+    model = rvt2doc.compute_storage_multiple_controllers(sheets_dict)
+
+    assert model["VM"].tolist() == ["vm1", "vm2", "vm4"]
+    assert model["Details"].tolist() == [
+        "3: {'SCSI controller 0': 2, 'SATA controller 0': 1}",
+        "3: {'SCSI controller 0': 2, 'NVME controller 0': 1}",
+        "3: {'SCSI controller 0': 2, 'SCSI controller 1': 1}",
+    ]
+
+
+def test_multiple_controllers_quoted_names(registry):
+    # the loop query failed on them
+    sheets_dict = registry({"vDisk": pd.DataFrame({
+        "VM": ["O'Brien's vm", "O'Brien's vm", 'vm "quoted"', 'vm "quoted"', "vm3"],
+        "Controller": ["SCSI controller 0", "SCSI controller 1", "IDE 0", "IDE 1", "IDE 0"],
+        "Capacity_MiB": [1024, 2048, np.nan, 512, 256],
+    })})
+
+    model = rvt2doc.compute_storage_multiple_controllers(sheets_dict)
+
+    assert model.to_dict("list") == {
+        "VM": ["O'Brien's vm", 'vm "quoted"'],
+        "Details": ["2: {'SCSI controller 0': 1, 'SCSI controller 1': 1}", "2: {'IDE 0': 1, 'IDE 1': 1}"],
+    }
+
+
+def test_multiple_controllers_none(registry):
+    sheets_dict = registry({"vDisk": pd.DataFrame(cases["single_controllers"], columns=["VM", "Controller"])})
+
+    assert rvt2doc.compute_storage_multiple_controllers(sheets_dict) is None
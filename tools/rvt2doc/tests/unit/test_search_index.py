@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import rvt2doc
+
+values = [
+    "sap", "SAP", "sap01", "01sap", "vm_sap_01", "sap-hana", "hana_db", "my sap server", "nosapnow", "sapsap",
+    "JBoss EAP", "jbossas", "myjboss", "JBOSS_7", "jboss.example.com",
+    "Café", "café au lait", "cafe", "naïve", "Straße", "STRASSE", "İstanbul", "istanbul", "ıstanbul", "ſap",
+    "Kelvin K", "k8s", "K", "épée", "ÉPÉE", "Ångström", "data_ångström",
+    "", None, "VDI horizon", "horizon7", "µservice", "µs", "v́m", "tést",
+]
+
+expressions = [
+    "sap", "\\bsap", "sap\\b", "\\bsap\\b", "sap01", "_sap_", "01", "\\b01\\b", "jboss|hana", "\\bjboss|hana\\b",
+    "caf", "caf\\b", "\\bcaf\\b", "\\bcafe\\b", "e\\b", "ss", "strasse", "i", "\\bi", "\\bistanbul\\b", "s",
+    "k\\b", "\\bk\\b", "k8s", "p\\b", "\\bep", "ngstr", "\\bvdi\\b|\\bhorizon\\b", "v", "\\bv\\b", "m\\b", "t",
+    "s\\b", "\\bs",
+]
+
+
+@pytest.fixture
+def sheets_dict(registry):
+    rows = len(values)
+    return registry({
+        "vInfo": pd.DataFrame({"VM": ["vm" + str(i) for i in range(rows)], "Annotation": values}),
+        "vNetwork": pd.DataFrame({"Network": list(reversed(values)), "VM": values}),
+    })
+
+
+def test_search_index_query_parses_words_only():
+    assert rvt2doc.search_index_query("\\bsap\\b|hana") == [("sap", True, True), ("hana", False, False)]
+    assert rvt2doc.search_index_query("big-iq|f5.com") is None
+    assert rvt2doc.search_index_query("(?=.*sap)(?=.*hana)") is None
+    assert rvt2doc.search_index_query("café") is None
+
+
+@pytest.mark.parametrize("expression", expressions)
+def test_global_search_with_index_matches_regex(sheets_dict, expression):
+    terms = {"term": expression, "other": "hana|\\bk8s"}
+    expected = rvt2doc.global_search(sheets_dict, terms, ["vInfo", "vNetwork"])
+    rvt2doc.build_search_index(sheets_dict, ["vInfo", "vNetwork"])
+
+    assert rvt2doc.global_search(sheets_dict, terms, ["vInfo", "vNetwork"]) == expected
+
+
+@pytest.mark.parametrize("expression", expressions)
+def test_get_rows_with_index_matches_regex(sheets_dict, expression):
+    expected = rvt2doc.get_rows(sheets_dict, "vInfo", contains_column="Annotation", contains_expr=expression,
+                                contains_case=False)
+    rvt2doc.build_search_index(sheets_dict, ["vInfo"])
+    rvt2doc.memo_cache.clear()  # get_rows results are memoized
+    actual = rvt2doc.get_rows(sheets_dict, "vInfo", contains_column="Annotation", contains_expr=expression,
+                              contains_case=False)
+
+    assert_frame_equal(actual, expected)
+    assert rvt2doc.count_rows(sheets_dict, "vInfo", contains_column="Annotation", contains_expr=expression,
+                              contains_case=False) == len(expected)
+
+
+def test_search_index_is_ignored_when_the_sheet_changes(sheets_dict):
+    rvt2doc.build_search_index(sheets_dict, ["vInfo"])
+    vinfo = rvt2doc.combine_data_sheets(sheets_dict, "vInfo")
+    rvt2doc.add_categories(vinfo, "Annotation", ["sap changed"])
+    vinfo.loc[0, "Annotation"] = "sap changed"
+    rvt2doc.invalidate_sheets(["vInfo"])
+
+    assert rvt2doc.column_search_index("vInfo", "Annotation") is None
+    rows = rvt2doc.get_rows(sheets_dict, "vInfo", contains_column="Annotation", contains_expr="\\bchanged\\b",
+                            contains_case=False)
+    assert rows["VM"].tolist() == ["vm0"]
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+import rvt2doc
+
+
+def compute_clusters(sheets_dict):
+    return rvt2doc.groupby(sheets_dict, "vHost", ["Cluster", "Host"])["Count"].tolist()
+
+
+def compute_hosts(sheets_dict):
+    return rvt2doc.count_rows(sheets_dict, "vHost", key_columns="Host", query_expr="N_Cores > 8")
+
+
+@pytest.fixture
+def sheets_dict(registry, monkeypatch):
+    monkeypatch.setattr(rvt2doc, "report_sections", {"clusters": compute_clusters, "hosts": compute_hosts,
+                                                     "clusters_again": compute_clusters})
+    monkeypatch.setattr(rvt2doc, "memo_stats", {"hits": 0, "misses": 0})
+    return registry({"vHost": pd.DataFrame({"Cluster": ["CL-A", "CL-A", "CL-B"], "Host": ["esx1", "esx2", "esx3"],
+                                            "N_Cores": [8, 16, 32]})})
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_compute_report_sections_counts_memoized_results(sheets_dict, jobs):
+    models = rvt2doc.compute_report_sections(sheets_dict, jobs)
+
+    assert models == {"clusters": [2, 1], "hosts": 2, "clusters_again": [2, 1]}
+    # each section calls a memoized helper once, the sections in forked processes don't share results
+    assert rvt2doc.memo_stats["hits"] + rvt2doc.memo_stats["misses"] == 3
+    if jobs == 1: assert rvt2doc.memo_stats == {"hits": 1, "misses": 2}
+
+
+def test_compute_report_sections_profiles_sections(sheets_dict, monkeypatch):
+    monkeypatch.setattr(rvt2doc, "profile_sections", [])
+    monkeypatch.setattr(rvt2doc, "profile_calls", [])
+    monkeypatch.setitem(rvt2doc.profile_state, "on", True)
+
+    rvt2doc.compute_report_sections(sheets_dict, 3)
+
+    assert [section["name"] for section in rvt2doc.profile_sections] == \
+           ["compute clusters", "compute hosts", "compute clusters_again"]
+    assert rvt2doc.memo_stats["misses"] > 0
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import rvt2doc
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def engine(request):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    return request.param
+
+
+@pytest.fixture(params=[0.5, 0], ids=["categorical", "plain"])
+def sheets_dict(request, registry):
+    # Ties on purpose: values with the same count appear first in a different order than sorted
+    vhost = pd.DataFrame({
+        "Datacenter": ["DC2", "DC1", "DC2", "DC1", None, "DC2", "DC1", "DC2", "DC1", "DC2", "DC1", "DC2"],
+        "Cluster": ["CL-B", "CL-A", "CL-B", None, "CL-C", "CL-A", "CL-C", "CL-B", "CL-A", None, "CL-C", "CL-A"],
+        "Host": ["esx" + str(i) for i in range(12)],
+        "N_Cores": [16, 32, 16, 8, 8, 32, 64, 16, 32, 8, 64, 16],
+        "N_CPU": [2, 2, 2, 1, 1, 2, 4, 2, 2, 1, 4, 2],
+        "CPU_Model": ["Xeon Gold", "EPYC", "Xeon Gold", "EPYC", None, "Xeon Silver", "EPYC", "Xeon Silver",
+                      "Xeon Gold", None, "Xeon Silver", "EPYC"],
+        "Memory_GiB": [256.5, 512.0, np.nan, 128.25, 64.0, 512.0, 1024.0, 256.5, np.nan, 64.0, 1024.0, 256.0],
+        "HT_Active": [True, False, True, True, False, True, True, False, True, True, False, True],
+    })
+    # a row without data is not counted by count_rows
+    vhost.loc[len(vhost)] = [None, None, None, np.nan, np.nan, None, np.nan, None]
+    vhost["N_Cores"] = vhost["N_Cores"].astype("Int64").astype(float)
+    return registry({"vHost": vhost}, category_threshold=request.param)
+
+
+def compare(engine, sheets, compute):
+    """
+    compute() result with pandas and with the SQL engine
+    """
+    rvt2doc.sql_database["engine"] = None
+    expected = compute()
+    rvt2doc.sql_open(engine)
+    rvt2doc.invalidate_sheets(sheets)  # memoized pandas results are not returned again
+    actual = compute()
+    return actual, expected
+
+
+def assert_same_percentages(actual, expected):
+    assert [(value, count) for value, count, percentage in actual] == \
+           [(value, count) for value, count, percentage in expected]
+    assert [type(value) for value, count, percentage in actual] == \
+           [type(value) for value, count, percentage in expected]
+    assert [percentage for value, count, percentage in actual] == \
+           pytest.approx([percentage for value, count, percentage in expected])
+
+
+@pytest.mark.parametrize("columns", ["Cluster", "CPU_Model", "N_CPU", "HT_Active",
+                                     ["Datacenter", "Cluster"], ["Cluster", "CPU_Model"], ["CPU_Model", "N_CPU"]])
+@pytest.mark.parametrize("ascending", [False, True, None])
+def test_sql_value_counts_matches_calculate_percentage(engine, sheets_dict, columns, ascending):
+    actual, expected = compare(engine, ["vHost"], lambda: rvt2doc.calculate_percentage(
+        sheets_dict, "vHost", columns, ascending=ascending))
+
+    assert_same_percentages(actual, expected)
+
+
+@pytest.mark.parametrize("columns,sum", [
+    (["Cluster", "Host"], False),
+    (["Datacenter", "Cluster", "Host"], False),
+    (["Cluster", "CPU_Model"], False),
+    (["Cluster", "N_Cores"], True),
+    (["Datacenter", "N_CPU"], True),
+    (["Cluster", "Memory_GiB"], True),
+    (["CPU_Model", "HT_Active"], True),
+])
+@pytest.mark.parametrize("ascending", [None, False, True])
+def test_sql_groupby_matches_groupby(engine, sheets_dict, columns, sum, ascending):
+    actual, expected = compare(engine, ["vHost"], lambda: rvt2doc.groupby(
+        sheets_dict, "vHost", columns, trunk=True, ascending=ascending, sum=sum))
+
+    assert_frame_equal(actual, expected)
+
+
+def test_sql_count_rows_matches_count_rows(engine, sheets_dict):
+    actual, expected = compare(engine, ["vHost"], lambda: rvt2doc.count_rows(sheets_dict, "vHost"))
+
+    assert actual == expected == 12
+
+
+@pytest.mark.parametrize("column", ["N_Cores", "N_CPU", "Memory_GiB", "HT_Active"])
+def test_sql_sum_matches_sum_rows(engine, sheets_dict, column):
+    actual, expected = compare(engine, ["vHost"], lambda: rvt2doc.sum_rows(sheets_dict, "vHost", column))
+
+    assert actual == expected
+    assert float(actual).is_integer() == float(expected).is_integer()
+
+
+def test_sql_table_widens_and_reloads(engine, sheets_dict):
+    rvt2doc.sql_open(engine)
+    grouped = rvt2doc.groupby(sheets_dict, "vHost", ["Cluster", "Host"])
+    percentages = rvt2doc.calculate_percentage(sheets_dict, "vHost", "CPU_Model")
+    total = rvt2doc.sum_rows(sheets_dict, "vHost", "N_Cores")
+    version, loaded = rvt2doc.sql_connection()["tables"]["vHost"]
+    if engine == "sqlite":
+        assert loaded == ["Cluster", "Host", "CPU_Model", "N_Cores"]  # only the columns read, widened
+    else:
+        assert "Memory_GiB" in loaded  # DuckDB reads the sheet in place
+
+    # a changed sheet is loaded again
+    vhost = rvt2doc.combine_data_sheets(sheets_dict, "vHost")
+    vhost["N_Cores"] = vhost["N_Cores"] * 2
+    rvt2doc.invalidate_sheets(["vHost"])
+    assert rvt2doc.sum_rows(sheets_dict, "vHost", "N_Cores") == total * 2
+    assert rvt2doc.sql_connection()["tables"]["vHost"][0] != version
+
+    rvt2doc.sql_database["engine"] = None
+    rvt2doc.invalidate_sheets(["vHost"])
+    assert_frame_equal(grouped, rvt2doc.groupby(sheets_dict, "vHost", ["Cluster", "Host"]))
+    assert_same_percentages(percentages, rvt2doc.calculate_percentage(sheets_dict, "vHost", "CPU_Model"))
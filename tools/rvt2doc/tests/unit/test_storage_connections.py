@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import rvt2doc
+
+
+def storage_connections_loop(sheets_dict):
+    """
+    The per host loop compute_storage_connections replaced, with its intentional differences: hosts match
+    the datastore Hosts names exactly (not as a substring) and the last Datacenter/Cluster row is kept
+    """
+    hosts = rvt2doc.get_rows(sheets_dict, sheet='vHost', key_columns=["Datacenter", "Cluster", "Host"],
+                             columns=["Datacenter", "Cluster", "Host"]).sort_values(by=["Datacenter", "Cluster"])
+    datastores = rvt2doc.combine_data_sheets(sheets_dict, "vDatastore")
+    datastore_hosts = datastores["Hosts"].astype(object).fillna("").map(
+        lambda value: [name.strip() for name in value.split(",")])
+
+    matrix = []
+    totals = [0, 0, 0]
+    for (dc, cl), group in hosts.groupby(["Datacenter", "Cluster"], sort=False, observed=True):
+        counts = [0, 0, 0]
+        for host in group["Host"]:
+            for index in datastore_hosts[datastore_hosts.map(lambda names: host in names)].index:
+                dstype = str(datastores.loc[index, "Type"]).upper()
+                for i, t in enumerate(["NFS", "VMFS", "VSAN"]):
+                    if dstype == t: counts[i] += 1
+        matrix.append([dc, cl] + counts)
+        totals = [total + count for total, count in zip(totals, counts)]
+    matrix.append(["", ""] + totals)
+    return pd.DataFrame(matrix, columns=["Datacenter", "Cluster", "NFS", "VMFS", "VSAN"])
+
+
+@pytest.fixture(params=[0.5, 0], ids=["categorical", "plain"])
+def sheets_dict(request, registry):
+    vhost = pd.DataFrame({
+        "Datacenter": ["DC1", "DC1", "DC1", "DC2", "DC2", "DC1", "DC2"],
+        "Cluster": ["CL-A", "CL-A", "CL-B", "CL-C", "CL-C", "CL-B", "CL-D"],
+        "Host": ["esx1", "esx10", "esx2", "esx3.example.com", "esx3", "esx20", "esx4"],
+    })
+    vdatastore = pd.DataFrame({
+        "Name": ["ds1", "ds2", "ds3", "ds4", "ds5", "ds6", "ds7"],
+        "Type": ["VMFS", "nfs", "vsan", "VMFS", "NFS", "VMFS", "vvol"],
+        "Hosts": ["esx1, esx10", "esx10", "esx2,esx20", "esx3.example.com", "esx3, esx4", np.nan, "esx4"],
+    })
+    return registry({"vHost": vhost, "vDatastore": vdatastore}, category_threshold=request.param)
+
+
+def test_storage_connections_matches_loop(sheets_dict):
+    assert_frame_equal(rvt2doc.compute_storage_connections(sheets_dict), storage_connections_loop(sheets_dict),
+                       check_dtype=False)
+
+
+def test_storage_connections(sheets_dict):
+    model = rvt2doc.compute_storage_connections(sheets_dict)
+
+    assert model.values.tolist() == [
+        ["DC1", "CL-A", 1, 2, 0],  # esx1 is not counted again for the esx10 datastores
+        ["DC1", "CL-B", 0, 0, 2],
+        ["DC2", "CL-C", 1, 1, 0],  # esx3 is not counted for the esx3.example.com datastore
+        ["DC2", "CL-D", 1, 0, 0],  # last cluster row, the loop left it out
+        ["", "", 3, 3, 2],
+    ]
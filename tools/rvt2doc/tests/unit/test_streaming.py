@@ -0,0 +1,167 @@
+import datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from rvt2doc import read_sheet_streaming
+
+
+def write_sheet(path, rows):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.title = "vTest"
+    for r, row in enumerate(rows, start=1):
+        for c, value in enumerate(row, start=1):
+            if value is not None:
+                sheet.cell(row=r, column=c, value=value)
+    book.save(path)
+
+
+def read_streaming(path, usecols, chunk_rows):
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        return read_sheet_streaming(book["vTest"], usecols, chunk_rows)
+    finally:
+        book.close()
+
+
+def read_excel(path, usecols):
+    # same call load_spreadsheet makes with --projection
+    with pd.ExcelFile(path, engine="openpyxl") as xl:
+        return xl.parse("vTest", usecols=None if usecols is None else lambda c: c in usecols)
+
+
+sheets = {
+    "types": [
+        ["VM", "CPUs", "Memory", "Powered", "Created"],
+        ["vm1", 2, 4096.5, True, datetime.datetime(2024, 1, 2, 3, 4, 5)],
+        ["vm2", 4, 8192.0, False, datetime.datetime(2024, 2, 3, 4, 5, 6)],
+        ["vm3", 8, 1024.25, True, datetime.datetime(2024, 3, 4, 5, 6, 7)],
+    ],
+    "integral_floats": [
+        ["VM", "Capacity MiB", "Ratio"],
+        ["vm1", 1024.0, 0.5],
+        ["vm2", 2048.0, 1.0],
+        ["vm3", 4096.0, 2.0],
+    ],
+    "blank_rows": [
+        ["VM", "Host", "CPUs"],
+        ["vm1", "esx1", 1],
+        [None, None, None],
+        [None, None, None],
+        ["vm2", "esx2", 2],
+        [None, None, None],
+        ["vm3", None, 3],
+    ],
+    "trailing_blank_rows": [
+        ["VM", "Host", "CPUs"],
+        ["vm1", "esx1", 1],
+        ["vm2", "esx2", 2],
+        [None, None, None],
+        [None, None, None],
+    ],
+    "empty_cells": [
+        ["VM", "Host", "CPUs", "Annotation"],
+        ["vm1", None, 1, None],
+        ["vm2", "esx2", None, None],
+        ["vm3", "esx3", 3, None],
+        [None, "esx4", 4, None],
+    ],
+    "duplicated_headers": [
+        ["VM", "Host", "VM", "Host", "VM"],
+        ["vm1", "esx1", "a", "b", "c"],
+        ["vm2", "esx2", "d", "e", "f"],
+    ],
+    "clashing_headers": [
+        ["VM", "VM.1", "VM", "Host"],
+        ["vm1", "a", "b", "esx1"],
+        ["vm2", "c", "d", "esx2"],
+    ],
+    "missing_headers": [
+        ["VM", None, "CPUs", None, "Host"],
+        ["vm1", "x", 1, "y", "esx1"],
+        ["vm2", "z", 2, None, "esx2"],
+    ],
+    "trailing_missing_headers": [
+        ["VM", "Host", None, None],
+        ["vm1", "esx1", None, None],
+        ["vm2", "esx2", None, None],
+    ],
+    "wider_rows": [
+        ["VM", "Host"],
+        ["vm1", "esx1"],
+        ["vm2", "esx2", "extra"],
+        ["vm3", "esx3", "more", 4],
+        ["vm4", "esx4"],
+    ],
+    "error_codes": [
+        ["VM", "CPUs", "Ratio"],
+        ["vm1", 1, "#N/A"],
+        ["vm2", "#VALUE!", 0.5],
+        ["vm3", 3, "#DIV/0!"],
+    ],
+    "numeric_text": [
+        ["VM", "Code", "Version"],
+        ["vm1", "007", "6.7"],
+        ["vm2", "010", "7.0"],
+    ],
+    "empty_chunk": [
+        ["VM", "Annotation", "CPUs"],
+        ["vm1", None, 1],
+        ["vm2", None, 2],
+        ["vm3", None, 3],
+        ["vm4", "note", 4],
+        ["vm5", None, 5],
+    ],
+    "header_only": [
+        ["VM", "Host", "CPUs"],
+    ],
+}
+
+usecols = {
+    "types": ["VM", "Memory", "Created"],
+    "integral_floats": ["Capacity MiB"],
+    "blank_rows": ["VM", "CPUs"],
+    "trailing_blank_rows": ["Host"],
+    "empty_cells": ["Host", "Annotation"],
+    "duplicated_headers": ["Host", "VM.2"],
+    "clashing_headers": ["VM.1", "VM.1.1"],
+    "missing_headers": ["VM", "Host"],
+    "trailing_missing_headers": ["VM"],
+    "wider_rows": ["Host"],
+    "error_codes": ["CPUs", "Ratio"],
+    "numeric_text": ["Code"],
+    "empty_chunk": ["VM", "Annotation"],
+    "header_only": ["VM", "CPUs"],
+}
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 20000])
+@pytest.mark.parametrize("projected", [False, True], ids=["all_columns", "usecols"])
+@pytest.mark.parametrize("case", list(sheets.keys()))
+def test_read_sheet_streaming_matches_read_excel(tmp_path, case, projected, chunk_rows):
+    path = tmp_path / (case + ".xlsx")
+    write_sheet(path, sheets[case])
+    columns = usecols[case] if projected else None
+
+    assert_frame_equal(read_streaming(path, columns, chunk_rows), read_excel(path, columns))
+
+
+def test_read_sheet_streaming_empty_sheet(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    write_sheet(path, [])
+
+    assert read_streaming(path, None, 2).empty
+    assert read_excel(path, None).empty
+
+
+def test_read_sheet_streaming_many_chunks(tmp_path):
+    path = tmp_path / "many.xlsx"
+    rows = [["VM", "CPUs", "Memory", "Annotation"]]
+    rows += [["vm" + str(i), i % 7, float(i * 512), None if i % 5 else "note " + str(i)] for i in range(1, 101)]
+    write_sheet(path, rows)
+
+    for chunk_rows in [3, 10, 33]:
+        assert_frame_equal(read_streaming(path, None, chunk_rows), read_excel(path, None))